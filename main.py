@@ -1,5 +1,7 @@
+import argparse
 import asyncio
 import logging
+import multiprocessing
 import os
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
@@ -11,7 +13,17 @@ from aiohttp import web
 # Переименовываем импорт настроек, чтобы не конфликтовал с роутером
 from src.config import settings as app_settings  # <-- Переименован
 from src.redis_db import init_redis, close_redis
+from src.fsm_storage import RedisFSMStorage
+from src.webhook_workers import UpdateRouter, StreamWorker
+from src.webhook_queue import QueuedUpdateHandler
 from src.handlers import start, games, profile, bonus, admin, settings, buy, admin_panel, rating  # <-- Добавлен rating
+from src.middlewares import user_context_middleware, user_lock_middleware, TelegramRateLimiter
+from src.services.rating_service import CreditService, rating_aggregator
+from src.services.timer_wheel import timer_service
+from src.services.crash_chain_service import crash_chain_service
+from src.services.verification_service import verification_service
+from src.services.user_lock import default_lock_backend, user_lock_registry
+from src.services.user_cache import user_cache
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,17 +35,32 @@ logger = logging.getLogger(__name__)
 
 async def create_bot():
     """Создать экземпляр бота"""
-    return Bot(
+    bot = Bot(
         token=app_settings.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    # Лимиты Telegram на исходящие запросы; общий лимит делится между процессами
+    bot.session.middleware(
+        TelegramRateLimiter(global_rate=30.0 / max(app_settings.WEBHOOK_WORKERS, 1))
+    )
+    return bot
 
 
 async def create_dispatcher():
     """Создать диспетчер"""
-    storage = MemoryStorage()
+    # Состояние игр в Redis: переживает рестарт и общее для всех воркеров
+    if app_settings.FSM_STORAGE == 'memory':
+        storage = MemoryStorage()
+    else:
+        storage = RedisFSMStorage(state_ttl=app_settings.FSM_STATE_TTL)
     dp = Dispatcher(storage=storage)
     
+    # Пользователь, баланс и статус блокировки загружаются один раз на апдейт
+    dp.update.outer_middleware(user_context_middleware)
+    # Операции с кошельком одного пользователя - по очереди (хендлеры с флагом wallet_lock)
+    dp.message.middleware(user_lock_middleware)
+    dp.callback_query.middleware(user_lock_middleware)
+    
     # Регистрация роутеров
     dp.include_router(start.router)
     dp.include_router(admin_panel.router)
@@ -61,12 +88,24 @@ async def polling_main():
         logger.error(f"❌ Redis initialization failed: {e}")
         return
     
+    rating_aggregator.start()
+    await timer_service.start(bot)
+    await crash_chain_service.start()
+    # Кредиты без таймера (выданы до его появления)
+    await CreditService.check_overdue_credits()
+    
     # Запуск бота
     try:
         logger.info("🎰 LuckyStar Casino запущен в режиме polling")
         logger.info(f"Bot username: @{(await bot.get_me()).username}")
         await dp.start_polling(bot)
     finally:
+        # Несработавшие таймеры (показ результатов, таймауты игр) остаются в Redis
+        await timer_service.stop()
+        await crash_chain_service.stop()
+        verification_service.stop()
+        # Сбрасываем накопленные рейтинги до закрытия соединений
+        await rating_aggregator.stop()
         await close_redis()
         await bot.session.close()
 
@@ -91,13 +130,29 @@ async def webhook_main():
     
     # Создание aiohttp приложения
     app = web.Application()
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-    )
+    if app_settings.WEBHOOK_INGESTION == 'inline':
+        webhook_requests_handler = SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+        )
+    else:
+        # Telegram получает ответ сразу, апдейты разбирает пул из очереди
+        webhook_requests_handler = QueuedUpdateHandler(
+            dispatcher=dp,
+            bot=bot,
+            max_queue_size=app_settings.WEBHOOK_QUEUE_SIZE,
+            workers=app_settings.WEBHOOK_QUEUE_WORKERS,
+        )
+        logger.info(f"📊 Queue metrics: {app_settings.WEBHOOK_PATH}/metrics")
     webhook_requests_handler.register(app, path=app_settings.WEBHOOK_PATH)
     setup_application(app, dp, bot=bot)
     
+    rating_aggregator.start()
+    await timer_service.start(bot)
+    await crash_chain_service.start()
+    # Кредиты без таймера (выданы до его появления)
+    await CreditService.check_overdue_credits()
+    
     # Запуск сервера
     port = app_settings.PORT
     logger.info(f"🎰 LuckyStar Casino запущен на порту {port}")
@@ -106,10 +161,129 @@ async def webhook_main():
     return app
 
 
-async def main():
+async def worker_main(index: int):
+    """Воркер многопроцессного webhook: обрабатывает свою часть апдейтов"""
+    bot = await create_bot()
+    dp = await create_dispatcher()
+    
+    await init_redis()
+    # Кэш пользователей у каждого воркера свой - сбросы рассылаются через Redis
+    user_cache.start()
+    rating_aggregator.start()
+    await timer_service.start(bot)
+    await crash_chain_service.start()
+    # Кредиты без таймера (выданы до его появления)
+    await CreditService.check_overdue_credits()
+    
+    worker = StreamWorker(dp, bot, index)
+    try:
+        await worker.run()
+    finally:
+        await worker.stop()
+        await user_cache.stop()
+        await timer_service.stop()
+        await crash_chain_service.stop()
+        verification_service.stop()
+        await rating_aggregator.stop()
+        await close_redis()
+        await bot.session.close()
+
+
+def run_worker(index: int):
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(worker_main(index))
+    except KeyboardInterrupt:
+        pass
+
+
+async def multiworker_webhook_main(workers: int):
+    """
+    Webhook с несколькими процессами: этот процесс только принимает апдейты
+    и раскладывает их по stream'ам воркеров (по from_user.id, в группах - по чату)
+    """
+    bot = await create_bot()
+    
+    try:
+        await init_redis()
+        logger.info("✅ Redis initialized successfully")
+    except Exception as e:
+        logger.error(f"❌ Redis initialization failed: {e}")
+        return
+    
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(index,), name=f"worker-{index}", daemon=True)
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"✅ Started {workers} update workers")
+    
+    webhook_url = f"{app_settings.WEBHOOK_URL}{app_settings.WEBHOOK_PATH}"
+    await bot.set_webhook(webhook_url)
+    logger.info(f"✅ Webhook set to: {webhook_url}")
+    
+    app = web.Application()
+    router = UpdateRouter(workers)
+    router.register(app, path=app_settings.WEBHOOK_PATH)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', app_settings.PORT)
+    await site.start()
+    logger.info(f"🎰 LuckyStar Casino запущен на порту {app_settings.PORT} ({workers} воркеров)")
+    logger.info(f"📊 Queue metrics: {app_settings.WEBHOOK_PATH}/metrics")
+    
+    try:
+        await asyncio.Future()  # Бесконечный цикл
+    finally:
+        await runner.cleanup()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+        await close_redis()
+        await bot.session.close()
+
+
+def parse_args():
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="LuckyStar Casino bot")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=app_settings.WEBHOOK_WORKERS,
+        help="Количество процессов-обработчиков в режиме webhook (по умолчанию WEBHOOK_WORKERS)"
+    )
+    return parser.parse_args()
+
+
+def apply_worker_count(workers: int) -> None:
+    """
+    Число процессов, которое реально запускается (--workers), - вместо
+    WEBHOOK_WORKERS из окружения: от него зависят бэкенд блокировок
+    кошелька и доля общего лимита Telegram. Воркеры стартуют через spawn
+    и читают настройки заново, поэтому значение попадает и в окружение.
+    """
+    os.environ['WEBHOOK_WORKERS'] = str(workers)
+    app_settings.WEBHOOK_WORKERS = workers
+    user_lock_registry.set_backend(default_lock_backend())
+
+
+async def main(workers: int = 1):
     """Главная функция запуска бота"""
+    # Несколько процессов бывает только в webhook режиме
+    apply_worker_count(workers if app_settings.WEBHOOK_URL else 1)
+    if app_settings.WEBHOOK_URL and workers > 1:
+        # Продакшен режим с webhook на нескольких ядрах
+        await multiworker_webhook_main(workers)
     # Проверяем, запускаем ли мы в продакшене (Render)
-    if app_settings.WEBHOOK_URL:
+    elif app_settings.WEBHOOK_URL:
         # Продакшен режим с webhook
         app = await webhook_main()
         if app:
@@ -123,6 +297,11 @@ async def main():
                 await asyncio.Future()  # Бесконечный цикл
             finally:
                 await runner.cleanup()
+                await timer_service.stop()
+                await crash_chain_service.stop()
+                verification_service.stop()
+                # Сбрасываем накопленные рейтинги
+                await rating_aggregator.stop()
     else:
         # Режим разработки с polling
         await polling_main()
@@ -130,6 +309,7 @@ async def main():
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        args = parse_args()
+        asyncio.run(main(args.workers))
     except KeyboardInterrupt:
         logger.info("👋 Bot stopped")
\ No newline at end of file
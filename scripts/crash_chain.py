@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Цепочка хэшей ракетки: генерация заранее и офлайн проверка раундов.
+
+    python scripts/crash_chain.py generate [--length 2000000] [--path data/crash_chain.bin]
+    python scripts/crash_chain.py verify НОМЕР ХЭШ_РАУНДА ХЭШ_ЦЕПОЧКИ
+
+Бот генерирует цепочку сам, если файла нет; скрипт нужен, чтобы подготовить
+её до деплоя. Проверка не требует ни бота, ни файла цепочки: хэш раунда,
+захэшированный НОМЕР+1 раз, должен дать опубликованный хэш цепочки.
+"""
+
+import argparse
+import sys
+import os
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.games.crash_chain import crash_point_from_link, generate_chain, verify_link
+from src.games.rocket import RocketGame
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Цепочка хэшей ракетки")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Сгенерировать цепочку")
+    generate.add_argument('--length', type=int, default=None, help="Число раундов (по умолчанию CRASH_CHAIN_LENGTH)")
+    generate.add_argument('--path', default=None, help="Файл цепочки (по умолчанию CRASH_CHAIN_PATH)")
+
+    verify = commands.add_parser('verify', help="Проверить раунд")
+    verify.add_argument('index', type=int, help="Номер раунда")
+    verify.add_argument('link', help="Хэш раунда (hex)")
+    verify.add_argument('terminal', help="Опубликованный хэш цепочки (hex)")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+
+    if args.command == 'generate':
+        from src.config import settings
+        path = args.path or settings.CRASH_CHAIN_PATH
+        length = args.length or settings.CRASH_CHAIN_LENGTH
+        started = time.perf_counter()
+        terminal = generate_chain(path, length)
+        print(f"✅ {length:,} раундов -> {path} за {time.perf_counter() - started:.1f} с")
+        print(f"📌 Хэш цепочки: {terminal}")
+        return 0
+
+    link = bytes.fromhex(args.link)
+    if not verify_link(link, args.index, bytes.fromhex(args.terminal)):
+        print(f"❌ Хэш не принадлежит раунду #{args.index} этой цепочки")
+        return 1
+    crash_point = crash_point_from_link(link)
+    print(f"✅ Раунд #{args.index} честный, точка краша {RocketGame.format_multiplier(crash_point)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перестроения индексов Redis (история ставок и транзакций, множество пользователей)
+Нужен один раз для данных, созданных до появления индексов
+"""
+
+import asyncio
+import logging
+import sys
+import os
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.redis_db import init_redis, close_redis, db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """Главная функция"""
+    try:
+        await init_redis()
+        
+        users_count = await db.rebuild_users_index()
+        logger.info(f"✅ Проиндексировано пользователей: {users_count}")
+        
+        counts = await db.rebuild_history_indexes()
+        logger.info(f"✅ Проиндексировано ставок: {counts['bets']}, транзакций: {counts['transactions']}")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка перестроения индексов: {e}")
+    finally:
+        await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
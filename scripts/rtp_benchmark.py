@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк RTP игр: Монте-Карло на NumPy по формулам выплат из src/games.
+
+Каждая игра сводится к дискретному распределению "выплата / ставка":
+исходы перебираются через настоящие calculate_payout (таблицы выплат,
+веса, округления), после чего раунды семплируются векторно пачками.
+Для мин и ракетки RTP зависит от стратегии - считается точно для всех
+стратегий, симулируется лучшая для игрока.
+
+Отчёт: RTP, дисперсия, частота выигрышей (выплата > 0), распределение
+максимальной просадки за сессию. Код выхода 1, если RTP вне коридора
+RTP_BANDS (изменили таблицу выплат - поправьте коридор осознанно).
+Известные проблемы (KNOWN_FAILURES) печатаются как провал всегда, но
+с --allow-known не влияют на код выхода.
+
+Требует numpy (pip install -r requirements-dev.txt), боту он не нужен.
+
+    python scripts/rtp_benchmark.py
+    python scripts/rtp_benchmark.py --rounds 1e6 --games slots dice
+    python scripts/rtp_benchmark.py --games slots --real-spins 1e6
+    python scripts/rtp_benchmark.py --allow-known
+"""
+
+import argparse
+import math
+import secrets
+import sys
+import os
+import time
+from dataclasses import dataclass
+from itertools import product
+from typing import Dict, List, Tuple
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from src.games.slots import SlotMachine
+from src.games.dice import DiceGame
+from src.games.roulette import RouletteGame
+from src.games.mines import MinesGame
+from src.games.rocket import RocketGame
+
+# Ставка для расчёта выплат (центы): int() в формулах округляет как в игре
+STAKE = 10000
+
+# Допустимый RTP каждой игры (для мин и ракетки - лучшей стратегии)
+RTP_BANDS: Dict[str, Tuple[float, float]] = {
+    'slots': (0.40, 0.46),
+    'dice': (0.68, 0.73),
+    'roulette_number': (0.20, 0.24),
+    'roulette_color': (0.72, 0.78),
+    'mines': (0.88, 0.94),
+    # Заявлено в RocketGame.calculate_crash_point: ~95% RTP
+    'rocket': (0.90, 0.99),
+}
+
+# Игры, RTP которых заведомо вне коридора: что сломано (коридор не подгоняем)
+KNOWN_FAILURES: Dict[str, str] = {
+    'rocket': "распределение точки краша (то же в цепочке хэшей раундов) "
+              "даёт RTP ~2.64 вместо ~0.95 - выплаты ракетки надо исправить",
+}
+
+# Цели автокэшаута ракетки, среди которых ищется лучшая
+ROCKET_TARGETS = [round(1.1 + 0.1 * i, 1) for i in range(int((RocketGame.MAX_MULTIPLIER - 1.1) * 10))]
+
+# Сетка для распределения точки краша (точка краша кратна 0.1x)
+CRASH_GRID = 1_000_000
+
+
+@dataclass
+class GameModel:
+    """Дискретное распределение выплат одной игры (в долях ставки)"""
+    name: str
+    multipliers: List[float]
+    probabilities: List[float]
+    strategy: str = ''
+
+    @property
+    def rtp(self) -> float:
+        return sum(m * p for m, p in zip(self.multipliers, self.probabilities))
+
+
+def _merge(name: str, outcomes: Dict[float, float], strategy: str = '') -> GameModel:
+    """Схлопнуть исходы с одинаковой выплатой"""
+    total = sum(outcomes.values())
+    items = sorted(outcomes.items())
+    return GameModel(
+        name=name,
+        multipliers=[m for m, _ in items],
+        probabilities=[w / total for _, w in items],
+        strategy=strategy
+    )
+
+
+def slots_model() -> GameModel:
+    outcomes: Dict[float, float] = {}
+    reel = list(zip(SlotMachine.SYMBOLS, SlotMachine.WEIGHTS))
+    for combo in product(reel, repeat=3):
+        symbols = [symbol for symbol, _ in combo]
+        weight = math.prod(w for _, w in combo)
+        multiplier = SlotMachine.calculate_payout(symbols, STAKE) / STAKE
+        outcomes[multiplier] = outcomes.get(multiplier, 0) + weight
+    return _merge('slots', outcomes)
+
+
+def dice_model() -> GameModel:
+    outcomes: Dict[float, float] = {}
+    for player, bot in product(range(1, 7), repeat=2):
+        multiplier = DiceGame.calculate_payout(player, bot, STAKE) / STAKE
+        outcomes[multiplier] = outcomes.get(multiplier, 0) + 1
+    return _merge('dice', outcomes)
+
+
+def roulette_model(name: str, bet_type: str, bet_value) -> GameModel:
+    outcomes: Dict[float, float] = {}
+    for result in range(1, 11):
+        multiplier = RouletteGame.calculate_payout(bet_type, bet_value, result, STAKE) / STAKE
+        outcomes[multiplier] = outcomes.get(multiplier, 0) + 1
+    return _merge(name, outcomes)
+
+
+def mines_models() -> List[GameModel]:
+    """Стратегии 'забрать после k безопасных ходов'"""
+    models = []
+    safe_cells = MinesGame.TOTAL_CELLS - MinesGame.MINES_COUNT
+    survive = 1.0
+    for moves in range(1, MinesGame.MAX_SAFE_MOVES + 1):
+        survive *= (safe_cells - moves + 1) / (MinesGame.TOTAL_CELLS - moves + 1)
+        multiplier = MinesGame.calculate_payout(STAKE, moves) / STAKE
+        models.append(_merge('mines', {multiplier: survive, 0.0: 1 - survive}, f"забрать на ходу {moves}"))
+    return models
+
+
+def crash_distribution() -> Dict[float, float]:
+    """Распределение точки краша по равномерной сетке [0, 1)"""
+    counts: Dict[float, float] = {}
+    for i in range(CRASH_GRID):
+        crash_point = RocketGame.crash_point_from_uniform((i + 0.5) / CRASH_GRID)
+        counts[crash_point] = counts.get(crash_point, 0) + 1
+    return counts
+
+
+def rocket_models() -> List[GameModel]:
+    """Стратегии 'автокэшаут на коэффициенте m' (успел, если краш выше m)"""
+    crashes = crash_distribution()
+    models = []
+    for target in ROCKET_TARGETS:
+        win = sum(count for crash_point, count in crashes.items() if crash_point > target) / CRASH_GRID
+        multiplier = RocketGame.calculate_payout(STAKE, target) / STAKE
+        models.append(_merge('rocket', {multiplier: win, 0.0: 1 - win}, f"автокэшаут {target}x"))
+    return models
+
+
+def slots_real_spins(count: int, batch: int = 100_000) -> Tuple[float, float]:
+    """
+    RTP слотов настоящим provably fair спином (SlotMachine.spin_many),
+    а не по модели: проверка, что HMAC -> символы даёт те же веса.
+    Возвращает (RTP, секунды).
+    """
+    started = time.perf_counter()
+    total = 0
+    played = 0
+    while played < count:
+        size = min(batch, count - played)
+        # Новая пара сидов на каждую пачку, как при смене пары игроком
+        server_seed, client_seed = secrets.token_hex(32), secrets.token_hex(8)
+        for symbols in SlotMachine.spin_many(server_seed, client_seed, range(size)):
+            total += SlotMachine.calculate_payout(symbols, STAKE)
+        played += size
+    return total / (played * STAKE), time.perf_counter() - started
+
+
+def build_models(games: List[str]) -> List[GameModel]:
+    builders = {
+        'slots': lambda: [slots_model()],
+        'dice': lambda: [dice_model()],
+        'roulette_number': lambda: [roulette_model('roulette_number', 'number', 7)],
+        'roulette_color': lambda: [roulette_model('roulette_color', 'red', RouletteGame.RED_NUMBERS)],
+        'mines': mines_models,
+        'rocket': rocket_models,
+    }
+    models = []
+    for game in games:
+        strategies = builders[game]()
+        best = max(strategies, key=lambda model: model.rtp)
+        if len(strategies) > 1:
+            print(f"\n{game}: точный RTP по стратегиям")
+            for model in strategies:
+                mark = '  <- лучшая' if model is best else ''
+                print(f"  {model.strategy:<24} {model.rtp:8.4f}{mark}")
+        models.append(best)
+    return models
+
+
+@dataclass
+class SimulationResult:
+    model: GameModel
+    rounds: int
+    session: int
+    rtp: float
+    variance: float
+    hit_frequency: float
+    drawdowns: "np.ndarray"
+    seconds: float
+
+    @property
+    def stderr(self) -> float:
+        return math.sqrt(self.variance / self.rounds)
+
+
+def simulate(
+    model: GameModel,
+    rounds: int,
+    session: int,
+    rng: "np.random.Generator",
+    chunk: int = 4_000_000
+) -> SimulationResult:
+    """
+    Сыграть rounds раундов по одной ставке. Просадка считается по сессиям
+    из session раундов: максимум падения баланса от предыдущего пика.
+    """
+    multipliers = np.asarray(model.multipliers, dtype=np.float64)
+    cdf = np.cumsum(model.probabilities)
+    cdf /= cdf[-1]
+    chunk = max(session, chunk // session * session)
+
+    total = 0.0
+    total_sq = 0.0
+    hits = 0
+    played = 0
+    drawdowns = []
+    started = time.perf_counter()
+    while played < rounds:
+        size = min(chunk, rounds - played)
+        size = max(session, size // session * session)
+        index = np.searchsorted(cdf, rng.random(size), side='right')
+        np.minimum(index, len(multipliers) - 1, out=index)
+        payout = multipliers[index]
+
+        total += payout.sum()
+        total_sq += np.dot(payout, payout)
+        hits += np.count_nonzero(payout)
+
+        net = np.cumsum((payout - 1.0).reshape(-1, session), axis=1)
+        peak = np.maximum(np.maximum.accumulate(net, axis=1), 0.0)
+        drawdowns.append((peak - net).max(axis=1))
+        played += size
+
+    mean = total / played
+    return SimulationResult(
+        model=model,
+        rounds=played,
+        session=session,
+        rtp=mean,
+        variance=total_sq / played - mean * mean,
+        hit_frequency=hits / played,
+        drawdowns=np.concatenate(drawdowns),
+        seconds=time.perf_counter() - started
+    )
+
+
+def report(result: SimulationResult, band: Tuple[float, float]) -> bool:
+    """Печать результата; True - RTP в коридоре"""
+    low, high = band
+    ok = low <= result.rtp <= high
+    p50, p95, p99 = np.percentile(result.drawdowns, [50, 95, 99])
+    strategy = f" ({result.model.strategy})" if result.model.strategy else ""
+    print(f"\n{'✅' if ok else '❌'} {result.model.name}{strategy}")
+    print(f"  RTP:           {result.rtp:.5f} ± {result.stderr:.5f} (точно {result.model.rtp:.5f}), коридор [{low:.2f}, {high:.2f}]")
+    print(f"  Дисперсия:     {result.variance:.4f}")
+    print(f"  Выигрыши:      {result.hit_frequency:.4%}")
+    print(f"  Просадка за {result.session} раундов (в ставках): "
+          f"p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={result.drawdowns.max():.1f}")
+    print(f"  {result.rounds:,} раундов за {result.seconds:.1f} с ({result.rounds / result.seconds / 1e6:.1f} млн/с)")
+    return ok
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Монте-Карло RTP игр казино")
+    parser.add_argument('--rounds', type=float, default=1e8, help="Раундов на игру (по умолчанию 1e8)")
+    parser.add_argument('--session', type=int, default=1000, help="Раундов в сессии для просадки")
+    parser.add_argument('--seed', type=int, default=None, help="Seed генератора (для воспроизводимости)")
+    parser.add_argument('--games', nargs='+', choices=list(RTP_BANDS), default=list(RTP_BANDS))
+    parser.add_argument('--real-spins', type=float, default=0, help="Дополнительно сыграть столько настоящих спинов слотов")
+    parser.add_argument(
+        '--allow-known',
+        action='store_true',
+        help="Не считать провалом известные проблемы (KNOWN_FAILURES), только напечатать их"
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    if np is None:
+        print("❌ Нужен numpy: pip install -r requirements-dev.txt")
+        return 2
+
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    models = build_models(args.games)
+
+    failed = []
+    known = []
+    for model in models:
+        result = simulate(model, int(args.rounds), args.session, rng)
+        if report(result, RTP_BANDS[model.name]):
+            continue
+        if model.name in KNOWN_FAILURES:
+            print(f"  ⚠️ Известная проблема: {KNOWN_FAILURES[model.name]}")
+            if args.allow_known:
+                known.append(model.name)
+                continue
+        failed.append(model.name)
+
+    if args.real_spins:
+        rtp, seconds = slots_real_spins(int(args.real_spins))
+        ok = RTP_BANDS['slots'][0] <= rtp <= RTP_BANDS['slots'][1]
+        print(f"\n{'✅' if ok else '❌'} slots, настоящие спины (spin_many)")
+        print(f"  RTP:           {rtp:.5f} (точно {slots_model().rtp:.5f})")
+        print(f"  {int(args.real_spins):,} спинов за {seconds:.1f} с ({args.real_spins / seconds / 1e6:.2f} млн/с)")
+        if not ok:
+            failed.append('slots (spin_many)')
+
+    if failed:
+        print(f"\n❌ RTP вне коридора: {', '.join(failed)}")
+        return 1
+    if known:
+        print(f"\n⚠️ RTP вне коридора только у известных проблем: {', '.join(known)}")
+        return 0
+    print("\n✅ RTP всех игр в коридоре")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
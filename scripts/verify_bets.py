@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Офлайн аудит provably fair ставок (слоты, кости, рулетка).
+
+Ставки читаются из БД потоком, пересчёт идёт во всех ядрах - миллионы
+ставок без бота и без нагрузки на него. Клиентские сиды берутся из
+раскрытых пар в Redis; ставки на нераскрытых сидах пропускаются.
+
+    python scripts/verify_bets.py --user 123456789
+    python scripts/verify_bets.py --all --workers 8
+
+Код выхода 1, если найдены расхождения.
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import os
+
+# Добавляем корневую директорию в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+
+from src.config import settings
+from src.database import init_db, close_db
+from src.models import User
+from src.redis_db import init_redis, close_redis
+from src.services.verification_service import VerificationReport, VerificationService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Аудит provably fair ставок")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--user', type=int, help="Telegram ID пользователя")
+    target.add_argument('--all', action='store_true', help="Все пользователи")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Процессов для пересчёта")
+    parser.add_argument('--chunk', type=int, default=settings.VERIFY_CHUNK_SIZE, help="Ставок в пачке")
+    parser.add_argument('--show', type=int, default=20, help="Сколько расхождений вывести")
+    return parser.parse_args()
+
+
+async def resolve_user(telegram_id: int):
+    from src.database import async_session_maker
+
+    async with async_session_maker() as session:
+        result = await session.execute(select(User.id).where(User.telegram_id == telegram_id))
+        return result.scalar_one_or_none()
+
+
+def print_progress(report: VerificationReport) -> None:
+    print(f"\r  проверено {report.checked:,}, расхождений {report.mismatch_count:,}", end='', flush=True)
+
+
+async def main() -> int:
+    args = parse_args()
+    service = VerificationService(args.workers, args.chunk)
+    try:
+        await init_db()
+        await init_redis()
+
+        user_id = None
+        if args.user is not None:
+            user_id = await resolve_user(args.user)
+            if user_id is None:
+                logger.error(f"❌ Пользователь {args.user} не найден")
+                return 2
+
+        report = await service.verify(user_id, progress=print_progress)
+        print()
+    finally:
+        service.stop()
+        await close_redis()
+        await close_db()
+
+    print(f"✅ Проверено ставок: {report.checked:,} за {report.seconds:.1f} с")
+    print(f"🔒 На нераскрытых сидах: {report.unrevealed:,}")
+    if not report.mismatch_count:
+        print("✅ Расхождений нет")
+        return 0
+
+    print(f"❌ Расхождений: {report.mismatch_count:,}")
+    for bet_id, game_type, nonce, expected, actual in report.mismatches[:args.show]:
+        print(f"  #{bet_id} {game_type} nonce={nonce}: ожидалось {expected}, записано {actual}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
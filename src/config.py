@@ -18,6 +18,13 @@ class Settings:
     REDIS_PASSWORD: str = os.getenv('REDIS_PASSWORD', '')
     REDIS_DB: int = int(os.getenv('REDIS_DB', 0))
     
+    # Блокировки операций с кошельком: 'local', 'redis' или пусто (redis при WEBHOOK_WORKERS > 1)
+    USER_LOCK_BACKEND: str = os.getenv('USER_LOCK_BACKEND', '')
+    
+    # FSM Storage ('redis' - состояние игр переживает рестарт и доступно всем воркерам, 'memory' - для разработки)
+    FSM_STORAGE: str = os.getenv('FSM_STORAGE', 'redis')
+    FSM_STATE_TTL: int = int(os.getenv('FSM_STATE_TTL', 86400))
+    
     # Security
     ENCRYPTION_KEY: str = os.getenv('ENCRYPTION_KEY', '')
     
@@ -25,11 +32,25 @@ class Settings:
     STARTER_BONUS: int = int(os.getenv('STARTER_BONUS', 10000))
     MIN_BET: int = int(os.getenv('MIN_BET', 100))
     MAX_BET: int = int(os.getenv('MAX_BET', 100000))
+    # Брошенная игра в мины завершается (забирается выигрыш) через столько секунд после последнего хода
+    MINES_TIMEOUT_SECONDS: int = int(os.getenv('MINES_TIMEOUT_SECONDS', 600))
+    # Цепочка хэшей ракетки (provably fair): файл и число раундов в ней
+    CRASH_CHAIN_PATH: str = os.getenv('CRASH_CHAIN_PATH', 'data/crash_chain.bin')
+    CRASH_CHAIN_LENGTH: int = int(os.getenv('CRASH_CHAIN_LENGTH', 2000000))
+    # Проверка ставок (/verify): процессов для пересчёта и ставок в одной пачке
+    VERIFY_WORKERS: int = int(os.getenv('VERIFY_WORKERS', 2))
+    VERIFY_CHUNK_SIZE: int = int(os.getenv('VERIFY_CHUNK_SIZE', 5000))
     
     # Render Settings
     PORT: int = int(os.getenv('PORT', 8000))
     WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
     WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+    # Количество процессов-обработчиков апдейтов (1 - всё в одном процессе)
+    WEBHOOK_WORKERS: int = int(os.getenv('WEBHOOK_WORKERS', 1))
+    # Приём апдейтов: 'queue' - ответ сразу, обработка из очереди; 'inline' - обработка внутри запроса
+    WEBHOOK_INGESTION: str = os.getenv('WEBHOOK_INGESTION', 'queue')
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+    WEBHOOK_QUEUE_WORKERS: int = int(os.getenv('WEBHOOK_QUEUE_WORKERS', 50))
     
     @property
     def REDIS_CONNECTION_URL(self) -> str:
@@ -0,0 +1,106 @@
+"""
+FSM-хранилище aiogram на Redis (соединение из src/redis_db.py)
+"""
+
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from src.games.mines import MinesGame
+from src.redis_db import db
+
+logger = logging.getLogger(__name__)
+
+
+# Поля со списками клеток поля 5x5, которые хранятся битовой маской
+MASK_FIELDS = ('mines', 'opened_cells')
+MASK_PREFIX = '~'
+
+
+def encode_data(data: Dict[str, Any]) -> str:
+    """Компактная сериализация данных FSM (списки клеток -> 25-битные маски)"""
+    packed = {}
+    for name, value in data.items():
+        if name in MASK_FIELDS and isinstance(value, list):
+            packed[MASK_PREFIX + name] = MinesGame.cells_to_mask(value)
+        else:
+            packed[name] = value
+    return json.dumps(packed, separators=(',', ':'))
+
+
+def decode_data(raw: Optional[str]) -> Dict[str, Any]:
+    """Обратное преобразование encode_data"""
+    if not raw:
+        return {}
+    data = {}
+    for name, value in json.loads(raw).items():
+        if name.startswith(MASK_PREFIX):
+            data[name[len(MASK_PREFIX):]] = MinesGame.mask_to_cells(value)
+        else:
+            data[name] = value
+    return data
+
+
+class RedisFSMStorage(BaseStorage):
+    """
+    FSM-хранилище в Redis.
+
+    Состояние и данные одного ключа лежат в одном hash
+    fsm:{bot_id}:{chat_id}:{user_id} (поля state и data), поэтому читаются
+    одним HMGET и пишутся одним pipeline вместе с продлением TTL.
+    Соединение берётся из db при каждом вызове: хранилище создаётся
+    раньше, чем вызывается init_redis().
+    """
+
+    def __init__(self, state_ttl: Optional[int] = 86400):
+        self.state_ttl = state_ttl
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = ["fsm", str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        thread_id = getattr(key, 'thread_id', None)
+        if thread_id:
+            parts.append(str(thread_id))
+        business_connection_id = getattr(key, 'business_connection_id', None)
+        if business_connection_id:
+            parts.append(str(business_connection_id))
+        if key.destiny != 'default':
+            parts.append(key.destiny)
+        return ":".join(parts)
+
+    async def _write(self, redis_key: str, field: str, value: Optional[str]) -> None:
+        """Записать (или удалить) поле hash и продлить TTL одним pipeline"""
+        async with db.client.pipeline(transaction=False) as pipe:
+            if value is None:
+                pipe.hdel(redis_key, field)
+            else:
+                pipe.hset(redis_key, field, value)
+                if self.state_ttl:
+                    pipe.expire(redis_key, self.state_ttl)
+            await pipe.execute()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if isinstance(state, State):
+            state = state.state
+        await self._write(self._key(key), 'state', state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await db.client.hget(self._key(key), 'state')
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(self._key(key), 'data', encode_data(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return decode_data(await db.client.hget(self._key(key), 'data'))
+
+    async def get_state_and_data(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Состояние и данные за один запрос"""
+        state, raw = await db.client.hmget(self._key(key), ['state', 'data'])
+        return state, decode_data(raw)
+
+    async def close(self) -> None:
+        # Соединение принадлежит db и закрывается в close_redis()
+        pass
@@ -0,0 +1,106 @@
+"""
+Provably fair цепочка хэшей для ракетки.
+
+Цепочка строится заранее: c0 - случайный секрет, c(j+1) = sha256(c(j)),
+публикуется последнее звено cN (terminal). Раунды расходуют звенья
+в обратном порядке: раунд 0 - c(N-1), раунд 1 - c(N-2), ... Поэтому
+sha256 от хэша раунда i равен хэшу раунда i-1 (для раунда 0 - terminal),
+и будущий хэш нельзя вычислить из прошлых.
+
+Файл цепочки: заголовок и звенья по 32 байта в порядке раундов, читается
+через mmap - звено раунда берётся за O(1) без загрузки файла в память.
+"""
+
+import hashlib
+import mmap
+import os
+import secrets
+import struct
+from typing import Optional
+
+from src.games.rocket import RocketGame
+
+MAGIC = b'CRASHCH1'
+# magic, число звеньев, terminal, резерв
+HEADER = struct.Struct('>8sQ32s16x')
+LINK_SIZE = 32
+
+
+def crash_point_from_link(link: bytes) -> float:
+    """Точка краша раунда: 52 старших бита хэша -> число из [0, 1)"""
+    uniform = (int.from_bytes(link[:7], 'big') >> 4) / float(1 << 52)
+    return RocketGame.crash_point_from_uniform(uniform)
+
+
+def verify_link(link: bytes, index: int, terminal: bytes) -> bool:
+    """
+    Проверка хэша раунда index по опубликованному terminal
+    (index + 1 применений sha256 - для офлайн проверки).
+    """
+    for _ in range(index + 1):
+        link = hashlib.sha256(link).digest()
+    return link == terminal
+
+
+def generate_chain(path: str, length: int, seed: Optional[bytes] = None) -> str:
+    """
+    Сгенерировать цепочку из length звеньев в файл path (атомарно, через
+    временный файл). Долго для миллионов звеньев - запускается в отдельном
+    процессе. Возвращает terminal (hex).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    size = HEADER.size + length * LINK_SIZE
+    with open(tmp_path, 'wb+') as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as mm:
+            sha256 = hashlib.sha256
+            link = seed if seed is not None else secrets.token_bytes(LINK_SIZE)
+            # c(j) - звено раунда length-1-j: заполняем файл с конца
+            offset = size - LINK_SIZE
+            for _ in range(length):
+                mm[offset:offset + LINK_SIZE] = link
+                link = sha256(link).digest()
+                offset -= LINK_SIZE
+            mm[:HEADER.size] = HEADER.pack(MAGIC, length, link)
+            mm.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return link.hex()
+
+
+class HashChain:
+    """Готовая цепочка в файле (только чтение, mmap)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Empty crash chain file: {path}")
+
+        magic, self.length, self.terminal = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or len(self._mm) != HEADER.size + self.length * LINK_SIZE:
+            self.close()
+            raise ValueError(f"Corrupted crash chain file: {path}")
+
+    def link(self, index: int) -> bytes:
+        """Хэш раунда index"""
+        if not 0 <= index < self.length:
+            raise IndexError(f"Crash chain index out of range: {index}")
+        offset = HEADER.size + index * LINK_SIZE
+        return self._mm[offset:offset + LINK_SIZE]
+
+    def previous(self, index: int) -> bytes:
+        """Хэш, которому должен равняться sha256 хэша раунда index"""
+        return self.terminal if index == 0 else self.link(index - 1)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
@@ -1,5 +1,7 @@
 import random
 
+from src.games.provably_fair import fair_hash, hash_chunks
+
 
 class DiceGame:
     """Дуэль на костях"""
@@ -9,6 +11,17 @@ class DiceGame:
         """Бросок кубика (1-6)"""
         return random.randint(1, 6)
     
+    @staticmethod
+    def roll_fair(server_seed: str, client_seed: str, nonce: int) -> tuple:
+        """Броски бота и игрока (Provably Fair)"""
+        return DiceGame.values_from_hash(fair_hash(server_seed, client_seed, nonce))
+    
+    @staticmethod
+    def values_from_hash(hash_result: str) -> tuple:
+        """(бот, игрок) из HMAC раунда"""
+        bot_chunk, player_chunk = hash_chunks(hash_result, 2)
+        return bot_chunk % 6 + 1, player_chunk % 6 + 1
+    
     @staticmethod
     def calculate_payout(player_value: int, bot_value: int, stake: int) -> int:
         """Расчёт выплаты - сбалансированная версия"""
@@ -0,0 +1,59 @@
+"""
+Пересчёт provably fair игр по раскрытым сидам.
+
+Функции модуля выполняются в дочерних процессах (ProcessPoolExecutor):
+на вход - пачка кортежей, на выход - только расхождения, чтобы между
+процессами гонять как можно меньше данных.
+"""
+
+import hashlib
+import hmac
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.games.dice import DiceGame
+from src.games.provably_fair import fair_message
+from src.games.roulette import RouletteGame
+from src.games.slots import SlotMachine
+
+# (bet_id, game_type, server_seed, client_seed, nonce, result)
+BetRow = Tuple[int, str, str, str, int, str]
+# (bet_id, game_type, nonce, ожидаемый результат, записанный результат)
+Mismatch = Tuple[int, str, int, str, str]
+
+VERIFIABLE_GAMES = ('slots', 'dice', 'roulette')
+
+
+def result_from_digest(game_type: str, digest: bytes) -> Optional[str]:
+    """Результат ставки в том виде, в каком его записывает игра"""
+    if game_type == 'slots':
+        return ''.join(SlotMachine.symbols_from_digest(digest))
+    hash_result = digest.hex()
+    if game_type == 'dice':
+        bot_value, player_value = DiceGame.values_from_hash(hash_result)
+        return f"bot:{bot_value},player:{player_value}"
+    if game_type == 'roulette':
+        number = RouletteGame.number_from_hash(hash_result)
+        return f"number:{number},color:{RouletteGame.get_color(number)}"
+    return None
+
+
+def verify_rows(rows: Sequence[BetRow]) -> Tuple[int, List[Mismatch]]:
+    """Проверить пачку ставок: (проверено, расхождения)"""
+    keys: Dict[str, "hmac.HMAC"] = {}
+    mismatches: List[Mismatch] = []
+    checked = 0
+    for bet_id, game_type, server_seed, client_seed, nonce, result in rows:
+        # Ставки подряд обычно на одном сиде - ключ HMAC готовим один раз
+        key = keys.get(server_seed)
+        if key is None:
+            key = keys[server_seed] = hmac.new(server_seed.encode(), digestmod=hashlib.sha256)
+        mac = key.copy()
+        mac.update(fair_message(server_seed, client_seed, nonce))
+
+        expected = result_from_digest(game_type, mac.digest())
+        if expected is None:
+            continue
+        checked += 1
+        if expected != result:
+            mismatches.append((bet_id, game_type, nonce, expected, result))
+    return checked, mismatches
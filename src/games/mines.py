@@ -71,3 +71,16 @@ class MinesGame:
     def coords_to_position(cls, row: int, col: int) -> int:
         """Конвертирует координаты в позицию"""
         return row * cls.BOARD_SIZE + col
+    
+    @classmethod
+    def cells_to_mask(cls, cells: List[int]) -> int:
+        """Упаковывает список клеток в битовую маску (25 бит)"""
+        mask = 0
+        for position in cells:
+            mask |= 1 << position
+        return mask
+    
+    @classmethod
+    def mask_to_cells(cls, mask: int) -> List[int]:
+        """Распаковывает битовую маску в отсортированный список клеток"""
+        return [position for position in range(cls.TOTAL_CELLS) if mask >> position & 1]
@@ -0,0 +1,43 @@
+"""
+Provably fair: результат раунда - HMAC-SHA256(server_seed, "server_seed:client_seed:nonce").
+
+Сервер заранее публикует sha256 от server_seed, игрок задаёт client_seed,
+nonce растёт с каждой игрой. После смены пары server_seed раскрывается,
+и любой раунд можно пересчитать этими функциями.
+"""
+
+import hashlib
+import hmac
+
+
+def seed_hash(server_seed: str) -> str:
+    """Публикуемый заранее хэш серверного сида"""
+    return hashlib.sha256(server_seed.encode()).hexdigest()
+
+
+def fair_prefix(server_seed: str, client_seed: str) -> bytes:
+    """Общее начало сообщения для всех nonce пары"""
+    return f"{server_seed}:{client_seed}:".encode()
+
+
+def fair_message(server_seed: str, client_seed: str, nonce: int) -> bytes:
+    return fair_prefix(server_seed, client_seed) + str(nonce).encode()
+
+
+def fair_digest(server_seed: str, client_seed: str, nonce: int) -> bytes:
+    """HMAC раунда (32 байта)"""
+    return hmac.new(
+        server_seed.encode(),
+        fair_message(server_seed, client_seed, nonce),
+        hashlib.sha256
+    ).digest()
+
+
+def fair_hash(server_seed: str, client_seed: str, nonce: int) -> str:
+    """HMAC раунда (hex, 64 символа)"""
+    return fair_digest(server_seed, client_seed, nonce).hex()
+
+
+def hash_chunks(hash_result: str, count: int) -> list:
+    """Первые count 64-битных чисел из hex-хэша"""
+    return [int(hash_result[i*16:(i+1)*16], 16) for i in range(count)]
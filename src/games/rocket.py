@@ -18,19 +18,25 @@ class RocketGame:
     # Максимальный коэффициент (защита от абузов)
     MAX_MULTIPLIER = 10.0
     
+    # Рост коэффициента в секунду (тот же темп: 0.1x за 100ms)
+    GROWTH_PER_SECOND = MULTIPLIER_INCREMENT / UPDATE_INTERVAL
+    
     @staticmethod
     def calculate_crash_point() -> float:
         """
         Генерирует точку краша с более сбалансированным распределением.
         Это обеспечивает справедливую игру с математическим ожиданием ~95% RTP.
         """
+        # Генерируем случайное число от 0 до 1
+        return RocketGame.crash_point_from_uniform(random.random())
+    
+    @staticmethod
+    def crash_point_from_uniform(rand: float) -> float:
+        """Точка краша для равномерного числа rand из [0, 1) (детерминированно)"""
         # Используем более сбалансированный алгоритм
         # House edge ~5%
         house_edge = 0.05
         
-        # Генерируем случайное число от 0 до 1
-        rand = random.random()
-        
         # Используем формулу для получения более реалистичного распределения
         # Минимум 1.1x, максимум 10.0x
         if rand < 0.1:  # 10% шанс на низкие коэффициенты (1.1x - 2.0x)
@@ -57,6 +63,19 @@ class RocketGame:
         """Расчёт выплаты на основе ставки и коэффициента"""
         return int(stake * multiplier)
     
+    @staticmethod
+    def multiplier_at(elapsed: float) -> float:
+        """Коэффициент через elapsed секунд после старта (по реальному времени)"""
+        multiplier = RocketGame.START_MULTIPLIER + max(elapsed, 0.0) * RocketGame.GROWTH_PER_SECOND
+        # Округляем вниз, чтобы не выплатить больше показанного
+        return min(math.floor(multiplier * 100) / 100, RocketGame.MAX_MULTIPLIER)
+    
+    @staticmethod
+    def flight_duration(crash_point: float) -> float:
+        """Через сколько секунд после старта ракета взорвётся"""
+        final_multiplier = min(crash_point, RocketGame.MAX_MULTIPLIER)
+        return (final_multiplier - RocketGame.START_MULTIPLIER) / RocketGame.GROWTH_PER_SECOND
+    
     @staticmethod
     async def simulate_rocket(crash_point: float, callback_func):
         """
@@ -95,7 +114,7 @@ class RocketGame:
     @staticmethod
     def format_multiplier(multiplier: float) -> str:
         """Форматирует множитель для отображения"""
-        return f"{multiplier:.1f}x"
+        return f"{multiplier:.2f}x"
     
     @staticmethod
     def get_rocket_emoji(multiplier: float) -> str:
@@ -1,5 +1,7 @@
 import secrets
 
+from src.games.provably_fair import fair_hash, hash_chunks
+
 
 class RouletteGame:
     """Мини-рулетка"""
@@ -12,6 +14,16 @@ class RouletteGame:
         """Вращение рулетки"""
         return secrets.randbelow(10) + 1
     
+    @staticmethod
+    def spin_fair(server_seed: str, client_seed: str, nonce: int) -> int:
+        """Вращение рулетки (Provably Fair)"""
+        return RouletteGame.number_from_hash(fair_hash(server_seed, client_seed, nonce))
+    
+    @staticmethod
+    def number_from_hash(hash_result: str) -> int:
+        """Число 1-10 из HMAC раунда"""
+        return hash_chunks(hash_result, 1)[0] % 10 + 1
+    
     @staticmethod
     def get_color(number: int) -> str:
         """Получить цвет числа"""
@@ -1,6 +1,20 @@
-import secrets
-import hmac
 import hashlib
+import hmac
+import struct
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, List
+
+from src.games.provably_fair import fair_digest, fair_prefix
+
+# Три 64-битных числа из начала HMAC - по одному на барабан
+_REEL_CHUNKS = struct.Struct('>3Q')
+
+
+def _reel_table(symbols: list, weights: list) -> tuple:
+    """Символ для каждого остатка 0..sum(weights)-1 (по кумулятивным весам)"""
+    cumulative = list(accumulate(weights))
+    return tuple(symbols[bisect_right(cumulative, index)] for index in range(cumulative[-1]))
 
 
 class SlotMachine:
@@ -9,6 +23,10 @@ class SlotMachine:
     SYMBOLS = ['🍒', '🍋', '🍊', '🍉', '⭐', '7️⃣', '💎']
     WEIGHTS = [30, 25, 20, 15, 7, 2, 1]
     
+    # Считается один раз при загрузке: выбор символа - остаток и индекс в кортеже
+    TOTAL_WEIGHT = sum(WEIGHTS)
+    REEL = _reel_table(SYMBOLS, WEIGHTS)
+    
     PAYTABLE = {
         '🍒🍒🍒': 2,
         '🍋🍋🍋': 3,
@@ -22,27 +40,40 @@ class SlotMachine:
     @staticmethod
     def spin(server_seed: str, client_seed: str, nonce: int) -> list:
         """Генерация символов (Provably Fair)"""
-        combined = f"{server_seed}:{client_seed}:{nonce}"
-        hash_result = hmac.new(
-            server_seed.encode(),
-            combined.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        return SlotMachine.symbols_from_digest(fair_digest(server_seed, client_seed, nonce))
+    
+    @staticmethod
+    def spin_many(server_seed: str, client_seed: str, nonces: Iterable[int]) -> List[list]:
+        """
+        Спины для многих nonce одной пары - то же, что spin() для каждого,
+        но ключ HMAC и начало сообщения готовятся один раз.
+        """
+        key = hmac.new(server_seed.encode(), digestmod=hashlib.sha256)
+        prefix = fair_prefix(server_seed, client_seed)
+        unpack = _REEL_CHUNKS.unpack_from
+        reel = SlotMachine.REEL
+        total = SlotMachine.TOTAL_WEIGHT
         
         results = []
-        for i in range(3):
-            chunk = int(hash_result[i*16:(i+1)*16], 16)
-            index = chunk % sum(SlotMachine.WEIGHTS)
-            
-            cumulative = 0
-            for j, weight in enumerate(SlotMachine.WEIGHTS):
-                cumulative += weight
-                if index < cumulative:
-                    results.append(SlotMachine.SYMBOLS[j])
-                    break
-        
+        for nonce in nonces:
+            mac = key.copy()
+            mac.update(prefix + str(nonce).encode())
+            first, second, third = unpack(mac.digest())
+            results.append([reel[first % total], reel[second % total], reel[third % total]])
         return results
     
+    @staticmethod
+    def symbols_from_digest(digest: bytes) -> list:
+        """Символы трёх барабанов из HMAC раунда"""
+        reel = SlotMachine.REEL
+        total = SlotMachine.TOTAL_WEIGHT
+        return [reel[chunk % total] for chunk in _REEL_CHUNKS.unpack_from(digest)]
+    
+    @staticmethod
+    def symbols_from_hash(hash_result: str) -> list:
+        """То же по hex-строке HMAC"""
+        return SlotMachine.symbols_from_digest(bytes.fromhex(hash_result))
+    
     @staticmethod
     def calculate_payout(symbols: list, stake: int) -> int:
         """Расчёт выплаты"""
@@ -57,4 +88,4 @@ class SlotMachine:
         if len(set(symbols)) == 2:
             return int(stake * 0.5)
         
-        return 0
\ No newline at end of file
+        return 0
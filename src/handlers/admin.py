@@ -5,6 +5,8 @@ from sqlalchemy import select, func
 from src.models import User, Bet
 from src.config import settings
 from src.services.wallet_service import wallet_service
+from src.services.leaderboard import leaderboard_engine
+from src.services.seed_service import seed_service
 from src.utils.keyboards import get_main_menu_keyboard # Импортируем, если нужно показать меню после команды
 
 router = Router()
@@ -101,3 +103,30 @@ async def cmd_admin_credit(message: Message):
         # if message.chat.type not in ['group', 'supergroup']:
         #     await message.answer("Меню:", reply_markup=get_main_menu_keyboard())
         # # Убрано: не отправляем меню
+
+
+@router.message(Command('rebuild_leaderboards'))
+async def cmd_rebuild_leaderboards(message: Message):
+    """Перестроить лидерборды в Redis из таблицы рейтингов (только для админа)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("🚫 Access denied")
+        return
+
+    counts = await leaderboard_engine.rebuild_all()
+    await message.answer(
+        f"✅ Лидерборды перестроены\n"
+        f"📅 Дневной: {counts['daily']} игроков\n"
+        f"📊 Недельный: {counts['weekly']} игроков\n"
+        f"🏆 Месячный: {counts['monthly']} игроков"
+    )
+
+
+@router.message(Command('rotate_seeds'))
+async def cmd_rotate_seeds(message: Message):
+    """Сменить пары сидов всех игроков и раскрыть серверные сиды (только для админа)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("🚫 Access denied")
+        return
+
+    revealed = await seed_service.rotate_all()
+    await message.answer(f"✅ Пары сидов сменены, раскрыто серверных сидов: {revealed}")
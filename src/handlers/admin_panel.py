@@ -9,6 +9,9 @@ from src.models import User, Bet, Wallet
 from src.config import settings
 from src.states import AdminStates
 from src.services.wallet_service import wallet_service
+from src.services.user_cache import user_cache
+from src.middlewares import user_context_middleware
+from src.services.user_lock import user_lock_registry
 from src.utils.keyboards import (
     get_admin_panel_keyboard,
     get_admin_users_keyboard,
@@ -226,6 +229,7 @@ async def process_user_delete(message: Message, state: FSMContext, bot: Bot):
         # Удаляем пользователя (каскадное удаление очистит связанные записи)
         await session.delete(user)
         await session.commit()
+        user_cache.invalidate(user_telegram_id)
         
         await message.answer(
             f"✅ Пользователь <code>{user_telegram_id}</code> успешно удален из базы данных.",
@@ -552,6 +556,7 @@ async def process_ban_user(message: Message, state: FSMContext, bot: Bot):
         # Блокируем пользователя
         user.is_banned = True
         await session.commit()
+        user_cache.invalidate(user_telegram_id)
         
         # Уведомляем пользователя
         await notify_user(
@@ -624,6 +629,7 @@ async def process_unban_user(message: Message, state: FSMContext, bot: Bot):
         # Разблокируем пользователя
         user.is_banned = False
         await session.commit()
+        user_cache.invalidate(user_telegram_id)
         
         # Уведомляем пользователя
         await notify_user(
@@ -677,6 +683,8 @@ async def process_amnesty(callback: CallbackQuery, bot: Bot):
             )
         
         await session.commit()
+        for user in banned_users:
+            user_cache.invalidate(user.telegram_id)
         
         await callback.message.edit_text(
             f"🕊️ <b>Амнистия выполнена!</b>\n\n"
@@ -787,7 +795,19 @@ async def show_stats(callback: CallbackQuery):
         text += f"💸 Всего выплачено: <b>${total_payout / 100:,.2f}</b>\n"
         
         profit = total_wagered - total_payout
-        text += f"📊 Прибыль: <b>${profit / 100:,.2f}</b>"
+        text += f"📊 Прибыль: <b>${profit / 100:,.2f}</b>\n\n"
+        
+        cache_stats = user_cache.stats()
+        text += f"🗂 Кэш пользователей: <b>{cache_stats['size']}</b> "
+        text += f"(попадания: {cache_stats['hits']}, промахи: {cache_stats['misses']}, {cache_stats['hit_rate']}%)\n"
+        
+        context_stats = user_context_middleware.stats()
+        text += f"⚡ Сэкономлено запросов: <b>{context_stats['queries_saved']}</b> "
+        text += f"({context_stats['saved_per_update']} на апдейт)\n"
+        
+        lock_stats = user_lock_registry.stats()
+        text += f"🔒 Блокировки ({lock_stats['backend']}): конфликтов <b>{lock_stats['contended']}</b>, "
+        text += f"отклонено {lock_stats['rejected']}, ожидание p95 {lock_stats['wait_time']['p95_ms']} мс"
         
         await callback.message.edit_text(text, reply_markup=get_admin_back_keyboard())
     
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import secrets
 from src.models import User
 from src.services.wallet_service import wallet_service
+from src.services.user_cache import user_cache
 # НОВОЕ:
 from src.services.personality_engine import PersonalityEngine
 # Импортируем клавиатуры
@@ -14,7 +15,7 @@ from src.utils.ban_check import check_if_banned
 
 router = Router()
 
-@router.message(Command('bonus'))
+@router.message(Command('bonus'), flags={'wallet_lock': 'reject'})
 async def cmd_bonus(message: Message):
     """Ежедневный бонус"""
     # Проверка блокировки
@@ -67,6 +68,7 @@ async def cmd_bonus(message: Message):
         await wallet_service.credit(user.id, bonus_amount, 'daily_bonus')
         user.last_bonus_claimed_at = now
         await session.commit()
+        user_cache.invalidate(telegram_id)
 
         balance = await wallet_service.get_balance(user.id)
 
@@ -85,7 +87,7 @@ async def cmd_bonus(message: Message):
         await message.answer(text)
 
 # ТЕКСТОВЫЙ ТРИГГЕР для бонуса - игнорируется в группах
-@router.message(lambda message: message.text == '🎁 Бонус')
+@router.message(lambda message: message.text == '🎁 Бонус', flags={'wallet_lock': 'reject'})
 async def trigger_bonus(message: Message):
     """Обрабатывает текстовый триггер '🎁 Бонус'"""
     # Проверяем тип чата: если группа — игнорируем (ничего не отвечаем)
@@ -144,6 +146,7 @@ async def trigger_bonus(message: Message):
         await wallet_service.credit(user.id, bonus_amount, 'daily_bonus')
         user.last_bonus_claimed_at = now
         await session.commit()
+        user_cache.invalidate(telegram_id)
 
         balance = await wallet_service.get_balance(user.id)
 
@@ -1,37 +1,50 @@
 from aiogram import Router
-from aiogram.filters import Command
+from aiogram.filters import Command, StateFilter
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
+from typing import Optional
 import asyncio
-import secrets
+import logging
 import random
+import time
 
 from src.models import User
 from src.services.wallet_service import wallet_service
 from src.services.bet_service import bet_service
-from src.services.rating_service import VIPService, CreditService, RatingService
+from src.services.user_cache import user_cache
 from src.games.slots import SlotMachine
 from src.games.dice import DiceGame
 from src.games.roulette import RouletteGame
 from src.games.mines import MinesGame
 from src.games.rocket import RocketGame
+from src.services.rocket_engine import rocket_engine, RocketRound, RocketPlayer
+from src.services.crash_chain_service import crash_chain_service
+from src.services.seed_service import seed_service
+from src.services.verification_service import verification_service
+from src.services.timer_wheel import timer_service
+from src.services.game_pipeline import (
+    GameCommandFilter,
+    GameContext,
+    GameEngine,
+    GameInputError,
+    GameOutcome,
+    GameRequest,
+    Settlement,
+    game_pipeline,
+)
 from src.config import settings
 from src.i18n.translator import translator
 from src.states import RouletteStates, SlotsStates, DiceStates, MinesStates, RocketStates
 # НОВОЕ:
 from src.services.personality_engine import PersonalityEngine
-from src.services.rating_service import RatingService, VIPService
 from src.utils.keyboards import get_games_keyboard
 from src.utils.ban_check import check_if_banned
+from src.utils.formatters import format_money
+from src.middlewares import UserContext
 
 router = Router()
-
-# Вспомогательная функция для форматирования денежных сумм
-def format_money(cents: int) -> str:
-    """Форматирует сумму в центах в строку вида '1,234.56' (в долларах)"""
-    dollars = cents / 100
-    return f"{dollars:,.2f}" # Использует запятую как разделитель тысяч и 2 знака после запятой
+logger = logging.getLogger(__name__)
 
 # Вспомогательная функция для форматирования целых чисел (например, для ставки в центах, если нужно)
 def format_number(num: int) -> str:
@@ -39,1261 +52,402 @@ def format_number(num: int) -> str:
     return f"{num:,}"
 
 
-async def process_game_result(user_id: int, stake_cents: int, win_amount: int, game_type: str):
-    """Обрабатывает результат игры: обновляет рейтинги и применяет VIP бонусы"""
-    vip_message = ""
-    credit_message = ""
-    
-    if win_amount > 0:
-        # Выигрыш - применяем VIP множитель
-        total_win, vip_message = await VIPService.apply_vip_multiplier(user_id, win_amount)
-        
-        # Автоматический возврат кредитов
-        remaining_win, credit_message = await CreditService.auto_repay_from_winnings(user_id, total_win)
-        
-        # Начисляем остаток выигрыша
-        if remaining_win > 0:
-            await wallet_service.credit(user_id, remaining_win, f"{game_type}_win")
-        
-        final_win_amount = total_win
-        
-        # Обновляем рейтинги
-        await RatingService.update_user_rating(user_id, stake_cents, final_win_amount, 'daily')
-        await RatingService.update_user_rating(user_id, stake_cents, final_win_amount, 'weekly')
-        await RatingService.update_user_rating(user_id, stake_cents, final_win_amount, 'monthly')
-        
-    else:
-        # Проигрыш - применяем VIP возврат
-        cashback_amount, vip_message = await VIPService.apply_vip_cashback(user_id, stake_cents)
-        final_win_amount = 0
-    
-    return final_win_amount, vip_message, credit_message
-
-
-# --- ОБРАБОТЧИКИ КОМАНД С ПАРАМЕТРАМИ ---
-
-@router.message(lambda message: message.text and message.text.startswith('/dice '))
-async def cmd_dice_with_stake(message: Message, state: FSMContext):
-    """Обрабатывает команду /dice с параметром ставки"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
-    
-    try:
-        # Извлекаем сумму из команды
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>/dice 20</code>")
-        return
+# --- ДВИЖКИ ИГР ДЛЯ ОБЩЕГО КОНВЕЙЕРА ---
 
-    # Проверяем пользователя
+async def bump_user_nonce(user, field: str):
+    """Увеличивает nonce игры у пользователя и сбрасывает его из кэша"""
     from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='dice',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Бот бросает
-        bot_dice = await message.answer_dice(emoji='🎲')
-        await asyncio.sleep(1)
-
-        # Игрок бросает
-        await message.answer("Твоя очередь бросать! 🎲")
-        player_dice = await message.answer_dice(emoji='🎲')
-
-        # Ждём анимацию
-        await asyncio.sleep(4)
-
-        bot_value = bot_dice.dice.value
-        player_value = player_dice.dice.value
-        
-        # Проверяем подкрутку и открутку для игрока
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - игрок всегда выигрывает
-            # Если игрок проигрывает, меняем его значение на выигрышное
-            if player_value <= bot_value:
-                player_value = bot_value + 1
-                if player_value > 6:  # Максимум 6 на кости
-                    player_value = 6
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - игрок всегда проигрывает
-            # Если игрок выигрывает, меняем его значение на проигрышное
-            if player_value > bot_value:
-                player_value = bot_value - 1
-                if player_value < 1:  # Минимум 1 на кости
-                    player_value = 1
-
-        payout = DiceGame.calculate_payout(player_value, bot_value, stake_cents)
-
-
-        
-
-
-        result_str = f"bot:{bot_value},player:{player_value}"
-
-
-        await bet_service.complete_bet(bet.id, result_str, payout)
-
-
-        
-
-
-        # Применяем VIP бонусы и обрабатываем результат
-
-
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'dice')
-
-
-        
-
-
-        new_balance = await wallet_service.get_balance(user.id)
-
-        if player_value > bot_value:
-            text = await PersonalityEngine.get_message('dice_win', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"💰 Выигрыш: <b>${format_money(final_payout)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        elif player_value == bot_value:
-            text = f"🤝 <b>НИЧЬЯ!</b>\n\n"
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"↩️ Ставка возвращена: <b>${format_money(final_payout)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        else:
-            text = await PersonalityEngine.get_message('dice_loss', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-
-
-        await message.answer(text)
-
-
-@router.message(lambda message: message.text and message.text.startswith('/slots '))
-async def cmd_slots_with_stake(message: Message):
-    """Обрабатывает команду /slots с параметром ставки"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
+    from sqlalchemy import update
     
-    try:
-        # Извлекаем сумму из команды
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>/slots 20</code>")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
+    if hasattr(User, field):
+        async with async_session_maker() as session:
+            await session.execute(
+                update(User).where(User.id == user.id).values({field: getattr(User, field) + 1})
+            )
+            await session.commit()
+    user_cache.invalidate(user.telegram_id)
 
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
 
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='slots',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
+class SlotsGameEngine(GameEngine):
+    """Слоты: 3 барабана, provably fair спин"""
+    game_type = 'slots'
+    aliases = ('слоты',)
+    usage = "<code>слоты 20</code>"
+    REVEAL_AFTER = 2.0
 
+    async def play(self, ctx: GameContext) -> GameOutcome:
         # Анимация
-        animation_msg = await message.answer("🎰 Крутим барабаны... 🤞")
-        await asyncio.sleep(2)
-
-        # Генерация результата
-        server_seed = secrets.token_hex(32)
-        client_seed = str(user.telegram_id)
-        nonce = user.slots_nonce
+        animation_msg = await ctx.message.answer("🎰 Крутим барабаны... 🤞")
 
-        symbols = SlotMachine.spin(server_seed, client_seed, nonce)
+        # Генерация результата (provably fair: активная пара сидов игрока)
+        draw = await seed_service.draw(ctx.user.id)
+        symbols = SlotMachine.symbols_from_hash(draw.hash_result)
         
         # Проверяем подкрутку и открутку
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - всегда выигрыш
-            # Генерируем выигрышную комбинацию
-            symbols = ['🍎', '🍎', '🍎']  # Три одинаковых символа = выигрыш
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - всегда проигрыш
-            # Генерируем проигрышную комбинацию
-            symbols = ['🍎', '🍊', '🍇']  # Разные символы = проигрыш
-        
-        payout = SlotMachine.calculate_payout(symbols, stake_cents)
-
-        user.slots_nonce += 1
-        await session.commit()
-
-        await bet_service.complete_bet(bet.id, ''.join(symbols), payout)
-
-        # Применяем VIP бонусы и обрабатываем результат
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'slots')
-
-        await animation_msg.delete()
+        if await is_user_rigged(ctx.message.from_user.id):
+            # Подкрутка активна - три одинаковых символа = выигрыш
+            symbols = ['🍎', '🍎', '🍎']
+        elif await is_user_unrigged(ctx.message.from_user.id):
+            # Открутка активна - разные символы = проигрыш
+            symbols = ['🍎', '🍊', '🍇']
+        
+        payout = SlotMachine.calculate_payout(symbols, ctx.stake_cents)
+        return GameOutcome(
+            result=''.join(symbols),
+            payout_cents=payout,
+            details={'symbols': symbols, 'animation_msg': animation_msg},
+            reveal_after=self.REVEAL_AFTER,
+            server_seed=draw.server_seed,
+            nonce=draw.nonce
+        )
 
-        symbols_str = ' '.join(symbols)
-        new_balance = await wallet_service.get_balance(user.id)
+    async def render(self, ctx: GameContext, outcome: GameOutcome, settlement: Settlement) -> str:
+        symbols_str = ' '.join(outcome.details['symbols'])
+        payout = outcome.payout_cents
+        stake_cents = ctx.stake_cents
+        new_balance = settlement.new_balance
 
         if payout >= stake_cents * 100:
-            text = await PersonalityEngine.get_message('jackpot', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
+            text = ctx.mention + await PersonalityEngine.get_message('jackpot', ctx.user)
             text += f"\n\n🎰 {symbols_str}\n\n"
             text += f"🤑 ТЫ СОРВАЛ КУШ: <b>${format_money(payout)}</b>!\n\n"
             text += f"Это в {format_number(payout // stake_cents)} раз больше ставки! 👑\n\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
+            text += settlement.bonus_lines()
             text += f"💵 Новый баланс: <b>${format_money(new_balance)}</b>"
-            
         elif payout > stake_cents:
             multiplier = payout / stake_cents
-            text = await PersonalityEngine.get_message('big_win', user, {'multiplier': multiplier})
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
+            text = ctx.mention + await PersonalityEngine.get_message('big_win', ctx.user, {'multiplier': multiplier})
             text += f"\n\n🎰 {symbols_str}\n\n"
             text += f"💰 Ты выиграл <b>${format_money(payout)}</b> (x{multiplier:.1f})!\n\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
+            text += settlement.bonus_lines()
             text += f"💵 Новый баланс: <b>${format_money(new_balance)}</b>"
-            
         elif payout > 0:
-            text = await PersonalityEngine.get_message('slots_partial_win', user, {'payout': format_money(payout)})
-            if 'slots_partial_win' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                text = f"😊 <b>Почти!</b>\n\n"
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"🎰 {symbols_str}\n\n"
-                text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            else:
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"\n\n🎰 {symbols_str}\n\n"
-                text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
+            text = ctx.mention + f"😊 <b>Почти!</b>\n\n"
+            text += f"🎰 {symbols_str}\n\n"
+            text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
+            text += settlement.bonus_lines()
+            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
         else:
-            text = await PersonalityEngine.get_message('slots_loss', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
+            text = ctx.mention + await PersonalityEngine.get_message('slots_loss', ctx.user)
             text += f"\n\n🎰 {symbols_str}\n\n"
             text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
+            text += settlement.bonus_lines()
             text += f"💵 Баланс: <b>${format_money(new_balance)}</b>\n\n"
             text += f"🍀 Попробуй ещё раз!"
+        return text
 
-        await message.answer(text)
-
-
-@router.message(lambda message: message.text and message.text.startswith('/roulette '))
-async def cmd_roulette_with_stake(message: Message):
-    """Обрабатывает команду /roulette с параметрами ставки и цвета/числа"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
-    
-    try:
-        # Извлекаем параметры из команды
-        parts = message.text.split(' ')
-        if len(parts) < 3:
-            await message.answer("❌ Неверный формат! Используйте: <code>/roulette 20 red</code> или <code>/roulette 20 к</code> или <code>/roulette 20 5</code>")
-            return
-        
-        stake_text = parts[1].strip()
-        bet_on = parts[2].strip().lower()
-        
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>/roulette 20 red</code> или <code>/roulette 20 к</code> или <code>/roulette 20 5</code>")
-        return
 
-    # Валидация выбора (цвет или число)
-    if bet_on.isdigit():
-        bet_type = 'number'
-        bet_value = int(bet_on)
-        if not 1 <= bet_value <= 10:
-            await message.answer("❌ Неверное число! Укажи от 1 до 10.")
-            return
-    elif bet_on in ['red', 'красное', 'r', 'к', 'крас']:
-        bet_type = 'red'
-        bet_value = RouletteGame.RED_NUMBERS
-    elif bet_on in ['black', 'чёрное', 'b', 'ч', 'черное']:
-        bet_type = 'black'
-        bet_value = RouletteGame.BLACK_NUMBERS
-    else:
-        await message.answer("❌ Неверная ставка! Используй: число (1-10), red, black, к (красное), ч (черное)")
-        return
+class DiceGameEngine(GameEngine):
+    """Кости: бросок бота против броска игрока"""
+    game_type = 'dice'
+    aliases = ('кости',)
+    usage = "<code>кости 20</code>"
+    REVEAL_AFTER = 2.0
 
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    async def play(self, ctx: GameContext) -> GameOutcome:
+        message = ctx.message
 
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
+        # Анимация (значение кубика Telegram выбирает сам, поэтому броски
+        # считаются от сидов игрока, а не через answer_dice)
+        animation_msg = await message.answer("🎲 Бросаем кости... 🤞")
 
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
+        draw = await seed_service.draw(ctx.user.id)
+        bot_value, player_value = DiceGame.values_from_hash(draw.hash_result)
+        
+        # Проверяем подкрутку и открутку для игрока
+        if await is_user_rigged(message.from_user.id):
+            # Подкрутка активна - если игрок проигрывает, меняем его значение на выигрышное
+            if player_value <= bot_value:
+                player_value = min(bot_value + 1, 6)
+        elif await is_user_unrigged(message.from_user.id):
+            # Открутка активна - если игрок выигрывает, меняем его значение на проигрышное
+            if player_value > bot_value:
+                player_value = max(bot_value - 1, 1)
+
+        payout = DiceGame.calculate_payout(player_value, bot_value, ctx.stake_cents)
+        return GameOutcome(
+            result=f"bot:{bot_value},player:{player_value}",
+            payout_cents=payout,
+            details={'bot_value': bot_value, 'player_value': player_value, 'animation_msg': animation_msg},
+            reveal_after=self.REVEAL_AFTER,
+            server_seed=draw.server_seed,
+            nonce=draw.nonce
+        )
 
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
+    async def render(self, ctx: GameContext, outcome: GameOutcome, settlement: Settlement) -> str:
+        bot_value = outcome.details['bot_value']
+        player_value = outcome.details['player_value']
 
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='roulette',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
+        if player_value > bot_value:
+            text = ctx.mention + await PersonalityEngine.get_message('dice_win', ctx.user)
+            text += f"\n\n🤖 Бот: {bot_value}\n"
+            text += f"👤 Ты: {player_value}\n\n"
+            text += f"💰 Выигрыш: <b>${format_money(settlement.final_payout)}</b>\n"
+            text += settlement.bonus_lines()
+        elif player_value == bot_value:
+            text = ctx.mention + f"🤝 <b>НИЧЬЯ!</b>\n\n"
+            text += f"🤖 Бот: {bot_value}\n"
+            text += f"👤 Ты: {player_value}\n\n"
+            text += f"↩️ Ставка возвращена: <b>${format_money(settlement.final_payout)}</b>\n"
+            text += settlement.bonus_lines()
+        else:
+            text = ctx.mention + await PersonalityEngine.get_message('dice_loss', ctx.user)
+            text += f"\n\n🤖 Бот: {bot_value}\n"
+            text += f"👤 Ты: {player_value}\n\n"
+            text += f"💸 Потеряно: <b>${format_money(ctx.stake_cents)}</b>\n"
+            text += settlement.bonus_lines(with_credit=False)
+        text += f"💵 Баланс: <b>${format_money(settlement.new_balance)}</b>"
+        return text
+
+
+class RouletteGameEngine(GameEngine):
+    """Мини-рулетка 1-10: число (x3) или цвет (x1.8)"""
+    game_type = 'roulette'
+    aliases = ('рулетка',)
+    usage = "<code>рулетка 20 red</code> или <code>рулетка 20 к</code> или <code>рулетка 20 5</code>"
+    REVEAL_AFTER = 2.5
+
+    RED_ALIASES = frozenset(['red', 'красное', 'r', 'к', 'крас'])
+    BLACK_ALIASES = frozenset(['black', 'чёрное', 'b', 'ч', 'черное'])
+
+    def parse_options(self, args):
+        if not args:
+            raise GameInputError(f"❌ Неверный формат! Используйте: {self.usage}")
+        return self.parse_choice(args[0])
+
+    @classmethod
+    def parse_choice(cls, bet_on: str) -> dict:
+        """Выбор игрока (число или цвет) -> bet_type/bet_value"""
+        bet_on = bet_on.strip().lower()
+        if bet_on.isdigit():
+            bet_value = int(bet_on)
+            if not 1 <= bet_value <= 10:
+                raise GameInputError("❌ Неверное число! Укажи от 1 до 10.")
+            return {'bet_type': 'number', 'bet_value': bet_value}
+        if bet_on in cls.RED_ALIASES:
+            return {'bet_type': 'red', 'bet_value': RouletteGame.RED_NUMBERS}
+        if bet_on in cls.BLACK_ALIASES:
+            return {'bet_type': 'black', 'bet_value': RouletteGame.BLACK_NUMBERS}
+        raise GameInputError("❌ Неверная ставка! Используй: число (1-10), red, black, к (красное), ч (черное)")
+
+    @staticmethod
+    def rigged_number(bet_type: str, bet_value, win: bool) -> int:
+        """Число для подкрутки (win=True) или открутки (win=False)"""
+        red = [1, 3, 5, 7, 9]
+        black = [2, 4, 6, 8, 10]
+        if bet_type == "red":
+            return random.choice(red if win else black)
+        if bet_type == "black":
+            return random.choice(black if win else red)
+        if bet_type == "number":
+            return bet_value if win else random.choice([x for x in range(1, 11) if x != bet_value])
+        return random.randint(1, 10)
+
+    async def play(self, ctx: GameContext) -> GameOutcome:
+        bet_type = ctx.options['bet_type']
+        bet_value = ctx.options['bet_value']
 
         # Анимация
         try:
-            animation_msg = await message.answer("🎰 Рулетка крутится... 🌀")
+            animation_msg = await ctx.message.answer("🎰 Рулетка крутится... 🌀")
         except Exception:
             # Если не удалось отправить анимацию из-за flood control, продолжаем без неё
             animation_msg = None
-        await asyncio.sleep(2.5)
 
-        # Результат (случайное число от 1 до 10)
-        # Проверяем подкрутку и открутку
-        is_rigged = await is_user_rigged(message.from_user.id)
-        is_unrigged = await is_user_unrigged(message.from_user.id)
-        
-        print(f"DEBUG: User {message.from_user.id}, bet_type: {bet_type}, is_rigged: {is_rigged}, is_unrigged: {is_unrigged}")
+        draw = await seed_service.draw(ctx.user.id)
         
-        if is_rigged:
-            # Подкрутка активна - всегда выигрыш
-            if bet_type == "red":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Красные числа
-            elif bet_type == "black":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Черные числа
-            elif bet_type == "number":
-                result_number = bet_value  # Точно выбранное число
-            elif bet_type == "even":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Четные числа
-            elif bet_type == "odd":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Нечетные числа
-            elif bet_type == "high":
-                result_number = random.choice([6, 7, 8, 9, 10])  # Высокие числа
-            elif bet_type == "low":
-                result_number = random.choice([1, 2, 3, 4, 5])  # Низкие числа
-            else:
-                # Для любых других ставок - выбираем выигрышное число
-                result_number = random.choice([1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
-        elif is_unrigged:
-            # Открутка активна - всегда проигрыш
-            if bet_type == "red":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Черные числа
-            elif bet_type == "black":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Красные числа
-            elif bet_type == "number":
-                result_number = random.choice([x for x in range(1, 11) if x != bet_value])  # Любое другое число
-            elif bet_type == "even":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Нечетные числа
-            elif bet_type == "odd":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Четные числа
-            elif bet_type == "high":
-                result_number = random.choice([1, 2, 3, 4, 5])  # Низкие числа
-            elif bet_type == "low":
-                result_number = random.choice([6, 7, 8, 9, 10])  # Высокие числа
-            else:
-                # Для любых других ставок - выбираем проигрышное число
-                result_number = random.choice([1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+        # Проверяем подкрутку и открутку
+        if await is_user_rigged(ctx.message.from_user.id):
+            result_number = self.rigged_number(bet_type, bet_value, win=True)
+        elif await is_user_unrigged(ctx.message.from_user.id):
+            result_number = self.rigged_number(bet_type, bet_value, win=False)
         else:
-            result_number = RouletteGame.spin()
-        
-        print(f"DEBUG: Final result_number: {result_number}")
+            result_number = RouletteGame.number_from_hash(draw.hash_result)
         
         result_color = RouletteGame.get_color(result_number)
 
         # Рассчитываем выплату на основе выбора игрока
-        payout = RouletteGame.calculate_payout(bet_type, bet_value, result_number, stake_cents)
-
-        result_str = f"number:{result_number},color:{result_color}"
-        await bet_service.complete_bet(bet.id, result_str, payout)
-
-        # Применяем VIP бонусы и обрабатываем результат
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'roulette')
-
-        await animation_msg.delete()
+        payout = RouletteGame.calculate_payout(bet_type, bet_value, result_number, ctx.stake_cents)
+        return GameOutcome(
+            result=f"number:{result_number},color:{result_color}",
+            payout_cents=payout,
+            details={
+                'number': result_number,
+                'color': result_color,
+                'animation_msg': animation_msg
+            },
+            reveal_after=self.REVEAL_AFTER,
+            server_seed=draw.server_seed,
+            nonce=draw.nonce
+        )
 
-        color_emoji = '🔴' if result_color == 'red' else '⚫'
-        new_balance = await wallet_service.get_balance(user.id)
+    async def render(self, ctx: GameContext, outcome: GameOutcome, settlement: Settlement) -> str:
+        color_emoji = '🔴' if outcome.details['color'] == 'red' else '⚫'
+        result_number = outcome.details['number']
 
-        if final_payout > 0:
-            multiplier = final_payout / stake_cents
-            text = await PersonalityEngine.get_message('big_win', user, {'multiplier': multiplier})
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
+        if settlement.final_payout > 0:
+            multiplier = settlement.final_payout / ctx.stake_cents
+            text = ctx.mention + await PersonalityEngine.get_message('big_win', ctx.user, {'multiplier': multiplier})
             text += f"\n\n🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-            text += f"💰 Выигрыш: <b>${format_money(final_payout)}</b> (x{multiplier:.1f})\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
+            text += f"💰 Выигрыш: <b>${format_money(settlement.final_payout)}</b> (x{multiplier:.1f})\n"
         else:
-            text = await PersonalityEngine.get_message('roulette_loss', user)
-            if 'roulette_loss' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                text = f"💔 <b>Не угадал...</b>\n\n"
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-                text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            
-            else:
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"\n\n🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-                text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-
-        await message.answer(text)
-
-
-# --- РУССКИЕ КОМАНДЫ С ПАРАМЕТРАМИ ---
-
-# /рулетка - вызываем текстовый обработчик без слэша
-@router.message(lambda message: message.text and message.text.startswith('/рулетка '))
-async def cmd_roulette_ru_with_stake(message: Message):
-    """Обрабатывает русскую команду /рулетка с параметрами"""
-    # Убираем слэш и вызываем текстовый обработчик
-    text_without_slash = message.text[1:]  # Убираем первый символ (/)
-    # Создаем временный объект для передачи в обработчик
-    import types
-    temp_msg = types.SimpleNamespace()
-    temp_msg.text = text_without_slash
-    temp_msg.from_user = message.from_user
-    temp_msg.chat = message.chat
-    temp_msg.answer = message.answer
-    temp_msg.answer_dice = message.answer_dice
-    await text_roulette_with_params(temp_msg)
-
-# /слоты - вызываем текстовый обработчик без слэша
-@router.message(lambda message: message.text and message.text.startswith('/слоты '))
-async def cmd_slots_ru_with_stake(message: Message):
-    """Обрабатывает русскую команду /слоты с параметром ставки"""
-    text_without_slash = message.text[1:]
-    import types
-    temp_msg = types.SimpleNamespace()
-    temp_msg.text = text_without_slash
-    temp_msg.from_user = message.from_user
-    temp_msg.chat = message.chat
-    temp_msg.answer = message.answer
-    await text_slots_with_params(temp_msg)
-
-# /кости - вызываем текстовый обработчик без слэша
-@router.message(lambda message: message.text and message.text.startswith('/кости '))
-async def cmd_dice_ru_with_stake(message: Message, state: FSMContext):
-    """Обрабатывает русскую команду /кости с параметром ставки"""
-    text_without_slash = message.text[1:]
-    import types
-    temp_msg = types.SimpleNamespace()
-    temp_msg.text = text_without_slash
-    temp_msg.from_user = message.from_user
-    temp_msg.chat = message.chat
-    temp_msg.answer = message.answer
-    temp_msg.answer_dice = message.answer_dice
-    await text_dice_with_params(temp_msg, state)
-
-# /мины - вызываем текстовый обработчик без слэша
-@router.message(lambda message: message.text and message.text.startswith('/мины '))
-async def cmd_mines_ru_with_stake(message: Message, state: FSMContext):
-    """Обрабатывает русскую команду /мины с параметром ставки"""
-    text_without_slash = message.text[1:]
-    import types
-    temp_msg = types.SimpleNamespace()
-    temp_msg.text = text_without_slash
-    temp_msg.from_user = message.from_user
-    temp_msg.chat = message.chat
-    temp_msg.answer = message.answer
-    await text_mines_with_params(temp_msg, state)
-
-
-# --- ТЕКСТОВЫЕ КОМАНДЫ БЕЗ СЛЭША (для групп и ЛС) ---
-
-# рулетка [ставка] [цвет/число]
-@router.message(lambda message: message.text and message.text.lower().startswith('рулетка '))
-async def text_roulette_with_params(message: Message):
-    """Обрабатывает текстовую команду 'рулетка [ставка] [цвет/число]' без слэша"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
-    
-    try:
-        # Парсим параметры напрямую
-        parts = message.text.split(' ')
-        if len(parts) < 3:
-            await message.answer("❌ Неверный формат! Используйте: <code>рулетка 20 red</code> или <code>рулетка 20 к</code> или <code>рулетка 20 5</code>")
-            return
-        
-        stake_text = parts[1].strip()
-        bet_on = parts[2].strip().lower()
-        
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>рулетка 20 red</code> или <code>рулетка 20 к</code> или <code>рулетка 20 5</code>")
-        return
-
-    # Валидация выбора (цвет или число)
-    if bet_on.isdigit():
-        bet_type = 'number'
-        bet_value = int(bet_on)
-        if not 1 <= bet_value <= 10:
-            await message.answer("❌ Неверное число! Укажи от 1 до 10.")
-            return
-    elif bet_on in ['red', 'красное', 'r', 'к', 'крас']:
-        bet_type = 'red'
-        bet_value = RouletteGame.RED_NUMBERS
-    elif bet_on in ['black', 'чёрное', 'b', 'ч', 'черное']:
-        bet_type = 'black'
-        bet_value = RouletteGame.BLACK_NUMBERS
-    else:
-        await message.answer("❌ Неверная ставка! Используй: число (1-10), red, black, к (красное), ч (черное)")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+            text = ctx.mention + f"💔 <b>Не угадал...</b>\n\n"
+            text += f"🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
+            text += f"💸 Потеряно: <b>${format_money(ctx.stake_cents)}</b>\n"
+        text += settlement.bonus_lines()
+        text += f"💵 Баланс: <b>${format_money(settlement.new_balance)}</b>"
+        return text
 
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
 
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='roulette',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
+class MinesGameEngine(GameEngine):
+    """Мины: поле 5x5, игра продолжается в callback'ах mines_*"""
+    game_type = 'mines'
+    aliases = ('мины',)
+    usage = "<code>мины 20</code>"
 
-        # Анимация
-        try:
-            animation_msg = await message.answer("🎰 Рулетка крутится... 🌀")
-        except Exception:
-            # Если не удалось отправить анимацию из-за flood control, продолжаем без неё
-            animation_msg = None
-        await asyncio.sleep(2.5)
+    async def play(self, ctx: GameContext) -> None:
+        user = ctx.user
 
-        # Результат (случайное число от 1 до 10)
-        # Проверяем подкрутку и открутку
-        is_rigged = await is_user_rigged(message.from_user.id)
-        is_unrigged = await is_user_unrigged(message.from_user.id)
-        
-        print(f"DEBUG: User {message.from_user.id}, bet_type: {bet_type}, is_rigged: {is_rigged}, is_unrigged: {is_unrigged}")
-        
-        if is_rigged:
-            # Подкрутка активна - всегда выигрыш
-            if bet_type == "red":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Красные числа
-            elif bet_type == "black":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Черные числа
-            elif bet_type == "number":
-                result_number = bet_value  # Точно выбранное число
-            elif bet_type == "even":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Четные числа
-            elif bet_type == "odd":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Нечетные числа
-            elif bet_type == "high":
-                result_number = random.choice([6, 7, 8, 9, 10])  # Высокие числа
-            elif bet_type == "low":
-                result_number = random.choice([1, 2, 3, 4, 5])  # Низкие числа
-            else:
-                # Для любых других ставок - выбираем выигрышное число
-                result_number = random.choice([1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
-        elif is_unrigged:
-            # Открутка активна - всегда проигрыш
-            if bet_type == "red":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Черные числа
-            elif bet_type == "black":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Красные числа
-            elif bet_type == "number":
-                result_number = random.choice([x for x in range(1, 11) if x != bet_value])  # Любое другое число
-            elif bet_type == "even":
-                result_number = random.choice([1, 3, 5, 7, 9])  # Нечетные числа
-            elif bet_type == "odd":
-                result_number = random.choice([2, 4, 6, 8, 10])  # Четные числа
-            elif bet_type == "high":
-                result_number = random.choice([1, 2, 3, 4, 5])  # Низкие числа
-            elif bet_type == "low":
-                result_number = random.choice([6, 7, 8, 9, 10])  # Высокие числа
-            else:
-                # Для любых других ставок - выбираем проигрышное число
-                result_number = random.choice([1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
-        else:
-            result_number = RouletteGame.spin()
+        # Генерируем мины
+        mines = MinesGame.generate_mines(user.id, getattr(user, 'mines_nonce', 0))
         
-        print(f"DEBUG: Final result_number: {result_number}")
+        # Проверяем подкрутку и открутку
+        if await is_user_rigged(ctx.message.from_user.id):
+            # Подкрутка активна - убираем все мины (игрок всегда выигрывает)
+            mines = []
+        elif await is_user_unrigged(ctx.message.from_user.id):
+            # Открутка активна - все 25 клеток - мины (игрок всегда проигрывает)
+            mines = list(range(25))
         
-        result_color = RouletteGame.get_color(result_number)
-
-        # Рассчитываем выплату на основе выбора игрока
-        payout = RouletteGame.calculate_payout(bet_type, bet_value, result_number, stake_cents)
-
-        result_str = f"number:{result_number},color:{result_color}"
-        await bet_service.complete_bet(bet.id, result_str, payout)
-
-        # Применяем VIP бонусы и обрабатываем результат
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'roulette')
-
-        await animation_msg.delete()
+        await bump_user_nonce(user, 'mines_nonce')
 
-        color_emoji = '🔴' if result_color == 'red' else '⚫'
-        new_balance = await wallet_service.get_balance(user.id)
+        # Сохраняем данные игры в состоянии
+        await ctx.state.update_data(
+            bet_id=ctx.bet_id,
+            stake_cents=ctx.stake_cents,
+            mines=mines,
+            opened_cells=[],
+            moves_count=0,
+            user_id=user.id
+        )
+        await ctx.state.set_state(MinesStates.playing)
 
-        if final_payout > 0:
-            multiplier = final_payout / stake_cents
-            text = await PersonalityEngine.get_message('big_win', user, {'multiplier': multiplier})
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-            text += f"💰 Выигрыш: <b>${format_money(final_payout)}</b> (x{multiplier:.1f})\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
+        # Отправляем сообщение с игрой
+        if ctx.is_group:
+            text = f"{ctx.mention}вы начали игру минное поле!\n\n"
         else:
-            text = await PersonalityEngine.get_message('roulette_loss', user)
-            if 'roulette_loss' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                text = f"💔 <b>Не угадал...</b>\n\n"
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-                text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            
-            else:
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"\n\n🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-                text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-
-        await message.answer(text)
+            text = f"💣 <b>Мины</b>\n\n"
+        text += f"💰 Ставка: ${format_money(ctx.stake_cents)}\n\n"
+        text += "Выберите клетку для открытия:"
 
-# слоты [ставка]
-@router.message(lambda message: message.text and message.text.lower().startswith('слоты '))
-async def text_slots_with_params(message: Message):
-    """Обрабатывает текстовую команду 'слоты [ставка]' без слэша"""
+        game_msg = await ctx.message.answer(text, reply_markup=create_mines_keyboard())
+        await schedule_mines_timeout(
+            ctx.bet_id,
+            ctx.stake_cents,
+            0,
+            game_msg.chat.id,
+            game_msg.message_id,
+            ctx.message.from_user.username or ctx.message.from_user.first_name
+        )
+        return None
+
+
+class RocketGameEngine(GameEngine):
+    """Ракетка: ставка добавляется в общий раунд чата (rocket_engine)"""
+    game_type = 'rocket'
+    aliases = ('ракетка',)
+    usage = "<code>ракетка 20</code>"
+
+    async def precheck(self, ctx: GameContext):
+        # В общий раунд можно поставить только один раз
+        if rocket_engine.is_in_betting_round(ctx.message.chat.id, ctx.message.from_user.id):
+            return "❌ Вы уже участвуете в этом раунде"
+        return None
+
+    async def play(self, ctx: GameContext) -> None:
+        await start_rocket_game(ctx.message, ctx.state, ctx.bet_id, ctx.stake_cents, ctx.user)
+        return None
+
+
+game_pipeline.register(SlotsGameEngine())
+game_pipeline.register(DiceGameEngine())
+game_pipeline.register(RouletteGameEngine())
+game_pipeline.register(MinesGameEngine())
+game_pipeline.register(RocketGameEngine())
+
+# Состояние ввода ставки -> игра
+STAKE_STATES = {
+    SlotsStates.choosing_stake.state: 'slots',
+    DiceStates.choosing_stake.state: 'dice',
+    MinesStates.choosing_stake.state: 'mines',
+    RocketStates.choosing_stake.state: 'rocket',
+}
+
+
+# --- ИГРЫ СО СТАВКОЙ В КОМАНДЕ ---
+# /slots 20, /слоты 20, слоты 20, /dice 20, кости 20, рулетка 20 к, мины 20, ракетка 20 ...
+
+@router.message(GameCommandFilter(game_pipeline), flags={'wallet_lock': 'reject'})
+async def play_game_command(
+    message: Message,
+    state: FSMContext,
+    game_request: GameRequest,
+    user_context: Optional[UserContext] = None
+):
+    """Запускает игру по команде со ставкой (со слэшем и без, на русском и английском)"""
     # Проверка блокировки
     if await check_if_banned(message):
         return
     
-    try:
-        # Парсим параметры напрямую
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>слоты 20</code>")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='slots',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Анимация
-        animation_msg = await message.answer("🎰 Крутим барабаны... 🤞")
-        await asyncio.sleep(2)
-
-        # Генерация результата
-        server_seed = secrets.token_hex(32)
-        client_seed = str(user.telegram_id)
-        nonce = user.slots_nonce
-
-        symbols = SlotMachine.spin(server_seed, client_seed, nonce)
-        
-        # Проверяем подкрутку и открутку
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - всегда выигрыш
-            # Генерируем выигрышную комбинацию
-            symbols = ['🍎', '🍎', '🍎']  # Три одинаковых символа = выигрыш
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - всегда проигрыш
-            # Генерируем проигрышную комбинацию
-            symbols = ['🍎', '🍊', '🍇']  # Разные символы = проигрыш
-        
-        payout = SlotMachine.calculate_payout(symbols, stake_cents)
-
-        user.slots_nonce += 1
-        await session.commit()
-
-        await bet_service.complete_bet(bet.id, ''.join(symbols), payout)
-
-        # Применяем VIP бонусы и обрабатываем результат
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'slots')
-
-        await animation_msg.delete()
-
-        symbols_str = ' '.join(symbols)
-        new_balance = await wallet_service.get_balance(user.id)
-
-        if payout >= stake_cents * 100:
-            text = await PersonalityEngine.get_message('jackpot', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🎰 {symbols_str}\n\n"
-            text += f"🤑 ТЫ СОРВАЛ КУШ: <b>${format_money(payout)}</b>!\n\n"
-            text += f"Это в {format_number(payout // stake_cents)} раз больше ставки! 👑\n\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Новый баланс: <b>${format_money(new_balance)}</b>"
-            
-        elif payout > stake_cents:
-            multiplier = payout / stake_cents
-            text = await PersonalityEngine.get_message('big_win', user, {'multiplier': multiplier})
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🎰 {symbols_str}\n\n"
-            text += f"💰 Ты выиграл <b>${format_money(payout)}</b> (x{multiplier:.1f})!\n\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Новый баланс: <b>${format_money(new_balance)}</b>"
-            
-        elif payout > 0:
-            text = await PersonalityEngine.get_message('slots_partial_win', user, {'payout': format_money(payout)})
-            if 'slots_partial_win' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                text = f"😊 <b>Почти!</b>\n\n"
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"🎰 {symbols_str}\n\n"
-                text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            else:
-                # Добавляем упоминание пользователя в группах
-                if message.chat.type in ['group', 'supergroup']:
-                    text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-                text += f"\n\n🎰 {symbols_str}\n\n"
-                text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        else:
-            text = await PersonalityEngine.get_message('slots_loss', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🎰 {symbols_str}\n\n"
-            text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>\n\n"
-            text += f"🍀 Попробуй ещё раз!"
-
-        await message.answer(text)
-
-# кости [ставка]
-@router.message(lambda message: message.text and message.text.lower().startswith('кости '))
-async def text_dice_with_params(message: Message, state: FSMContext):
-    """Обрабатывает текстовую команду 'кости [ставка]' без слэша"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
-    
-    try:
-        # Парсим параметры напрямую
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>кости 20</code>")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='dice',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Бот бросает
-        bot_dice = await message.answer_dice(emoji='🎲')
-        await asyncio.sleep(1)
-
-        # Игрок бросает
-        await message.answer("Твоя очередь бросать! 🎲")
-        player_dice = await message.answer_dice(emoji='🎲')
-
-        # Ждём анимацию
-        await asyncio.sleep(4)
-
-        bot_value = bot_dice.dice.value
-        player_value = player_dice.dice.value
-        
-        # Проверяем подкрутку и открутку для игрока
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - игрок всегда выигрывает
-            # Если игрок проигрывает, меняем его значение на выигрышное
-            if player_value <= bot_value:
-                player_value = bot_value + 1
-                if player_value > 6:  # Максимум 6 на кости
-                    player_value = 6
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - игрок всегда проигрывает
-            # Если игрок выигрывает, меняем его значение на проигрышное
-            if player_value > bot_value:
-                player_value = bot_value - 1
-                if player_value < 1:  # Минимум 1 на кости
-                    player_value = 1
-
-        payout = DiceGame.calculate_payout(player_value, bot_value, stake_cents)
-
-
-        
-
-
-        result_str = f"bot:{bot_value},player:{player_value}"
-
-
-        await bet_service.complete_bet(bet.id, result_str, payout)
-
-
-        
-
-
-        # Применяем VIP бонусы и обрабатываем результат
-
-
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'dice')
-
-
-        
-
-
-        new_balance = await wallet_service.get_balance(user.id)
-
-        if player_value > bot_value:
-            text = await PersonalityEngine.get_message('dice_win', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"💰 Выигрыш: <b>${format_money(final_payout)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        elif player_value == bot_value:
-            text = f"🤝 <b>НИЧЬЯ!</b>\n\n"
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"↩️ Ставка возвращена: <b>${format_money(final_payout)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            if credit_message:
-                text += f"{credit_message}\n"
-        else:
-            text = await PersonalityEngine.get_message('dice_loss', user)
-            # Добавляем упоминание пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                text = f"@{message.from_user.username or message.from_user.first_name}, " + text
-            text += f"\n\n🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-
-        await message.answer(text)
-
-# мины [ставка]
-@router.message(lambda message: message.text and message.text.lower().startswith('мины '))
-async def text_mines_with_params(message: Message, state: FSMContext):
-    """Обрабатывает текстовую команду 'мины [ставка]' без слэша"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
-    
-    try:
-        # Парсим параметры напрямую
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>мины 20</code>")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='mines',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Генерируем мины
-        mines_nonce = getattr(user, 'mines_nonce', 0)
-        mines = MinesGame.generate_mines(user.id, mines_nonce)
-        
-        # Проверяем подкрутку и открутку
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - убираем все мины (игрок всегда выигрывает)
-            mines = []
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - добавляем мины во все клетки (игрок всегда проигрывает)
-            mines = list(range(25))  # Все 25 клеток - мины
-        
-        if hasattr(user, 'mines_nonce'):
-            user.mines_nonce += 1
-        await session.commit()
-
-        # Создаем клавиатуру 5x5
-        keyboard = create_mines_keyboard()
-
-        # Сохраняем данные игры в состоянии
-        await state.update_data(
-            bet_id=bet.id,
-            stake_cents=stake_cents,
-            mines=mines,
-            opened_cells=[],
-            moves_count=0,
-            user_id=user.id
-        )
-        await state.set_state(MinesStates.playing)
-
-        # Отправляем сообщение с игрой
-        if message.chat.type in ['group', 'supergroup']:
-            username = message.from_user.username or message.from_user.first_name
-            text = f"@{username}, вы начали игру минное поле!\n\n"
-        else:
-            text = f"💣 <b>Мины</b>\n\n"
-        text += f"💰 Ставка: ${format_money(stake_cents)}\n\n"
-        text += "Выберите клетку для открытия:"
-
-        await message.answer(text, reply_markup=keyboard)
+    await game_pipeline.run(
+        message,
+        game_request.engine,
+        game_request.stake_text,
+        game_request.args,
+        state=state,
+        user_context=user_context
+    )
 
 
 # --- ОБРАБОТЧИК ЧИСЛОВЫХ СООБЩЕНИЙ ДЛЯ ГРУПП ---
-@router.message(lambda message: message.text and message.text.replace('.', '').replace(',', '').isdigit())
-async def handle_numeric_messages(message: Message, state: FSMContext):
+@router.message(lambda message: message.text and message.text.replace('.', '').replace(',', '').isdigit(), flags={'wallet_lock': 'reject'})
+async def handle_numeric_messages(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Обрабатывает числовые сообщения в группах для игр"""
     # Отладочная информация
     current_state = await state.get_state()
-    print(f"DEBUG: Numeric message '{message.text}' from user {message.from_user.id} in chat {message.chat.id}")
-    print(f"DEBUG: Current FSM state: {current_state}")
+    logger.debug(
+        f"Numeric message '{message.text}' from user {message.from_user.id} "
+        f"in chat {message.chat.id}, state={current_state}"
+    )
     
     # Если пользователь в состоянии админ-панели - пропускаем, чтобы обработчики админки сработали
     if current_state and current_state.startswith('AdminStates:'):
-        print(f"DEBUG: User in admin state, skipping numeric handler")
+        logger.debug("User in admin state, skipping numeric handler")
         return
     
     # Проверяем, есть ли у пользователя активное состояние FSM
-    if current_state == DiceStates.choosing_stake:
-        print(f"DEBUG: Processing dice stake for user {message.from_user.id}")
-        # Если пользователь в состоянии выбора ставки для костей
-        await process_dice_stake(message, state)
-    elif current_state == SlotsStates.choosing_stake:
-        print(f"DEBUG: Processing slots stake for user {message.from_user.id}")
-        # Если пользователь в состоянии выбора ставки для слотов
-        await process_slots_stake(message, state)
+    if current_state in STAKE_STATES:
+        # Ввод ставки для слотов, костей, мин или ракетки
+        await process_game_stake(message, state, user_context)
     elif current_state == RouletteStates.choosing_stake:
-        print(f"DEBUG: Processing roulette stake for user {message.from_user.id}")
         # Если пользователь в состоянии выбора ставки для рулетки
-        await process_roulette_stake(message, state)
+        await process_roulette_stake(message, state, user_context)
     elif current_state == RouletteStates.choosing_bet:
-        print(f"DEBUG: Processing roulette bet for user {message.from_user.id}")
         # Если пользователь в состоянии выбора ставки в рулетке
-        await process_roulette_choice(message, state)
-    elif current_state == MinesStates.choosing_stake:
-        print(f"DEBUG: Processing mines stake for user {message.from_user.id}")
-        # Если пользователь в состоянии выбора ставки для мины
-        await process_mines_stake(message, state)
-    elif current_state == RocketStates.choosing_stake:
-        # Если пользователь в состоянии выбора ставки для ракетки
-        await process_rocket_stake(message, state)
+        await process_roulette_choice(message, state, user_context)
     else:
-        print(f"DEBUG: No active FSM state for user {message.from_user.id}, ignoring message")
+        logger.debug(f"No active FSM state for user {message.from_user.id}, ignoring message")
 
 
 # --- /slots (и 🎰 Слоты как текстовый триггер) ---
 
 @router.message(Command('slots'))
-async def cmd_slots(message: Message, state: FSMContext):
+async def cmd_slots(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Запрашивает ставку для слотов через команду /slots"""
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    # Пользователь уже загружен middleware (или берётся из user_cache)
+    if await game_pipeline.get_user(message, user_context) is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     # Проверяем тип чата
     if message.chat.type in ['group', 'supergroup']:
@@ -1315,7 +469,7 @@ async def cmd_slots(message: Message, state: FSMContext):
 
 # ТЕКСТОВЫЙ ТРИГГЕР для слотов - игнорируется в группах
 @router.message(lambda message: message.text == '🎰 Слоты')
-async def trigger_slots(message: Message, state: FSMContext):
+async def trigger_slots(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Обрабатывает текстовый триггер '🎰 Слоты'"""
     # Проверяем тип чата: если группа — игнорируем (ничего не отвечаем)
     if message.chat.type in ['group', 'supergroup']:
@@ -1326,15 +480,10 @@ async def trigger_slots(message: Message, state: FSMContext):
     if await check_if_banned(message):
         return
     
-    # Если ЛС - выполняем ту же логику, что и для команды
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    # Пользователь уже загружен middleware (или берётся из user_cache)
+    if await game_pipeline.get_user(message, user_context) is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     await state.clear()
     await message.answer("🎰 <b>Слоты</b>\nВведите сумму ставки (например, 10):")
@@ -1344,19 +493,12 @@ async def trigger_slots(message: Message, state: FSMContext):
 # --- /dice (и 🎲 Кости как текстовый триггер) ---
 
 @router.message(Command('dice'))
-async def cmd_dice(message: Message, state: FSMContext):
+async def cmd_dice(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Запрашивает ставку для костей через команду /dice"""
-    print(f"DEBUG: cmd_dice called for user {message.from_user.id} in chat {message.chat.id}")
-    
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    # Пользователь уже загружен middleware (или берётся из user_cache)
+    if await game_pipeline.get_user(message, user_context) is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     # Проверяем тип чата
     if message.chat.type in ['group', 'supergroup']:
@@ -1373,13 +515,12 @@ async def cmd_dice(message: Message, state: FSMContext):
     else:
         # В ЛС - интерактивный режим (как было)
         await state.clear()
-        print(f"DEBUG: Setting DiceStates.choosing_stake for user {message.from_user.id} in chat {message.chat.id}")
         await message.answer("🎲 <b>Дуэль на костях</b>\nВведите сумму ставки (например, 20):")
         await state.set_state(DiceStates.choosing_stake)
 
 # ТЕКСТОВЫЙ ТРИГГЕР для костей - игнорируется в группах
 @router.message(lambda message: message.text == '🎲 Кости')
-async def trigger_dice(message: Message, state: FSMContext):
+async def trigger_dice(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Обрабатывает текстовый триггер '🎲 Кости'"""
     # Проверяем тип чата: если группа — игнорируем (ничего не отвечаем)
     if message.chat.type in ['group', 'supergroup']:
@@ -1390,15 +531,10 @@ async def trigger_dice(message: Message, state: FSMContext):
     if await check_if_banned(message):
         return
     
-    # Если ЛС - выполняем ту же логику, что и для команды
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    # Пользователь уже загружен middleware (или берётся из user_cache)
+    if await game_pipeline.get_user(message, user_context) is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     await state.clear()
     await message.answer("🎲 <b>Дуэль на костях</b>\nВведите сумму ставки (например, 20):")
@@ -1408,17 +544,12 @@ async def trigger_dice(message: Message, state: FSMContext):
 # --- /roulette (и ♠️ Рулетка как текстовый триггер) ---
 
 @router.message(Command('roulette'))
-async def cmd_roulette(message: Message, state: FSMContext):
+async def cmd_roulette(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Запрашивает ставку для рулетки через команду /roulette"""
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    # Пользователь уже загружен middleware (или берётся из user_cache)
+    if await game_pipeline.get_user(message, user_context) is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     # Проверяем тип чата
     if message.chat.type in ['group', 'supergroup']:
@@ -1445,7 +576,7 @@ async def cmd_roulette(message: Message, state: FSMContext):
 
 # ТЕКСТОВЫЙ ТРИГГЕР для рулетки - игнорируется в группах
 @router.message(lambda message: message.text == '♠️ Рулетка')
-async def trigger_roulette(message: Message, state: FSMContext):
+async def trigger_roulette(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Обрабатывает текстовый триггер '♠️ Рулетка'"""
     # Проверяем тип чата: если группа — игнорируем (ничего не отвечаем)
     if message.chat.type in ['group', 'supergroup']:
@@ -1454,736 +585,102 @@ async def trigger_roulette(message: Message, state: FSMContext):
     
     # Проверка блокировки
     if await check_if_banned(message):
-        return
-    
-    # Если ЛС - выполняем ту же логику, что и для команды
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-    await state.clear()
-    await message.answer("♠️ <b>Мини-рулетка</b>\nВведите сумму ставки (например, 20):")
-    await state.set_state(RouletteStates.choosing_stake)
-
-
-# --- РУССКИЕ КОМАНДЫ ДЛЯ ЛИЧНЫХ СООБЩЕНИЙ ---
-
-@router.message(Command('слоты'))
-async def cmd_slots_ru(message: Message, state: FSMContext):
-    """Русская команда /слоты для ЛС"""
-    await cmd_slots(message, state)
-
-@router.message(Command('кости'))
-async def cmd_dice_ru(message: Message, state: FSMContext):
-    """Русская команда /кости для ЛС"""
-    await cmd_dice(message, state)
-
-@router.message(Command('рулетка'))
-async def cmd_roulette_ru(message: Message, state: FSMContext):
-    """Русская команда /рулетка для ЛС"""
-    await cmd_roulette(message, state)
-
-
-# --- FSM обработчики ---
-# Эти обработчики НЕ должны срабатывать в группах, так как они зависят от состояния пользователя.
-# Добавим проверку в начало каждого FSM-обработчика для надёжности, даже если основной запуск FSM заблокирован.
-# Проверка в FSM-обработчиках - дополнительная мера.
-
-@router.message(SlotsStates.choosing_stake)
-async def process_slots_stake(message: Message, state: FSMContext):
-    """Обрабатывает ввод ставки для слотов и запускает игру"""
-    # Отладочная информация
-    print(f"DEBUG: process_slots_stake called for user {message.from_user.id} in chat {message.chat.id}")
-    print(f"DEBUG: Current state: {await state.get_state()}")
-    
-    # Продолжаем основную логику FSM
-    try:
-        stake_dollars = float(message.text)
-        stake_cents = int(stake_dollars * 100)
-    except ValueError:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('invalid_stake', user)
-                # Если персональность не определена, используем стандартное сообщение
-                if 'invalid_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = "❌ Неверная сумма! Введите число."
-            else:
-                text = "❌ Неверная сумма! Введите число."
-        await message.answer(text)
-        return
-
-    if stake_cents < settings.MIN_BET:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('low_stake', user, {'min_bet': format_money(settings.MIN_BET)})
-                # Если персональность не определена, используем стандартное сообщение
-                if 'low_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}"
-            else:
-                text = f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}"
-        await message.answer(text)
-        return
-
-    if stake_cents > settings.MAX_BET:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('high_stake', user, {'max_bet': format_money(settings.MAX_BET)})
-                # Если персональность не определена, используем стандартное сообщение
-                if 'high_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}"
-            else:
-                text = f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}"
-        await message.answer(text)
-        return
-
-    telegram_id = message.from_user.id
-    from src.database import async_session_maker
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            await state.clear()
-            return
-
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            await state.clear()
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='slots',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            await state.clear()
-            return
-
-        # Анимация
-        animation_msg = await message.answer("🎰 Крутим барабаны... 🤞")
-        await asyncio.sleep(2)
-
-        # Генерация результата
-        server_seed = secrets.token_hex(32)
-        client_seed = str(user.telegram_id)
-        nonce = user.slots_nonce
-
-        symbols = SlotMachine.spin(server_seed, client_seed, nonce)
-        
-        # Проверяем подкрутку и открутку
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - всегда выигрыш
-            # Генерируем выигрышную комбинацию
-            symbols = ['🍎', '🍎', '🍎']  # Три одинаковых символа = выигрыш
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - всегда проигрыш
-            # Генерируем проигрышную комбинацию
-            symbols = ['🍎', '🍊', '🍇']  # Разные символы = проигрыш
-        
-        payout = SlotMachine.calculate_payout(symbols, stake_cents)
-
-        user.slots_nonce += 1
-        await session.commit()
-
-        await bet_service.complete_bet(bet.id, ''.join(symbols), payout)
-
-        # Применяем VIP бонусы и обрабатываем результат
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'slots')
-
-        await animation_msg.delete()
-
-        symbols_str = ' '.join(symbols)
-        new_balance = await wallet_service.get_balance(user.id)
-
-        if payout >= stake_cents * 100:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('jackpot', user)
-            # Добавляем детали к сообщению персональности
-            text += f"\n\n🎰 {symbols_str}\n\n"
-            text += f"🤑 ТЫ СОРВАЛ КУШ: <b>${format_money(payout)}</b>!\n\n"
-            text += f"Это в {format_number(payout // stake_cents)} раз больше ставки! 👑\n\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Новый баланс: <b>${format_money(new_balance)}</b>"
-            
-        elif payout > stake_cents:
-            multiplier = payout / stake_cents
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('big_win', user, {'multiplier': multiplier})
-            # Добавляем детали
-            text += f"\n\n🎰 {symbols_str}\n\n"
-            text += f"💰 Ты выиграл <b>${format_money(payout)}</b> (x{multiplier:.1f})!\n\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Новый баланс: <b>${format_money(new_balance)}</b>"
-            
-        elif payout > 0:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('slots_partial_win', user, {'payout': format_money(payout)})
-            # Если не определено, используем стандартное
-            if 'slots_partial_win' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                text = f"😊 <b>Почти!</b>\n\n"
-                text += f"🎰 {symbols_str}\n\n"
-                text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            else:
-                # Добавляем детали к сообщению персональности
-                text += f"\n\n🎰 {symbols_str}\n\n"
-                text += f"💰 Возврат: <b>${format_money(payout)}</b>\n\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        else:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('slots_loss', user)
-            # Добавляем детали
-            text += f"\n\n🎰 {symbols_str}\n\n"
-            text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>\n\n"
-            text += f"🍀 Попробуй ещё раз!"
-
-        await message.answer(text)
-        await state.clear()
-
-
-# --- FSM для Dice ---
-@router.message(DiceStates.choosing_stake)
-async def process_dice_stake(message: Message, state: FSMContext):
-    """Обрабатывает ввод ставки для костей и запускает игру"""
-    # Отладочная информация
-    print(f"DEBUG: process_dice_stake called for user {message.from_user.id} in chat {message.chat.id}")
-    print(f"DEBUG: Current state: {await state.get_state()}")
-    
-    # Продолжаем основную логику FSM
-    try:
-        stake_dollars = float(message.text)
-        stake_cents = int(stake_dollars * 100)
-    except ValueError:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('invalid_stake', user)
-                if 'invalid_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = "❌ Неверная сумма! Введите число."
-            else:
-                text = "❌ Неверная сумма! Введите число."
-        await message.answer(text)
-        return
-
-    if stake_cents < settings.MIN_BET:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('low_stake', user, {'min_bet': format_money(settings.MIN_BET)})
-                if 'low_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}"
-            else:
-                text = f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}"
-        await message.answer(text)
-        return
-
-    if stake_cents > settings.MAX_BET:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('high_stake', user, {'max_bet': format_money(settings.MAX_BET)})
-                if 'high_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}"
-            else:
-                text = f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}"
-        await message.answer(text)
-        return
-
-    telegram_id = message.from_user.id
-    from src.database import async_session_maker
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            await state.clear()
-            return
-
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            await state.clear()
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='dice',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            await state.clear()
-            return
-
-        # Бот бросает
-        bot_dice = await message.answer_dice(emoji='🎲')
-        await asyncio.sleep(1)
-
-        # Игрок бросает
-        await message.answer("Твоя очередь бросать! 🎲")
-        player_dice = await message.answer_dice(emoji='🎲')
-
-        # Ждём анимацию
-        await asyncio.sleep(4)
-
-        bot_value = bot_dice.dice.value
-        player_value = player_dice.dice.value
-        
-        # Проверяем подкрутку и открутку для игрока
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - игрок всегда выигрывает
-            # Если игрок проигрывает, меняем его значение на выигрышное
-            if player_value <= bot_value:
-                player_value = bot_value + 1
-                if player_value > 6:  # Максимум 6 на кости
-                    player_value = 6
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - игрок всегда проигрывает
-            # Если игрок выигрывает, меняем его значение на проигрышное
-            if player_value > bot_value:
-                player_value = bot_value - 1
-                if player_value < 1:  # Минимум 1 на кости
-                    player_value = 1
-
-        payout = DiceGame.calculate_payout(player_value, bot_value, stake_cents)
-
-
-        
-
-
-        result_str = f"bot:{bot_value},player:{player_value}"
-
-
-        await bet_service.complete_bet(bet.id, result_str, payout)
-
-
-        
-
-
-        # Применяем VIP бонусы и обрабатываем результат
-
-
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'dice')
-
-
-        
-
-
-        new_balance = await wallet_service.get_balance(user.id)
-
-        if player_value > bot_value:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('dice_win', user)
-            # Добавляем детали
-            text += f"\n\n🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"💰 Выигрыш: <b>${format_money(final_payout)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        elif player_value == bot_value:
-            # НОВОЕ: Используем персональность (нейтральное сообщение, добавим его в NeutralPersonality)
-            # Пока используем стандартное
-            text = f"🤝 <b>НИЧЬЯ!</b>\n\n"
-            text += f"🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"↩️ Ставка возвращена: <b>${format_money(final_payout)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            if credit_message:
-                text += f"{credit_message}\n"
-        else:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('dice_loss', user)
-            # Добавляем детали
-            text += f"\n\n🤖 Бот: {bot_value}\n"
-            text += f"👤 Ты: {player_value}\n\n"
-            text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-
-        await message.answer(text)
-        await state.clear()
-
-
-# --- FSM для Roulette ---
-@router.message(RouletteStates.choosing_stake)
-async def process_roulette_stake(message: Message, state: FSMContext):
-    """Обрабатывает ввод ставки для рулетки и запрашивает выбор (число/цвет)"""
-    # Продолжаем основную логику FSM
-    try:
-        stake_dollars = float(message.text)
-        stake_cents = int(stake_dollars * 100)
-    except ValueError:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('invalid_stake', user)
-                if 'invalid_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = "❌ Неверная сумма! Введите число."
-            else:
-                text = "❌ Неверная сумма! Введите число."
-        await message.answer(text)
-        return
-
-    if stake_cents < settings.MIN_BET:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('low_stake', user, {'min_bet': format_money(settings.MIN_BET)})
-                if 'low_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}"
-            else:
-                text = f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}"
-        await message.answer(text)
-        return
-
-    if stake_cents > settings.MAX_BET:
-        # НОВОЕ: Используем персональность
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = result.scalar_one_or_none()
-            if user:
-                text = await PersonalityEngine.get_message('high_stake', user, {'max_bet': format_money(settings.MAX_BET)})
-                if 'high_stake' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                    text = f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}"
-            else:
-                text = f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}"
-        await message.answer(text)
-        return
-
-    telegram_id = message.from_user.id
-    from src.database import async_session_maker
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            await state.clear()
-            return
-
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            await state.clear()
-            return
-
-        # Сохраняем ставку в состоянии
-        await state.update_data(stake_cents=stake_cents)
-        await message.answer(
-            "🎰 <b>Мини-рулетка</b>\n\n"
-            "Теперь выберите:\n"
-            "📍 Число (1-10): x3\n"
-            "🔴 Красное (red, к, крас): x1.8\n"
-            "⚫ Чёрное (black, ч, черное): x1.8\n\n"
-            "Пример: <code>5</code> или <code>red</code> или <code>к</code>"
-        )
-        await state.set_state(RouletteStates.choosing_bet)
-
-@router.message(RouletteStates.choosing_bet)
-async def process_roulette_choice(message: Message, state: FSMContext):
-    """Обрабатывает выбор (число/цвет) и запускает игру в рулетку"""
-    # Продолжаем основную логику FSM
-    bet_on = message.text.lower().strip()
-
-    # Валидация выбора
-    if bet_on.isdigit():
-        bet_type = 'number'
-        bet_value = int(bet_on)
-        if not 1 <= bet_value <= 10:
-            await message.answer("❌ Неверное число! Укажи от 1 до 10.")
-            return
-    elif bet_on in ['red', 'красное', 'r', 'к', 'крас']:
-        bet_type = 'red'
-        bet_value = RouletteGame.RED_NUMBERS
-    elif bet_on in ['black', 'чёрное', 'b', 'ч', 'черное']:
-        bet_type = 'black'
-        bet_value = RouletteGame.BLACK_NUMBERS
-    else:
-        await message.answer("❌ Неверная ставка! Используй: число (1-10), red, black, к (красное), ч (черное)")
-        return
-
-    # Получаем сохранённую ставку из состояния
-    data = await state.get_data()
-    stake_cents = data.get('stake_cents')
-
-    if stake_cents is None:
-        await message.answer("❌ Ошибка получения ставки. Попробуйте снова.")
-        await state.clear()
-        return
-
-    telegram_id = message.from_user.id
-    from src.database import async_session_maker
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            await state.clear()
-            return
-
-        # Проверка баланса (повторно, на всякий случай)
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            # НОВОЕ: Используем персональность
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            await state.clear()
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='roulette',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            await state.clear()
-            return
-
-        # Анимация
-        try:
-            animation_msg = await message.answer("🎰 Рулетка крутится... 🌀")
-        except Exception:
-            # Если не удалось отправить анимацию из-за flood control, продолжаем без неё
-            animation_msg = None
-        await asyncio.sleep(2.5)
-
-        # Результат
-        result_number = RouletteGame.spin()
-        result_color = RouletteGame.get_color(result_number)
-
-        payout = RouletteGame.calculate_payout(bet_type, bet_value, result_number, stake_cents)
-
-        result_str = f"number:{result_number},color:{result_color}"
-        await bet_service.complete_bet(bet.id, result_str, payout)
-
-        # Применяем VIP бонусы и обрабатываем результат
-        final_payout, vip_message, credit_message = await process_game_result(user.id, stake_cents, payout, 'roulette')
-
-        await animation_msg.delete()
+        return
+    
+    # Пользователь уже загружен middleware (или берётся из user_cache)
+    if await game_pipeline.get_user(message, user_context) is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
-        color_emoji = '🔴' if result_color == 'red' else '⚫'
-        new_balance = await wallet_service.get_balance(user.id)
+    await state.clear()
+    await message.answer("♠️ <b>Мини-рулетка</b>\nВведите сумму ставки (например, 20):")
+    await state.set_state(RouletteStates.choosing_stake)
 
-        if final_payout > 0:
-            multiplier = final_payout / stake_cents
-            # НОВОЕ: Используем персональность (например, win в рулетке)
-            # Пока используем стандартное сообщение с персональностью big_win
-            text = await PersonalityEngine.get_message('big_win', user, {'multiplier': multiplier})
-            # Добавляем детали
-            text += f"\n\n🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-            text += f"💰 Выигрыш: <b>${format_money(final_payout)}</b> (x{multiplier:.1f})\n"
-            if vip_message:
-                text += f"{vip_message}\n"
-            if credit_message:
-                text += f"{credit_message}\n"
-            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-        else:
-            # НОВОЕ: Используем персональность (например, loss в рулетке)
-            # Пока используем стандартное сообщение с персональностью slots_loss
-            text = await PersonalityEngine.get_message('roulette_loss', user) # Добавим в персональности
-            if 'roulette_loss' not in ['big_win', 'slots_loss', 'dice_win', 'dice_loss', 'jackpot', 'low_balance', 'daily_bonus', 'welcome_back', 'error_too_fast']:
-                text = f"💔 <b>Не угадал...</b>\n\n"
-                text += f"🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-                text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            
-            else:
-                # Добавляем детали к сообщению персональности
-                text += f"\n\n🎯 Выпало: {color_emoji} <b>{result_number}</b>\n\n"
-                text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                if vip_message:
-                    text += f"{vip_message}\n"
-                if credit_message:
-                    text += f"{credit_message}\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-            
 
-        await message.answer(text)
-        await state.clear()
+# --- РУССКИЕ КОМАНДЫ ДЛЯ ЛИЧНЫХ СООБЩЕНИЙ ---
 
+@router.message(Command('слоты'))
+async def cmd_slots_ru(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Русская команда /слоты для ЛС"""
+    await cmd_slots(message, state, user_context)
 
-# --- ИГРА В МИНЫ ---
+@router.message(Command('кости'))
+async def cmd_dice_ru(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Русская команда /кости для ЛС"""
+    await cmd_dice(message, state, user_context)
 
-@router.message(lambda message: message.text and message.text.startswith('/mines '))
-async def cmd_mines_with_stake(message: Message, state: FSMContext):
-    """Обрабатывает команду /mines с параметром ставки"""
-    try:
-        # Извлекаем сумму из команды
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>/mines 20</code>")
-        return
+@router.message(Command('рулетка'))
+async def cmd_roulette_ru(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Русская команда /рулетка для ЛС"""
+    await cmd_roulette(message, state, user_context)
 
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
 
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
+# --- FSM обработчики ---
+# Эти обработчики НЕ должны срабатывать в группах, так как они зависят от состояния пользователя.
+# Добавим проверку в начало каждого FSM-обработчика для надёжности, даже если основной запуск FSM заблокирован.
+# Проверка в FSM-обработчиках - дополнительная мера.
 
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
+@router.message(StateFilter(SlotsStates.choosing_stake, DiceStates.choosing_stake), flags={'wallet_lock': 'reject'})
+async def process_game_stake(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Обрабатывает ввод ставки в FSM (слоты, кости, мины, ракетка) и запускает игру"""
+    current_state = await state.get_state()
+    engine = game_pipeline.engines[STAKE_STATES[current_state]]
+    
+    await game_pipeline.run(
+        message,
+        engine,
+        message.text or '',
+        state=state,
+        user_context=user_context,
+        from_prompt=True
+    )
 
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
 
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='mines',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
+# --- FSM для Roulette ---
+@router.message(RouletteStates.choosing_stake, flags={'wallet_lock': 'reject'})
+async def process_roulette_stake(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Обрабатывает ввод ставки для рулетки и запрашивает выбор (число/цвет)"""
+    checked = await game_pipeline.validate(message, message.text or '', user_context=user_context, state=state)
+    if checked is None:
+        return
+    _, stake_cents = checked
 
-        # Генерируем мины
-        mines_nonce = getattr(user, 'mines_nonce', 0)
-        mines = MinesGame.generate_mines(user.id, mines_nonce)
-        
-        # Проверяем подкрутку и открутку
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - убираем все мины (игрок всегда выигрывает)
-            mines = []
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - добавляем мины во все клетки (игрок всегда проигрывает)
-            mines = list(range(25))  # Все 25 клеток - мины
-        
-        if hasattr(user, 'mines_nonce'):
-            user.mines_nonce += 1
-        await session.commit()
+    # Сохраняем ставку в состоянии
+    await state.update_data(stake_cents=stake_cents)
+    await message.answer(
+        "🎰 <b>Мини-рулетка</b>\n\n"
+        "Теперь выберите:\n"
+        "📍 Число (1-10): x3\n"
+        "🔴 Красное (red, к, крас): x1.8\n"
+        "⚫ Чёрное (black, ч, черное): x1.8\n\n"
+        "Пример: <code>5</code> или <code>red</code> или <code>к</code>"
+    )
+    await state.set_state(RouletteStates.choosing_bet)
 
-        # Создаем клавиатуру 5x5
-        keyboard = create_mines_keyboard()
+@router.message(RouletteStates.choosing_bet, flags={'wallet_lock': 'reject'})
+async def process_roulette_choice(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Обрабатывает выбор (число/цвет) и запускает игру в рулетку"""
+    # Получаем сохранённую ставку из состояния
+    data = await state.get_data()
+    stake_cents = data.get('stake_cents')
 
-        # Сохраняем данные игры в состоянии
-        await state.update_data(
-            bet_id=bet.id,
-            stake_cents=stake_cents,
-            mines=mines,
-            opened_cells=[],
-            moves_count=0,
-            user_id=user.id
-        )
-        await state.set_state(MinesStates.playing)
+    if stake_cents is None:
+        await message.answer("❌ Ошибка получения ставки. Попробуйте снова.")
+        await state.clear()
+        return
 
-        # Отправляем сообщение с игрой
-        username = message.from_user.username or message.from_user.first_name
-        text = f"@{username}, вы начали игру минное поле!\n\n"
-        text += f"💰 Ставка: ${format_money(stake_cents)}\n\n"
-        text += "Выберите клетку для открытия:"
+    await game_pipeline.run(
+        message,
+        game_pipeline.engines['roulette'],
+        stake_cents,
+        [message.text or ''],
+        state=state,
+        user_context=user_context,
+        from_prompt=True
+    )
 
-        await message.answer(text, reply_markup=keyboard)
 
+# --- ИГРА В МИНЫ ---
 
 def create_mines_keyboard() -> InlineKeyboardMarkup:
     """Создает клавиатуру 5x5 для игры в мины"""
@@ -2210,7 +707,66 @@ def create_mines_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-@router.callback_query(lambda c: c.data.startswith('mines_'))
+async def schedule_mines_timeout(bet_id, stake_cents: int, moves_count: int, chat_id: int, message_id: int, username: str):
+    """(Пере)запускает таймер брошенной игры в мины - от последнего хода"""
+    await timer_service.schedule(
+        f"mines:{bet_id}",
+        settings.MINES_TIMEOUT_SECONDS,
+        'mines_timeout',
+        {
+            'bet_id': bet_id,
+            'stake_cents': stake_cents,
+            'moves_count': moves_count,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'username': username
+        }
+    )
+
+
+def mines_cashout_payout(stake_cents: int, moves_count: int) -> int:
+    """Выплата при выходе из игры: без ходов - возврат ставки"""
+    if moves_count == 0:
+        return stake_cents
+    return MinesGame.calculate_payout(stake_cents, moves_count)
+
+
+@timer_service.handler('mines_timeout')
+async def on_mines_timeout(payload: dict):
+    """Игрок бросил игру: забираем за него выигрыш (или возвращаем ставку)"""
+    moves_count = payload['moves_count']
+    payout = mines_cashout_payout(payload['stake_cents'], moves_count)
+    try:
+        settlement = await bet_service.complete_bet(payload['bet_id'], f"timeout_after_{moves_count}_moves", payout)
+    except ValueError:
+        # Игра уже завершена игроком
+        return
+
+    text = f"@{payload['username']}, ⏰ время игры истекло.\n\n"
+    if moves_count == 0:
+        text += f"↩️ Ставка возвращена: <b>${format_money(payout)}</b>\n"
+    else:
+        text += f"💰 Выигрыш: <b>${format_money(payout)}</b>\n"
+    text += f"💵 Баланс: <b>${format_money(settlement.new_balance_cents)}</b>"
+    try:
+        await timer_service.bot.edit_message_text(text, chat_id=payload['chat_id'], message_id=payload['message_id'])
+    except Exception as e:
+        logger.warning(f"Mines timeout message error: {e}")
+
+
+async def finish_mines_bet(callback: CallbackQuery, state: FSMContext, bet_id, result: str, payout: int):
+    """Завершает ставку в минах; None - игру уже завершил таймер"""
+    try:
+        settlement = await bet_service.complete_bet(bet_id, result, payout)
+    except ValueError:
+        await callback.message.edit_text("⏰ Время игры истекло, она уже завершена.")
+        await state.clear()
+        return None
+    await timer_service.cancel(f"mines:{bet_id}")
+    return settlement
+
+
+@router.callback_query(lambda c: c.data.startswith('mines_'), flags={'wallet_lock': 'queue'})
 async def handle_mines_callback(callback: CallbackQuery, state: FSMContext):
     """Обрабатывает нажатия кнопок в игре мины"""
     await callback.answer()
@@ -2230,36 +786,26 @@ async def handle_mines_callback(callback: CallbackQuery, state: FSMContext):
     
     if callback.data == "mines_cancel":
         # Пользователь решил забрать выигрыш
+        # Без ходов - возврат ставки, иначе выигрыш по числу ходов
+        payout = mines_cashout_payout(stake_cents, moves_count)
+        
+        # Завершаем ставку (баланс после начисления приходит вместе с результатом)
+        settlement = await finish_mines_bet(callback, state, bet_id, f"cancelled_after_{moves_count}_moves", payout)
+        if settlement is None:
+            return
+        new_balance = settlement.new_balance_cents
+        username = callback.from_user.username or callback.from_user.first_name
+        
         if moves_count == 0:
-            # Если не сделал ни одного хода, возвращаем ставку
-            payout = stake_cents
+            text = f"@{username}, игра отменена.\n\n"
+            text += f"↩️ Ставка возвращена: <b>${format_money(payout)}</b>\n"
+            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
         else:
-            # Рассчитываем выигрыш
-            payout = MinesGame.calculate_payout(stake_cents, moves_count)
-        
-        # Завершаем ставку
-        await bet_service.complete_bet(bet_id, f"cancelled_after_{moves_count}_moves", payout)
+            text = f"@{username}, игра завершена!\n\n"
+            text += f"💰 Выигрыш: <b>${format_money(payout)}</b>\n"
+            text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
         
-        # Получаем пользователя
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one_or_none()
-            
-            if user:
-                new_balance = await wallet_service.get_balance(user.id)
-                username = callback.from_user.username or callback.from_user.first_name
-                
-                if moves_count == 0:
-                    text = f"@{username}, игра отменена.\n\n"
-                    text += f"↩️ Ставка возвращена: <b>${format_money(payout)}</b>\n"
-                    text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-                else:
-                    text = f"@{username}, игра завершена!\n\n"
-                    text += f"💰 Выигрыш: <b>${format_money(payout)}</b>\n"
-                    text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-                
-                await callback.message.edit_text(text)
+        await callback.message.edit_text(text)
         
         await state.clear()
         return
@@ -2278,25 +824,18 @@ async def handle_mines_callback(callback: CallbackQuery, state: FSMContext):
         # Проверяем, есть ли мина в этой клетке
         if position in mines:
             # Пользователь попал на мину - проиграл
-            await bet_service.complete_bet(bet_id, f"lost_on_move_{moves_count + 1}", 0)
+            settlement = await finish_mines_bet(callback, state, bet_id, f"lost_on_move_{moves_count + 1}", 0)
+            if settlement is None:
+                return
+            username = callback.from_user.username or callback.from_user.first_name
             
-            # Получаем пользователя
-            from src.database import async_session_maker
-            async with async_session_maker() as session:
-                result = await session.execute(select(User).where(User.id == user_id))
-                user = result.scalar_one_or_none()
-                
-                if user:
-                    new_balance = await wallet_service.get_balance(user.id)
-                    username = callback.from_user.username or callback.from_user.first_name
-                    
-                    text = f"@{username}, игра завершена!\n\n"
-                    text += f"💸 Вы проиграли\n"
-                    text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-                    
-                    # Создаем финальную клавиатуру с открытыми минами
-                    final_keyboard = create_final_mines_keyboard(mines, opened_cells + [position])
-                    await callback.message.edit_text(text, reply_markup=final_keyboard)
+            text = f"@{username}, игра завершена!\n\n"
+            text += f"💸 Вы проиграли\n"
+            text += f"💵 Баланс: <b>${format_money(settlement.new_balance_cents)}</b>"
+            
+            # Создаем финальную клавиатуру с открытыми минами
+            final_keyboard = create_final_mines_keyboard(mines, opened_cells + [position])
+            await callback.message.edit_text(text, reply_markup=final_keyboard)
             
             await state.clear()
             return
@@ -2309,26 +848,19 @@ async def handle_mines_callback(callback: CallbackQuery, state: FSMContext):
         if moves_count >= MinesGame.MAX_SAFE_MOVES:
             # Принудительно завершаем игру с максимальным выигрышем
             payout = MinesGame.calculate_payout(stake_cents, moves_count)
-            await bet_service.complete_bet(bet_id, f"max_moves_reached_{moves_count}", payout)
+            settlement = await finish_mines_bet(callback, state, bet_id, f"max_moves_reached_{moves_count}", payout)
+            if settlement is None:
+                return
+            username = callback.from_user.username or callback.from_user.first_name
             
-            # Получаем пользователя
-            from src.database import async_session_maker
-            async with async_session_maker() as session:
-                result = await session.execute(select(User).where(User.id == user_id))
-                user = result.scalar_one_or_none()
-                
-                if user:
-                    new_balance = await wallet_service.get_balance(user.id)
-                    username = callback.from_user.username or callback.from_user.first_name
-                    
-                    text = f"@{username}, игра завершена!\n\n"
-                    text += f"🎯 Достигнут максимум ходов ({MinesGame.MAX_SAFE_MOVES})\n"
-                    text += f"💰 Выигрыш: <b>${format_money(payout)}</b>\n"
-                    text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-                    
-                    # Создаем финальную клавиатуру с открытыми минами
-                    final_keyboard = create_final_mines_keyboard(mines, opened_cells)
-                    await callback.message.edit_text(text, reply_markup=final_keyboard)
+            text = f"@{username}, игра завершена!\n\n"
+            text += f"🎯 Достигнут максимум ходов ({MinesGame.MAX_SAFE_MOVES})\n"
+            text += f"💰 Выигрыш: <b>${format_money(payout)}</b>\n"
+            text += f"💵 Баланс: <b>${format_money(settlement.new_balance_cents)}</b>"
+            
+            # Создаем финальную клавиатуру с открытыми минами
+            final_keyboard = create_final_mines_keyboard(mines, opened_cells)
+            await callback.message.edit_text(text, reply_markup=final_keyboard)
             
             await state.clear()
             return
@@ -2344,6 +876,14 @@ async def handle_mines_callback(callback: CallbackQuery, state: FSMContext):
         
         # Обновляем сообщение
         username = callback.from_user.username or callback.from_user.first_name
+        await schedule_mines_timeout(
+            bet_id,
+            stake_cents,
+            moves_count,
+            callback.message.chat.id,
+            callback.message.message_id,
+            username
+        )
         multiplier = MinesGame.get_multiplier(moves_count)
         text = f"@{username}, вы начали игру минное поле!\n\n"
         text += f"💰 Ставка: ${format_money(stake_cents)}\n"
@@ -2425,562 +965,291 @@ def create_final_mines_keyboard(mines: list, opened_cells: list) -> InlineKeyboa
 # --- ОБРАБОТЧИКИ КНОПОК ИГР ---
 
 @router.message(lambda message: message.text == '🎰 Слоты' and message.chat.type == 'private')
-async def button_slots(message: Message, state: FSMContext):
+async def button_slots(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
     """Обработчик кнопки Слоты"""
     if await check_if_banned(message):
         return
-    await cmd_slots(message, state)
+    await cmd_slots(message, state, user_context)
 
 
 @router.message(lambda message: message.text == '🎲 Кости' and message.chat.type == 'private')
-async def button_dice(message: Message, state: FSMContext):
-    """Обработчик кнопки Кости"""
-    if await check_if_banned(message):
-        return
-    await cmd_dice(message, state)
-
-
-@router.message(lambda message: message.text == '♠️ Рулетка' and message.chat.type == 'private')
-async def button_roulette(message: Message, state: FSMContext):
-    """Обработчик кнопки Рулетка"""
-    if await check_if_banned(message):
-        return
-    await cmd_roulette(message, state)
-
-
-@router.message(lambda message: message.text == '💣 Мины' and message.chat.type == 'private')
-async def button_mines(message: Message, state: FSMContext):
-    """Обработчик кнопки Мины"""
-    if await check_if_banned(message):
-        return
-    # Для личных сообщений используем интерактивный режим
-    await message.answer(
-        "💣 <b>Мины</b>\n\n"
-        "Введите сумму ставки (например, 20):"
-    )
-    await state.set_state(MinesStates.choosing_stake)
-
-
-@router.message(lambda message: message.text == '🚀 Ракетка' and message.chat.type == 'private')
-async def button_rocket(message: Message, state: FSMContext):
-    """Обработчик кнопки Ракетка"""
-    if await check_if_banned(message):
-        return
-    # Для личных сообщений используем интерактивный режим
-    await message.answer(
-        "🚀 <b>Ракетка</b>\n\n"
-        "Введите сумму ставки (например, 20):"
-    )
-    await state.set_state(RocketStates.choosing_stake)
-
-
-async def process_mines_stake(message: Message, state: FSMContext):
-    """Обрабатывает ввод ставки для игры в мины"""
-    try:
-        stake_dollars = float(message.text)
-        stake_cents = int(stake_dollars * 100)
-    except ValueError:
-        await message.answer("❌ Неверный формат! Введите число (например, 20)")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            await state.clear()
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='mines',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Генерируем мины
-        mines_nonce = getattr(user, 'mines_nonce', 0)
-        mines = MinesGame.generate_mines(user.id, mines_nonce)
-        
-        # Проверяем подкрутку и открутку
-        if await is_user_rigged(message.from_user.id):
-            # Подкрутка активна - убираем все мины (игрок всегда выигрывает)
-            mines = []
-        elif await is_user_unrigged(message.from_user.id):
-            # Открутка активна - добавляем мины во все клетки (игрок всегда проигрывает)
-            mines = list(range(25))  # Все 25 клеток - мины
-        
-        if hasattr(user, 'mines_nonce'):
-            user.mines_nonce += 1
-        await session.commit()
-
-        # Создаем клавиатуру 5x5
-        keyboard = create_mines_keyboard()
-
-        # Сохраняем данные игры в состоянии
-        await state.update_data(
-            bet_id=bet.id,
-            stake_cents=stake_cents,
-            mines=mines,
-            opened_cells=[],
-            moves_count=0,
-            user_id=user.id
-        )
-        await state.set_state(MinesStates.playing)
-
-        # Отправляем сообщение с игрой
-        text = f"💣 <b>Мины</b>\n\n"
-        text += f"💰 Ставка: ${format_money(stake_cents)}\n\n"
-        text += "Выберите клетку для открытия:"
-
-        await message.answer(text, reply_markup=keyboard)
-
-
-async def process_rocket_stake(message: Message, state: FSMContext):
-    """Обрабатывает ввод ставки для игры в ракетку"""
-    try:
-        stake_dollars = float(message.text)
-        stake_cents = int(stake_dollars * 100)
-    except ValueError:
-        await message.answer("❌ Неверный формат! Введите число (например, 20)")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            await state.clear()
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='rocket',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Запускаем игру
-        await start_rocket_game(message, state, bet.id, stake_cents, user)
-
-
-# --- ИГРА В РАКЕТКУ (CRASH GAME) ---
-
-# Команда: ракетка [ставка]
-@router.message(lambda message: message.text and message.text.lower().startswith('ракетка '))
-async def text_rocket_with_params(message: Message, state: FSMContext):
-    """Обрабатывает текстовую команду 'ракетка [ставка]' без слэша"""
-    # Проверка блокировки
-    if await check_if_banned(message):
-        return
-    
-    try:
-        # Парсим параметры напрямую
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>ракетка 20</code>")
-        return
-
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
-
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
-
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
-
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
-
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='rocket',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
-
-        # Запускаем игру
-        await start_rocket_game(message, state, bet.id, stake_cents, user)
-
-
-# Команда: /ракетка [ставка]
-@router.message(lambda message: message.text and message.text.startswith('/ракетка '))
-async def cmd_rocket_ru_with_stake(message: Message, state: FSMContext):
-    """Обрабатывает русскую команду /ракетка с параметром ставки"""
-    # Убираем слэш и вызываем текстовый обработчик
-    text_without_slash = message.text[1:]  # Убираем первый символ (/)
-    import types
-    temp_msg = types.SimpleNamespace()
-    temp_msg.text = text_without_slash
-    temp_msg.from_user = message.from_user
-    temp_msg.chat = message.chat
-    temp_msg.answer = message.answer
-    temp_msg.edit_text = message.edit_text if hasattr(message, 'edit_text') else None
-    await text_rocket_with_params(temp_msg, state)
-
-
-# Команда: /rocket [ставка]
-@router.message(lambda message: message.text and message.text.startswith('/rocket '))
-async def cmd_rocket_with_stake(message: Message, state: FSMContext):
-    """Обрабатывает команду /rocket с параметром ставки"""
-    # Проверка блокировки
+async def button_dice(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Обработчик кнопки Кости"""
     if await check_if_banned(message):
         return
-    
-    try:
-        # Извлекаем сумму из команды
-        stake_text = message.text.split(' ', 1)[1].strip()
-        stake_dollars = float(stake_text)
-        stake_cents = int(stake_dollars * 100)
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат! Используйте: <code>/rocket 20</code>")
+    await cmd_dice(message, state, user_context)
+
+
+@router.message(lambda message: message.text == '♠️ Рулетка' and message.chat.type == 'private')
+async def button_roulette(message: Message, state: FSMContext, user_context: Optional[UserContext] = None):
+    """Обработчик кнопки Рулетка"""
+    if await check_if_banned(message):
         return
+    await cmd_roulette(message, state, user_context)
 
-    # Проверяем пользователя
-    from src.database import async_session_maker
-    telegram_id = message.from_user.id
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
 
-        # Валидация ставки
-        if stake_cents < settings.MIN_BET:
-            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
-            return
+@router.message(lambda message: message.text == '💣 Мины' and message.chat.type == 'private')
+async def button_mines(message: Message, state: FSMContext):
+    """Обработчик кнопки Мины"""
+    if await check_if_banned(message):
+        return
+    # Для личных сообщений используем интерактивный режим
+    await message.answer(
+        "💣 <b>Мины</b>\n\n"
+        "Введите сумму ставки (например, 20):"
+    )
+    await state.set_state(MinesStates.choosing_stake)
 
-        if stake_cents > settings.MAX_BET:
-            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
-            return
 
-        # Проверяем баланс
-        balance = await wallet_service.get_balance(user.id)
-        if balance < stake_cents:
-            text = await PersonalityEngine.get_message('low_balance', user)
-            await message.answer(text)
-            return
+@router.message(lambda message: message.text == '🚀 Ракетка' and message.chat.type == 'private')
+async def button_rocket(message: Message, state: FSMContext):
+    """Обработчик кнопки Ракетка"""
+    if await check_if_banned(message):
+        return
+    # Для личных сообщений используем интерактивный режим
+    await message.answer(
+        "🚀 <b>Ракетка</b>\n\n"
+        "Введите сумму ставки (например, 20):"
+    )
+    await state.set_state(RocketStates.choosing_stake)
 
-        try:
-            bet = await bet_service.create_bet(
-                user_id=user.id,
-                chat_id=message.chat.id,
-                game_type='rocket',
-                stake_cents=stake_cents
-            )
-        except ValueError as e:
-            await message.answer(f"❌ Ошибка: {e}")
-            return
 
-        # Запускаем игру
-        await start_rocket_game(message, state, bet.id, stake_cents, user)
+# --- ИГРА В РАКЕТКУ (CRASH GAME) ---
+
+def render_rocket_round(rnd: RocketRound, multiplier: float) -> str:
+    """Текст общего сообщения раунда ракетки"""
+    if rnd.status == 'finished':
+        text = f"💥 <b>Ракетка взорвалась на {RocketGame.format_multiplier(multiplier)}!</b>\n\n"
+    elif rnd.status == 'cancelled':
+        text = "⚠️ <b>Раунд прерван из-за сбоя, ставки возвращены</b>\n\n"
+    else:
+        rocket_emoji = RocketGame.get_rocket_emoji(multiplier)
+        text = f"🚀 <b>Ракетка</b>\n\n"
+        text += f"📊 Коэффициент: <b>{RocketGame.format_multiplier(multiplier)}</b> {rocket_emoji}\n\n"
+    
+    for player in rnd.players.values():
+        name = player.mention or "Вы"
+        if player.status == 'cashed_out':
+            text += f"✅ {name}: забрал на {RocketGame.format_multiplier(player.cashout_multiplier)} (+${format_money(player.payout_cents)})\n"
+        elif player.status == 'crashed':
+            text += f"💸 {name}: потерял ${format_money(player.stake_cents)}\n"
+        elif player.status == 'refunded':
+            text += f"↩️ {name}: ставка ${format_money(player.stake_cents)} возвращена\n"
+        else:
+            text += f"🎯 {name}: ставка ${format_money(player.stake_cents)}\n"
+    if rnd.status == 'finished' and rnd.round_hash:
+        text += f"\n🔐 Раунд #{rnd.chain_index}: <code>{rnd.round_hash}</code>\n"
+        text += "Проверка: /rocket_fair"
+    return text
 
 
 async def start_rocket_game(message: Message, state: FSMContext, bet_id: int, stake_cents: int, user):
-    """Запускает игру в ракетку"""
-    # Генерируем точку краша
-    crash_point = RocketGame.calculate_crash_point()
-    
-    # Проверяем подкрутку и открутку
-    if await is_user_rigged(message.from_user.id):
-        # Подкрутка активна - устанавливаем очень высокую точку краша (игрок всегда выигрывает)
-        crash_point = 999.99  # Практически невозможно достичь
-    elif await is_user_unrigged(message.from_user.id):
-        # Открутка активна - устанавливаем очень низкую точку краша (игрок всегда проигрывает)
-        crash_point = 1.01  # Практически сразу краш
+    """Добавляет ставку в общий раунд ракетки чата (или открывает новый)"""
+    # Раунд общий для чата, FSM для ракетки не нужен
+    await state.clear()
     
-    # Определяем имя пользователя для упоминания в группах
-    if message.chat.type in ['group', 'supergroup']:
+    is_group = message.chat.type in ['group', 'supergroup']
+    if is_group:
         username = message.from_user.username or message.from_user.first_name
-        user_mention = f"@{username}, "
+        user_mention = f"@{username}"
     else:
         user_mention = ""
     
-    # Отправляем предстартовое сообщение
-    countdown_msg = await message.answer(f"{user_mention}🚀 Игра начнется через 3 секунды...")
-    await asyncio.sleep(1)
-    await countdown_msg.edit_text(f"{user_mention}🚀 Игра начнется через 2 секунды...")
-    await asyncio.sleep(1)
-    await countdown_msg.edit_text(f"{user_mention}🚀 Игра начнется через 1 секунду...")
-    await asyncio.sleep(1)
+    player = RocketPlayer(
+        bet_id=bet_id,
+        user_id=user.id,
+        telegram_id=message.from_user.id,
+        stake_cents=stake_cents,
+        mention=user_mention
+    )
     
-    # Создаем кнопку "Забрать"
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="💰 Забрать", callback_data=f"rocket_cashout_{bet_id}")]
-    ])
+    # Проверяем подкрутку и открутку (действуют только на этого игрока)
+    if await is_user_rigged(message.from_user.id):
+        # Подкрутка активна - выигрыш заберётся сам на последнем коэффициенте
+        player.auto_cashout = True
+    elif await is_user_unrigged(message.from_user.id):
+        # Открутка активна - забрать выигрыш не получится
+        player.max_cashout = 1.01
     
-    # Стартовое сообщение
-    text = f"{user_mention}🚀 <b>Ракетка</b>\n\n"
-    text += f"💰 Ваша ставка: <b>${format_money(stake_cents)}</b>\n"
-    text += f"📊 Коэффициент: <b>{RocketGame.format_multiplier(1.0)}</b>"
+    rnd, is_new = rocket_engine.join(
+        message.chat.id,
+        player,
+        is_group=is_group
+    )
     
-    game_msg = await countdown_msg.edit_text(text, reply_markup=keyboard)
+    if rnd is None:
+        # Игрок уже в этом раунде - возвращаем ставку
+        await bet_service.complete_bet(bet_id, 'refund:duplicate_rocket_bet', stake_cents)
+        await message.answer("❌ Вы уже участвуете в этом раунде")
+        return
     
-    # Сохраняем данные игры в состоянии
-    await state.update_data(
-        bet_id=bet_id,
-        stake_cents=stake_cents,
-        crash_point=crash_point,
-        user_id=user.id,
-        game_message_id=game_msg.message_id,
-        chat_id=message.chat.id,
-        cashed_out=False,
-        user_mention=user_mention
+    await rocket_engine.watch_bet(rnd, player)
+    
+    seconds_left = max(int(rnd.betting_until - time.monotonic()), 0)
+    if not is_new:
+        await message.answer(
+            f"{user_mention + ', ' if user_mention else ''}✅ Ставка ${format_money(stake_cents)} принята, "
+            f"старт через {seconds_left} сек."
+        )
+        return
+    
+    # Первая ставка открывает раунд: одно сообщение на весь раунд
+    game_msg = await message.answer(
+        f"🚀 Раунд ракетки начнется через {seconds_left} сек.\n"
+        f"Делайте ставки: <code>ракетка [ставка]</code>"
     )
-    await state.set_state(RocketStates.playing)
     
-    # Создаем флаг для остановки игры и блокировку
-    game_stopped = False
-    game_locked = False
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💰 Забрать", callback_data=f"rocket_cashout_{rnd.round_id}")]
+    ])
     
-    # Запускаем симуляцию ракеты
-    async def update_rocket(multiplier: float, is_crashed: bool):
-        """Callback для обновления сообщения"""
-        nonlocal game_stopped, game_locked
-        
-        try:
-            # Проверяем блокировку
-            if game_locked:
-                return False
-            
-            data = await state.get_data()
-            
-            # Проверяем, не забрал ли игрок выигрыш или игра остановлена
-            if data.get('cashed_out', False) or game_stopped:
-                game_stopped = True
-                game_locked = True
-                return False  # Останавливаем игру
-            
-            if not is_crashed:
-                # Обновляем текст с текущим коэффициентом
-                rocket_emoji = RocketGame.get_rocket_emoji(multiplier)
-                text = f"{data.get('user_mention', '')}🚀 <b>Ракетка</b>\n\n"
-                text += f"💰 Ваша ставка: <b>${format_money(stake_cents)}</b>\n"
-                text += f"📊 Коэффициент: <b>{RocketGame.format_multiplier(multiplier)}</b> {rocket_emoji}"
-                
-                try:
-                    await game_msg.edit_text(text, reply_markup=keyboard)
-                except Exception:
-                    # Игнорируем ошибки редактирования (если сообщение не изменилось)
-                    pass
-                return True  # Продолжаем игру
-            else:
-                # Ракета взорвалась!
-                if not data.get('cashed_out', False) and not game_stopped and not game_locked:
-                    # Блокируем игру перед обработкой взрыва
-                    game_locked = True
-                    
-                    # Игрок не успел забрать - проигрыш
-                    try:
-                        await bet_service.complete_bet(bet_id, f"crashed_at_{crash_point}", 0)
-                    except Exception:
-                        # Если ставка уже завершена, игнорируем
-                        pass
-                    
-                    new_balance = await wallet_service.get_balance(user.id)
-                    
-                    text = f"{data.get('user_mention', '')}💥 <b>Ракетка взорвалась!</b>\n\n"
-                    text += f"📊 Коэффициент краша: <b>{RocketGame.format_multiplier(crash_point)}</b>\n\n"
-                    text += f"💸 Потеряно: <b>${format_money(stake_cents)}</b>\n"
-                    text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-                    
-                    await game_msg.edit_text(text)
-                    await state.clear()
-                    game_stopped = True
-                return False  # Останавливаем игру
-        
-        except Exception as e:
-            game_stopped = True
-            game_locked = True
-            return False  # Останавливаем игру
+    async def render(rnd: RocketRound, multiplier: float):
+        """Отрисовка раунда (вызывается движком с частотой, которую выдерживает чат)"""
+        text = render_rocket_round(rnd, multiplier)
+        if rnd.status in ('finished', 'cancelled'):
+            await game_msg.edit_text(text)
+        else:
+            await game_msg.edit_text(text, reply_markup=keyboard)
+    
+    rocket_engine.start(rnd, render, is_group=is_group)
+
+
+@router.message(Command('rocket_fair'))
+async def cmd_rocket_fair(message: Message):
+    """Честность ракетки: опубликованный хэш цепочки и проверка раунда"""
+    chain = crash_chain_service.chain
+    if chain is None:
+        await message.answer("⏳ Цепочка раундов ещё готовится, попробуйте позже.")
+        return
+    
+    parts = message.text.split()
+    if len(parts) == 3 and parts[1].isdigit():
+        index = int(parts[1])
+        crash_point = await crash_chain_service.verify(index, parts[2].lower())
+        if crash_point is None:
+            await message.answer(f"❌ Хэш не подходит к раунду #{index}")
+        else:
+            await message.answer(
+                f"✅ Раунд #{index} честный\n"
+                f"💥 Точка краша: <b>{RocketGame.format_multiplier(crash_point)}</b>"
+            )
+        return
     
-    # Запускаем симуляцию
-    await RocketGame.simulate_rocket(crash_point, update_rocket)
+    text = "🔐 <b>Честность ракетки</b>\n\n"
+    text += "Все раунды заранее взяты из цепочки хэшей: sha256 от хэша раунда "
+    text += "равен хэшу предыдущего раунда, для раунда #0 - опубликованному хэшу ниже.\n\n"
+    text += f"📌 Хэш цепочки: <code>{chain.terminal.hex()}</code>\n"
+    text += f"🎲 Раундов сыграно: {await crash_chain_service.rounds_played()} из {chain.length}\n\n"
+    text += "Проверить раунд: <code>/rocket_fair номер хэш</code>"
+    await message.answer(text)
+
+
+@router.message(Command('seed'))
+async def cmd_seed(message: Message):
+    """Сиды слотов, костей и рулетки: текущая пара, смена пары и клиентского сида"""
+    user = await user_cache.get(message.from_user.id)
+    if user is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
+
+    parts = message.text.split(maxsplit=1)
+    if len(parts) == 2:
+        client_seed = parts[1].strip()
+        if client_seed.lower() == 'new':
+            client_seed = None
+        else:
+            error = seed_service.validate_client_seed(client_seed)
+            if error:
+                await message.answer(f"❌ {error}")
+                return
+
+        revealed = await seed_service.rotate([user.id], client_seed=client_seed)
+        text = "🔄 <b>Пара сидов сменена</b>\n\n"
+        if revealed:
+            old = revealed[0]
+            text += "🔓 Раскрыт прошлый серверный сид:\n"
+            text += f"<code>{old.server_seed}</code>\n"
+            text += f"Хэш: <code>{old.server_hash}</code>\n"
+            text += f"Клиентский сид: <code>{old.client_seed}</code>, игр: {old.nonces}\n\n"
+    else:
+        text = "🔐 <b>Честность слотов, костей и рулетки</b>\n\n"
+        text += "Результат игры - HMAC-SHA256(серверный сид, \"серверный:клиентский:nonce\"). "
+        text += "Хэш серверного сида публикуется заранее, сам сид раскрывается при смене пары.\n\n"
+
+    pair = await seed_service.get_pair(user.id)
+    text += f"📌 Хэш серверного сида: <code>{pair.server_hash}</code>\n"
+    text += f"👤 Клиентский сид: <code>{pair.client_seed}</code>\n"
+    text += f"🔢 Nonce следующей игры: {pair.nonce}\n\n"
+    text += "Сменить пару: <code>/seed new</code>\n"
+    text += "Задать свой клиентский сид: <code>/seed мой_сид</code>"
+    await message.answer(text)
+
+
+@router.message(Command('verify'))
+async def cmd_verify(message: Message):
+    """Проверка всей истории слотов, костей и рулетки по раскрытым сидам"""
+    user = await user_cache.get(message.from_user.id)
+    if user is None:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
+    if verification_service.is_running(user.id):
+        await message.answer("⏳ Проверка уже идёт, дождитесь результата")
+        return
+
+    status_msg = await message.answer("🔍 Пересчитываю ваши ставки...")
+    report = await verification_service.verify(user.id)
+
+    if report.mismatch_count:
+        text = f"❌ <b>Расхождений: {report.mismatch_count}</b> из {report.checked} ставок\n\n"
+        for bet_id, game_type, nonce, expected, actual in report.mismatches[:10]:
+            text += f"• #{bet_id} {game_type}, nonce {nonce}: ожидалось {expected}, записано {actual}\n"
+        text += "\n"
+    else:
+        text = f"✅ <b>Все {report.checked} ставок честные</b>\n\n"
+    if report.unrevealed:
+        text += f"🔒 Ещё не раскрыто: {report.unrevealed} (сид активен - смените пару: <code>/seed new</code>)\n"
+    text += f"⏱ {report.seconds:.1f} с"
+    await status_msg.edit_text(text)
 
 
 # Callback для кнопки "Забрать"
 @router.callback_query(lambda c: c.data.startswith('rocket_cashout_'))
-async def handle_rocket_cashout(callback: CallbackQuery, state: FSMContext):
+async def handle_rocket_cashout(callback: CallbackQuery):
     """Обрабатывает нажатие кнопки 'Забрать' в игре ракетка"""
     try:
-        await callback.answer()
-        
-        # Получаем данные из состояния
-        data = await state.get_data()
-        
-        # Проверяем, что игра активна
-        current_state = await state.get_state()
-        
-        if current_state != RocketStates.playing:
-            await callback.answer("❌ Игра уже завершена", show_alert=True)
-            return
-        
-        bet_id = data.get('bet_id')
-        stake_cents = data.get('stake_cents')
-        crash_point = data.get('crash_point')
-        user_id = data.get('user_id')
-        user_mention = data.get('user_mention', '')
-        
-        if not all([bet_id, stake_cents, crash_point, user_id]):
-            await callback.answer("❌ Ошибка данных игры", show_alert=True)
-            await state.clear()
-            return
-        
-        # Проверяем, не забрал ли уже игрок
-        if data.get('cashed_out', False):
-            await callback.answer("❌ Вы уже забрали выигрыш", show_alert=True)
-            return
-        
-        # Получаем текущий коэффициент из текста сообщения
-        try:
-            # Парсим текущий коэффициент из сообщения
-            message_text = callback.message.text
-            
-            if "Коэффициент:" in message_text:
-                coef_line = [line for line in message_text.split('\n') if 'Коэффициент:' in line][0]
-                
-                # Извлекаем число из строки типа "📊 Коэффициент: 2.5x 🚀"
-                import re
-                match = re.search(r'(\d+\.\d+)x', coef_line)
-                if match:
-                    current_multiplier = float(match.group(1))
-                else:
-                    current_multiplier = 1.0
-            else:
-                current_multiplier = 1.0
-        except Exception:
-            current_multiplier = 1.0
-        
-        # Проверяем, не превысил ли коэффициент точку краша
-        if current_multiplier >= crash_point:
-            await callback.answer("❌ Слишком поздно! Ракетка взорвалась", show_alert=True)
-            return
-        
-        # АТОМАРНО помечаем, что игрок забрал выигрыш
-        await state.update_data(cashed_out=True)
-        
-        # Дополнительная проверка - если уже забрали, выходим
-        updated_data = await state.get_data()
-        if updated_data.get('cashed_out', False) != True:
-            await callback.answer("❌ Ошибка обработки", show_alert=True)
-            return
-        
-        # Рассчитываем выплату
-        payout = RocketGame.calculate_payout(stake_cents, current_multiplier)
-        
-        # Завершаем ставку (с проверкой на дублирование)
-        try:
-            await bet_service.complete_bet(bet_id, f"cashed_out_at_{current_multiplier}", payout)
-        except Exception as e:
-            # Если ставка уже завершена, игнорируем ошибку
-            if "already completed" in str(e).lower() or "duplicate" in str(e).lower():
-                await callback.answer("❌ Ставка уже обработана", show_alert=True)
-                await state.clear()
-                return
-            else:
-                raise e
-        
-        # Получаем пользователя
-        from src.database import async_session_maker
-        async with async_session_maker() as session:
-            result = await session.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one_or_none()
-            
-            if user:
-                new_balance = await wallet_service.get_balance(user.id)
-                
-                text = f"{user_mention}✅ <b>Выигрыш забран!</b>\n\n"
-                text += f"📊 Коэффициент: <b>{RocketGame.format_multiplier(current_multiplier)}</b>\n\n"
-                text += f"💰 Выигрыш: <b>${format_money(payout)}</b>\n"
-                text += f"💵 Баланс: <b>${format_money(new_balance)}</b>"
-                
-                try:
-                    await callback.message.edit_text(text)
-                except Exception:
-                    # Попробуем отправить новое сообщение
-                    try:
-                        await callback.message.answer(text)
-                    except Exception:
-                        pass
-        
-        # Очищаем состояние игры
-        await state.clear()
-        
-    except Exception as e:
+        round_id = int(callback.data.rsplit('_', 1)[1])
+    except ValueError:
+        await callback.answer("❌ Ошибка данных игры", show_alert=True)
+        return
+    
+    # Коэффициент считается движком по времени нажатия, а не по тексту сообщения
+    try:
+        player, status = await rocket_engine.cash_out(round_id, callback.from_user.id)
+    except Exception:
         await callback.answer("❌ Произошла ошибка", show_alert=True)
+        return
+    
+    if status == 'ok':
+        new_balance = player.balance_cents
+        await callback.answer(
+            f"✅ Забрано на {RocketGame.format_multiplier(player.cashout_multiplier)}: "
+            f"${format_money(player.payout_cents)}\n"
+            f"💵 Баланс: ${format_money(new_balance)}",
+            show_alert=True
+        )
+    elif status == 'not_player':
+        await callback.answer("❌ Вы не участвуете в этом раунде", show_alert=True)
+    elif status == 'not_started':
+        await callback.answer("⏳ Раунд ещё не начался")
+    elif status == 'crashed':
+        await callback.answer("❌ Слишком поздно! Ракетка взорвалась", show_alert=True)
+    else:
+        await callback.answer("❌ Игра уже завершена", show_alert=True)
 
 
 # --- КОМАНДА ПЕРЕВОДА ДЕНЕГ ---
 
-@router.message(lambda message: message.text and message.text.lower().startswith('перевести '))
+@router.message(lambda message: message.text and message.text.lower().startswith('перевести '), flags={'wallet_lock': 'reject'})
 async def transfer_money_command(message: Message):
     """Обрабатывает команду 'перевести [количество] [айди пользователя]' для перевода денег"""
     try:
@@ -3071,26 +1340,25 @@ async def transfer_money_command(message: Message):
                 await session.commit()
                 await session.refresh(recipient)
         
-        # Получаем баланс отправителя
-        sender_balance = await wallet_service.get_balance(sender.id)
-        
-        # Проверяем достаточность средств
-        if sender_balance < amount_cents:
+        # Выполняем перевод: списание и зачисление - одна операция,
+        # балансы обоих приходят вместе с результатом
+        try:
+            transfer = await wallet_service.transfer(
+                sender.id,
+                recipient.id,
+                amount_cents,
+                f"transfer_to_{recipient_id}",
+                f"transfer_from_{message.from_user.id}"
+            )
+        except ValueError:
+            sender_balance = await wallet_service.get_balance(sender.id)
             await message.answer(f"❌ Недостаточно средств!\n\n"
                               f"💰 Ваш баланс: <b>${format_money(sender_balance)}</b>\n"
                               f"💸 Требуется: <b>${format_money(amount_cents)}</b>")
             return
         
-        # Выполняем перевод
-        # Списываем с отправителя
-        await wallet_service.debit(sender.id, amount_cents, f"transfer_to_{recipient_id}")
-        
-        # Зачисляем получателю
-        await wallet_service.credit(recipient.id, amount_cents, f"transfer_from_{message.from_user.id}")
-        
-        # Получаем новые балансы
-        new_sender_balance = await wallet_service.get_balance(sender.id)
-        new_recipient_balance = await wallet_service.get_balance(recipient.id)
+        new_sender_balance = transfer.sender_balance_cents
+        new_recipient_balance = transfer.recipient_balance_cents
         
         # Формируем сообщение об успешном переводе
         sender_name = message.from_user.username or message.from_user.first_name
@@ -3119,7 +1387,7 @@ async def transfer_money_command(message: Message):
         print(f"Transfer error: {e}")
 
 
-@router.message(lambda message: message.text and message.text.startswith('/transfer '))
+@router.message(lambda message: message.text and message.text.startswith('/transfer '), flags={'wallet_lock': 'reject'})
 async def cmd_transfer_with_params(message: Message):
     """Обрабатывает команду /transfer с параметрами (английская версия)"""
     # Заменяем команду на русскую версию и вызываем основной обработчик
@@ -3129,7 +1397,7 @@ async def cmd_transfer_with_params(message: Message):
 
 # --- КОМАНДА ПЕРЕВОДА ЧЕРЕЗ РЕПЛАЙ ---
 
-@router.message(lambda message: message.reply_to_message and message.text and message.text.lower().startswith('п '))
+@router.message(lambda message: message.reply_to_message and message.text and message.text.lower().startswith('п '), flags={'wallet_lock': 'reject'})
 async def transfer_money_reply_command(message: Message):
     """Обрабатывает команду 'п [сумма]' в ответ на сообщение пользователя"""
     try:
@@ -3219,26 +1487,25 @@ async def transfer_money_reply_command(message: Message):
                 await session.commit()
                 await session.refresh(recipient)
         
-        # Получаем баланс отправителя
-        sender_balance = await wallet_service.get_balance(sender.id)
-        
-        # Проверяем достаточность средств
-        if sender_balance < amount_cents:
+        # Выполняем перевод: списание и зачисление - одна операция,
+        # балансы обоих приходят вместе с результатом
+        try:
+            transfer = await wallet_service.transfer(
+                sender.id,
+                recipient.id,
+                amount_cents,
+                f"transfer_to_{recipient_id}",
+                f"transfer_from_{message.from_user.id}"
+            )
+        except ValueError:
+            sender_balance = await wallet_service.get_balance(sender.id)
             await message.answer(f"❌ Недостаточно средств!\n\n"
                               f"💰 Ваш баланс: <b>${format_money(sender_balance)}</b>\n"
                               f"💸 Требуется: <b>${format_money(amount_cents)}</b>")
             return
         
-        # Выполняем перевод
-        # Списываем с отправителя
-        await wallet_service.debit(sender.id, amount_cents, f"transfer_to_{recipient_id}")
-        
-        # Зачисляем получателю
-        await wallet_service.credit(recipient.id, amount_cents, f"transfer_from_{message.from_user.id}")
-        
-        # Получаем новые балансы
-        new_sender_balance = await wallet_service.get_balance(sender.id)
-        new_recipient_balance = await wallet_service.get_balance(recipient.id)
+        new_sender_balance = transfer.sender_balance_cents
+        new_recipient_balance = transfer.recipient_balance_cents
         
         # Формируем сообщение об успешном переводе
         sender_name = message.from_user.username or message.from_user.first_name
@@ -3270,7 +1537,7 @@ async def transfer_money_reply_command(message: Message):
 
 # --- КОРОТКИЙ АЛИАС КОМАНДЫ ПЕРЕВОДА ---
 
-@router.message(lambda message: message.text and message.text.lower().startswith('п '))
+@router.message(lambda message: message.text and message.text.lower().startswith('п '), flags={'wallet_lock': 'reject'})
 async def transfer_money_short_command(message: Message):
     """Обрабатывает короткую команду 'п [сумма] [айди пользователя]'"""
     try:
@@ -3361,26 +1628,25 @@ async def transfer_money_short_command(message: Message):
                 await session.commit()
                 await session.refresh(recipient)
         
-        # Получаем баланс отправителя
-        sender_balance = await wallet_service.get_balance(sender.id)
-        
-        # Проверяем достаточность средств
-        if sender_balance < amount_cents:
+        # Выполняем перевод: списание и зачисление - одна операция,
+        # балансы обоих приходят вместе с результатом
+        try:
+            transfer = await wallet_service.transfer(
+                sender.id,
+                recipient.id,
+                amount_cents,
+                f"transfer_to_{recipient_id}",
+                f"transfer_from_{message.from_user.id}"
+            )
+        except ValueError:
+            sender_balance = await wallet_service.get_balance(sender.id)
             await message.answer(f"❌ Недостаточно средств!\n\n"
                               f"💰 Ваш баланс: <b>${format_money(sender_balance)}</b>\n"
                               f"💸 Требуется: <b>${format_money(amount_cents)}</b>")
             return
         
-        # Выполняем перевод
-        # Списываем с отправителя
-        await wallet_service.debit(sender.id, amount_cents, f"transfer_to_{recipient_id}")
-        
-        # Зачисляем получателю
-        await wallet_service.credit(recipient.id, amount_cents, f"transfer_from_{message.from_user.id}")
-        
-        # Получаем новые балансы
-        new_sender_balance = await wallet_service.get_balance(sender.id)
-        new_recipient_balance = await wallet_service.get_balance(recipient.id)
+        new_sender_balance = transfer.sender_balance_cents
+        new_recipient_balance = transfer.recipient_balance_cents
         
         # Формируем сообщение об успешном переводе
         sender_name = message.from_user.username or message.from_user.first_name
@@ -3412,36 +1678,33 @@ async def transfer_money_short_command(message: Message):
 # --- АЛИАСЫ ДЛЯ ПОКАЗА БАЛАНСА ---
 
 @router.message(lambda message: message.text and message.text.lower() in ['б', 'баланс', 'м', 'мешок'])
-async def show_balance_aliases(message: Message):
+async def show_balance_aliases(message: Message, user_context: Optional[UserContext] = None):
     """Показывает баланс по алиасам: б, баланс, м, мешок"""
     try:
         # Проверка блокировки
         if await check_if_banned(message):
             return
         
-        from src.database import async_session_maker
-        telegram_id = message.from_user.id
+        user = await user_cache.get(message.from_user.id)
 
-        async with async_session_maker() as session:
-            result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
-            )
-            user = result.scalar_one_or_none()
-
-            if not user:
-                await message.answer("❌ Сначала запустите бота командой /start")
-                return
+        if not user:
+            await message.answer("❌ Сначала запустите бота командой /start")
+            return
 
+        # Баланс уже загружен middleware вместе с пользователем
+        if user_context:
+            balance = await user_context.get_balance()
+        else:
             balance = await wallet_service.get_balance(user.id)
-            
-            # Формируем сообщение с упоминанием пользователя в группах
-            if message.chat.type in ['group', 'supergroup']:
-                username = message.from_user.username or message.from_user.first_name
-                text = f"@{username}, 💰 Твой баланс: <b>${balance / 100:.2f}</b>"
-            else:
-                text = f"💰 Твой баланс: <b>${balance / 100:.2f}</b>"
+        
+        # Формируем сообщение с упоминанием пользователя в группах
+        if message.chat.type in ['group', 'supergroup']:
+            username = message.from_user.username or message.from_user.first_name
+            text = f"@{username}, 💰 Твой баланс: <b>${balance / 100:.2f}</b>"
+        else:
+            text = f"💰 Твой баланс: <b>${balance / 100:.2f}</b>"
 
-            await message.answer(text)
+        await message.answer(text)
             
     except Exception as e:
         await message.answer("❌ Произошла ошибка при получении баланса. Попробуйте позже.")
@@ -3463,35 +1726,44 @@ def is_admin(user_id: int) -> bool:
     except Exception:
         return False
 
+async def _clear_expired_rig_field(user_id: int, field: str):
+    """Очищает истекшую подкрутку/открутку и сбрасывает пользователя из кэша"""
+    from src.database import async_session_maker
+    from src.models import User
+    from sqlalchemy import update
+    
+    async with async_session_maker() as session:
+        await session.execute(
+            update(User).where(User.telegram_id == user_id).values({field: None})
+        )
+        await session.commit()
+    user_cache.invalidate(user_id)
+
+
+async def _get_active_rig_until(user_id: int, field: str):
+    """Возвращает время окончания подкрутки/открутки (rig_until/unrig_until) или None"""
+    from datetime import datetime
+    
+    user = await user_cache.get(user_id)
+    active_until = getattr(user, field, None) if user else None
+    
+    if not active_until:
+        return None
+    
+    # Проверяем не истекла ли подкрутка/открутка
+    if datetime.utcnow() > active_until:
+        await _clear_expired_rig_field(user_id, field)
+        logger.debug(f"{field} expired for user {user_id}")
+        return None
+    
+    return active_until
+
+
 async def get_user_rig_info(user_id: int):
     """Возвращает статус подкрутки и время окончания"""
     try:
-        from src.database import async_session_maker
-        from src.models import User
-        from sqlalchemy import select
-        from datetime import datetime
-        
-        async with async_session_maker() as session:
-            
-            user_query = select(User).where(User.telegram_id == user_id)
-            user_result = await session.execute(user_query)
-            user = user_result.scalar_one_or_none()
-            
-            print(f"DEBUG RIG INFO: User {user_id}, user found: {user is not None}, rig_until: {getattr(user, 'rig_until', None) if user else None}")
-            
-            if not user or not user.rig_until:
-                return False, None
-            
-            # Проверяем не истекла ли подкрутка
-            if datetime.utcnow() > user.rig_until:
-                # Очищаем истекшую подкрутку
-                user.rig_until = None
-                await session.commit()
-                print(f"DEBUG RIG INFO: Rig expired for user {user_id}")
-                return False, None
-            
-            print(f"DEBUG RIG INFO: Rig active for user {user_id} until {user.rig_until}")
-            return True, user.rig_until
+        rig_until = await _get_active_rig_until(user_id, 'rig_until')
+        return rig_until is not None, rig_until
     except Exception as e:
         print(f"Rig info error: {e}")
         return False, None
@@ -3499,101 +1771,21 @@ async def get_user_rig_info(user_id: int):
 async def get_user_unrig_info(user_id: int):
     """Возвращает статус открутки и время окончания"""
     try:
-        from src.database import async_session_maker
-        from src.models import User
-        from sqlalchemy import select
-        from datetime import datetime
-        
-        async with async_session_maker() as session:
-            
-            user_query = select(User).where(User.telegram_id == user_id)
-            user_result = await session.execute(user_query)
-            user = user_result.scalar_one_or_none()
-            
-            print(f"DEBUG UNRIG INFO: User {user_id}, user found: {user is not None}, unrig_until: {getattr(user, 'unrig_until', None) if user else None}")
-            
-            if not user or not user.unrig_until:
-                return False, None
-            
-            # Проверяем не истекла ли открутка
-            if datetime.utcnow() > user.unrig_until:
-                # Очищаем истекшую открутку
-                user.unrig_until = None
-                await session.commit()
-                print(f"DEBUG UNRIG INFO: Unrig expired for user {user_id}")
-                return False, None
-            
-            print(f"DEBUG UNRIG INFO: Unrig active for user {user_id} until {user.unrig_until}")
-            return True, user.unrig_until
+        unrig_until = await _get_active_rig_until(user_id, 'unrig_until')
+        return unrig_until is not None, unrig_until
     except Exception as e:
         print(f"Unrig info error: {e}")
         return False, None
 
 async def is_user_rigged(user_id: int) -> bool:
     """Проверяет, активна ли подкрутка у пользователя"""
-    try:
-        from src.database import async_session_maker
-        from src.models import User
-        from sqlalchemy import select
-        from datetime import datetime
-        
-        async with async_session_maker() as session:
-            
-            user_query = select(User).where(User.telegram_id == user_id)
-            user_result = await session.execute(user_query)
-            user = user_result.scalar_one_or_none()
-            
-            print(f"DEBUG RIG: User {user_id}, user found: {user is not None}, rig_until: {getattr(user, 'rig_until', None) if user else None}")
-            
-            if not user or not user.rig_until:
-                return False
-            
-            # Проверяем не истекла ли подкрутка
-            if datetime.utcnow() > user.rig_until:
-                # Очищаем истекшую подкрутку
-                user.rig_until = None
-                await session.commit()
-                print(f"DEBUG RIG: Rig expired for user {user_id}")
-                return False
-            
-            print(f"DEBUG RIG: Rig active for user {user_id} until {user.rig_until}")
-            return True
-    except Exception as e:
-        print(f"Rig check error: {e}")
-        return False
+    is_rigged, _ = await get_user_rig_info(user_id)
+    return is_rigged
 
 async def is_user_unrigged(user_id: int) -> bool:
     """Проверяет, активна ли открутка у пользователя"""
-    try:
-        from src.database import async_session_maker
-        from src.models import User
-        from sqlalchemy import select
-        from datetime import datetime
-        
-        async with async_session_maker() as session:
-            
-            user_query = select(User).where(User.telegram_id == user_id)
-            user_result = await session.execute(user_query)
-            user = user_result.scalar_one_or_none()
-            
-            print(f"DEBUG UNRIG: User {user_id}, user found: {user is not None}, unrig_until: {getattr(user, 'unrig_until', None) if user else None}")
-            
-            if not user or not user.unrig_until:
-                return False
-            
-            # Проверяем не истекла ли открутка
-            if datetime.utcnow() > user.unrig_until:
-                # Очищаем истекшую открутку
-                user.unrig_until = None
-                await session.commit()
-                print(f"DEBUG UNRIG: Unrig expired for user {user_id}")
-                return False
-            
-            print(f"DEBUG UNRIG: Unrig active for user {user_id} until {user.unrig_until}")
-            return True
-    except Exception as e:
-        print(f"Unrig check error: {e}")
-        return False
+    is_unrigged, _ = await get_user_unrig_info(user_id)
+    return is_unrigged
 
 # --- КОМАНДА ПОДКРУТКИ ---
 
@@ -3702,6 +1894,7 @@ async def rig_user_command(message: Message):
             
             target.rig_until = rig_until
             await session.commit()
+            user_cache.invalidate(target_id)
             print(f"DEBUG RIG SET: Successfully set rig_until for user {target_id}")
         
         # Форматируем время для отображения
@@ -3833,6 +2026,7 @@ async def unrig_user_command(message: Message):
             
             target.unrig_until = unrig_until
             await session.commit()
+            user_cache.invalidate(target_id)
             print(f"DEBUG UNRIG SET: Successfully set unrig_until for user {target_id}")
         
         # Форматируем время для отображения
@@ -4038,7 +2232,9 @@ async def disable_rig_command(message: Message):
         async with async_session_maker() as session:
             target.rig_until = None
             target.unrig_until = None
+            session.add(target)
             await session.commit()
+            user_cache.invalidate(target_id)
         
         # Красивое сообщение об успехе
         success_text = f"🔧 <b>ПОДКРУТКА И ОТКРУТКА ОТКЛЮЧЕНЫ!</b> 🔧\n\n"
@@ -4055,7 +2251,7 @@ async def disable_rig_command(message: Message):
 
 # --- КОМАНДА ОГРАБЛЕНИЯ ---
 
-@router.message(lambda message: message.text and message.text.lower().startswith('ограбить '))
+@router.message(lambda message: message.text and message.text.lower().startswith('ограбить '), flags={'wallet_lock': 'reject'})
 async def rob_user_command(message: Message):
     """Обрабатывает команду 'ограбить [айди пользователя]'"""
     try:
@@ -4097,7 +2293,7 @@ async def rob_user_command(message: Message):
         print(f"Rob command error: {e}")
 
 
-@router.message(lambda message: message.reply_to_message and message.text and message.text.lower() == 'ограбить')
+@router.message(lambda message: message.reply_to_message and message.text and message.text.lower() == 'ограбить', flags={'wallet_lock': 'reject'})
 async def rob_user_reply_command(message: Message):
     """Обрабатывает команду 'ограбить' в ответ на сообщение пользователя"""
     try:
@@ -4217,19 +2413,22 @@ async def start_rob_process(message: Message, target_id: int):
                 if stolen_amount > target_balance:
                     stolen_amount = target_balance
                 
-                # Списываем с цели
-                await wallet_service.debit(target.id, stolen_amount, f"robbed_by_{message.from_user.id}")
-                
-                # Зачисляем грабителю
-                await wallet_service.credit(robber.id, stolen_amount, f"robbed_from_{target_id}")
+                # Переводим от цели грабителю одной операцией
+                transfer = await wallet_service.transfer(
+                    target.id,
+                    robber.id,
+                    stolen_amount,
+                    f"robbed_by_{message.from_user.id}",
+                    f"robbed_from_{target_id}"
+                )
                 
                 # Обновляем время последнего ограбления
                 async with async_session_maker() as session:
                     robber.last_rob_time = datetime.utcnow()
                     await session.commit()
+                    user_cache.invalidate(robber.telegram_id)
                 
-                # Получаем новые балансы
-                new_robber_balance = await wallet_service.get_balance(robber.id)
+                new_robber_balance = transfer.recipient_balance_cents
                 
                 # Красивое сообщение об успехе
                 success_text = f"🎉 <b>ОГРАБЛЕНИЕ УСПЕШНО!</b> 🎉\n\n"
@@ -4248,7 +2447,7 @@ async def start_rob_process(message: Message, target_id: int):
                     victim_text = f"🚨 <b>Вас ограбили!</b> 🚨\n\n"
                     victim_text += f"💰 Потеряно: <b>${format_money(stolen_amount)}</b>\n"
                     victim_text += f"🔫 Грабитель: @{message.from_user.username or message.from_user.first_name}\n"
-                    victim_text += f"💵 Ваш баланс: <b>${format_money(await wallet_service.get_balance(target.id))}</b>"
+                    victim_text += f"💵 Ваш баланс: <b>${format_money(transfer.sender_balance_cents)}</b>"
                     
                     await message.bot.send_message(target_id, victim_text)
                 except Exception:
@@ -4264,15 +2463,15 @@ async def start_rob_process(message: Message, target_id: int):
                     penalty_amount = robber_balance
                 
                 # Списываем штраф с грабителя
-                await wallet_service.debit(robber.id, penalty_amount, f"rob_failed_penalty")
+                penalty = await wallet_service.debit(robber.id, penalty_amount, f"rob_failed_penalty")
                 
                 # Обновляем время последнего ограбления
                 async with async_session_maker() as session:
                     robber.last_rob_time = datetime.utcnow()
                     await session.commit()
+                    user_cache.invalidate(robber.telegram_id)
                 
-                # Получаем новый баланс
-                new_robber_balance = await wallet_service.get_balance(robber.id)
+                new_robber_balance = penalty.new_balance_cents
                 
                 # Красивое сообщение о неудаче
                 fail_text = f"💥 <b>ОГРАБЛЕНИЕ ПРОВАЛИЛОСЬ!</b> 💥\n\n"
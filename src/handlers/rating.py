@@ -7,6 +7,8 @@ from datetime import datetime
 from src.models import User
 from src.services.rating_service import RatingService, CreditService, VIPService
 from src.services.wallet_service import wallet_service
+from src.services.user_cache import user_cache
+from src.services.leaderboard import leaderboard_engine
 from src.utils.keyboards import get_back_keyboard
 from src.utils.ban_check import check_if_banned
 
@@ -96,7 +98,7 @@ async def show_leaderboard(callback: CallbackQuery):
         'monthly': 'месячный'
     }
     
-    leaderboard = await RatingService.get_leaderboard(period, 10)
+    leaderboard = await leaderboard_engine.get_top(period, 10)
     
     if not leaderboard:
         text = f"📊 <b>{period_names[period].title()} лидерборд</b>\n\n❌ Пока нет данных за этот период"
@@ -116,6 +118,15 @@ async def show_leaderboard(callback: CallbackQuery):
             text += f"   📈 Винрейт: {win_rate}%\n"
             text += f"   🎮 Игр: {player['total_bets']}\n\n"
     
+    # Место текущего игрока
+    user = await user_cache.get(callback.from_user.id)
+    if user:
+        my_rank = await leaderboard_engine.get_rank(period, user.id)
+        if my_rank:
+            text += f"📍 Ваше место: <b>{my_rank['position']}</b> (${my_rank['total_winnings'] / 100:.2f})"
+        else:
+            text += "📍 Вы пока не в рейтинге этого периода"
+    
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔙 Назад", callback_data="leaderboard:menu")]
     ])
@@ -130,15 +141,12 @@ async def show_user_rewards(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     # Получаем пользователя из БД
-    from src.database import async_session_maker
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.telegram_id == user_id))
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("❌ Пользователь не найден", show_alert=True)
-            return
+    user = await user_cache.get(user_id)
     
+    if not user:
+        await callback.answer("❌ Пользователь не найден", show_alert=True)
+        return
+
     rewards = await RatingService.get_user_rewards(user.id)
     
     if not rewards:
@@ -184,75 +192,67 @@ async def credits_menu(callback: CallbackQuery):
     if await check_if_banned(callback):
         return
     
-    from src.database import get_session
-    from src.models import User
     from src.services.rating_service import CreditService
     
     telegram_id = callback.from_user.id
     
-    async for session in get_session():
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("❌ Пользователь не найден")
-            return
-        
-        if not user.is_vip:
-            await callback.answer("❌ Кредиты доступны только VIP пользователям")
-            return
-        
-        # Получаем доступные кредиты
-        available_credits = await CreditService.get_available_credits(user.id)
-        
-        text = "💳 <b>Система кредитов</b>\n\n"
-        text += "💰 <b>Доступные кредиты:</b>\n"
-        
-        if available_credits:
-            for credit in available_credits:
-                amount = credit['amount'] / 100
-                limit_type = credit['limit_type']
-                
-                if limit_type == 'daily_1k':
-                    text += f"├ 💵 $1000 (каждые 3 дня)\n"
-                elif limit_type == 'weekly_5k':
-                    text += f"├ 💰 $5000 (каждую неделю)\n"
-                elif limit_type == 'monthly_15k':
-                    text += f"├ 💎 $15000 (каждый месяц)\n"
-        else:
-            text += "├ ❌ Нет доступных кредитов\n"
-        
-        text += "\n💡 <b>Условия:</b>\n"
-        text += "├ 📅 Возврат через 7 дней\n"
-        text += "├ 📈 Процент: 10%\n"
-        text += "└ ⚠️ При просрочке: блокировка аккаунта"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💵 Взять $1000", callback_data="credit:take:1000")],
-            [InlineKeyboardButton(text="💰 Взять $5000", callback_data="credit:take:5000")],
-            [InlineKeyboardButton(text="💎 Взять $15000", callback_data="credit:take:15000")],
-            [InlineKeyboardButton(text="📋 Мои кредиты", callback_data="credit:list")],
-            [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_profile")]
-        ])
-        
-        try:
-            await callback.message.edit_text(text, reply_markup=keyboard)
-        except:
-            await callback.message.answer(text, reply_markup=keyboard)
-        
-        await callback.answer()
+    user = await user_cache.get(telegram_id)
+    
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    if not user.is_vip:
+        await callback.answer("❌ Кредиты доступны только VIP пользователям")
+        return
+    
+    # Получаем доступные кредиты
+    available_credits = await CreditService.get_available_credits(user.id)
+    
+    text = "💳 <b>Система кредитов</b>\n\n"
+    text += "💰 <b>Доступные кредиты:</b>\n"
+    
+    if available_credits:
+        for credit in available_credits:
+            amount = credit['amount'] / 100
+            limit_type = credit['limit_type']
+            
+            if limit_type == 'daily_1k':
+                text += f"├ 💵 $1000 (каждые 3 дня)\n"
+            elif limit_type == 'weekly_5k':
+                text += f"├ 💰 $5000 (каждую неделю)\n"
+            elif limit_type == 'monthly_15k':
+                text += f"├ 💎 $15000 (каждый месяц)\n"
+    else:
+        text += "├ ❌ Нет доступных кредитов\n"
+    
+    text += "\n💡 <b>Условия:</b>\n"
+    text += "├ 📅 Возврат через 7 дней\n"
+    text += "├ 📈 Процент: 10%\n"
+    text += "└ ⚠️ При просрочке: блокировка аккаунта"
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💵 Взять $1000", callback_data="credit:take:1000")],
+        [InlineKeyboardButton(text="💰 Взять $5000", callback_data="credit:take:5000")],
+        [InlineKeyboardButton(text="💎 Взять $15000", callback_data="credit:take:15000")],
+        [InlineKeyboardButton(text="📋 Мои кредиты", callback_data="credit:list")],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_profile")]
+    ])
+    
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except:
+        await callback.message.answer(text, reply_markup=keyboard)
+    
+    await callback.answer()
 
 
-@router.callback_query(F.data.startswith("credit:take:"))
+@router.callback_query(F.data.startswith("credit:take:"), flags={'wallet_lock': 'reject'})
 async def take_credit(callback: CallbackQuery):
     """Взятие кредита"""
     if await check_if_banned(callback):
         return
     
-    from src.database import get_session
-    from src.models import User
     from src.services.rating_service import CreditService
     from src.services.wallet_service import wallet_service
     
@@ -260,44 +260,40 @@ async def take_credit(callback: CallbackQuery):
     amount_str = callback.data.split(":")[2]
     amount_cents = int(amount_str) * 100
     
-    async for session in get_session():
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("❌ Пользователь не найден")
-            return
-        
-        if not user.is_vip:
-            await callback.answer("❌ Кредиты доступны только VIP пользователям")
-            return
-        
-        # Определяем тип лимита
-        if amount_cents == 100000:  # $1000
-            limit_type = 'daily_1k'
-        elif amount_cents == 500000:  # $5000
-            limit_type = 'weekly_5k'
-        elif amount_cents == 1500000:  # $15000
-            limit_type = 'monthly_15k'
-        else:
-            await callback.answer("❌ Неверная сумма кредита")
-            return
+    user = await user_cache.get(telegram_id)
+    
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    if not user.is_vip:
+        await callback.answer("❌ Кредиты доступны только VIP пользователям")
+        return
+    
+    # Определяем тип лимита
+    if amount_cents == 100000:  # $1000
+        limit_type = 'daily_1k'
+    elif amount_cents == 500000:  # $5000
+        limit_type = 'weekly_5k'
+    elif amount_cents == 1500000:  # $15000
+        limit_type = 'monthly_15k'
+    else:
+        await callback.answer("❌ Неверная сумма кредита")
+        return
+    
+    # Проверяем доступность кредита
+    success = await CreditService.take_credit(user.id, amount_cents, limit_type)
+    
+    if success:
+        # Добавляем деньги на баланс
+        await wallet_service.credit(user.id, amount_cents, "credit")
         
-        # Проверяем доступность кредита
-        success = await CreditService.take_credit(user.id, amount_cents, limit_type)
+        await callback.answer(f"✅ Кредит ${amount_str} выдан успешно!")
         
-        if success:
-            # Добавляем деньги на баланс
-            await wallet_service.credit(user.id, amount_cents, "credit")
-            
-            await callback.answer(f"✅ Кредит ${amount_str} выдан успешно!")
-            
-            # Возвращаемся в меню кредитов
-            await credits_menu(callback)
-        else:
-            await callback.answer("❌ Кредит недоступен. Проверьте лимиты.")
+        # Возвращаемся в меню кредитов
+        await credits_menu(callback)
+    else:
+        await callback.answer("❌ Кредит недоступен. Проверьте лимиты.")
 
 
 @router.callback_query(F.data == "credit:list")
@@ -306,72 +302,66 @@ async def list_credits(callback: CallbackQuery):
     if await check_if_banned(callback):
         return
     
-    from src.database import get_session
-    from src.models import User
     from src.services.rating_service import CreditService
     
     telegram_id = callback.from_user.id
     
-    async for session in get_session():
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("❌ Пользователь не найден")
-            return
-        
-        # Получаем активные кредиты
-        active_credits = await CreditService.get_user_credits(user.id)
-        
-        text = "📋 <b>Мои кредиты</b>\n\n"
-        
-        keyboard_buttons = []
-        
-        if active_credits:
-            for credit in active_credits:
-                amount = credit['amount'] / 100
-                amount_to_repay = credit['amount_to_repay'] / 100
-                status_icons = {
-                    'active': '🟢',
-                    'overdue': '🔴',
-                    'paid': '✅'
-                }
-                status_text = {
-                    'active': 'Активный',
-                    'overdue': 'Просрочен',
-                    'paid': 'Погашен'
-                }
-                
-                text += f"💳 <b>Кредит ${amount:.0f}</b>\n"
-                text += f"   💸 К возврату: ${amount_to_repay:.0f}\n"
-                text += f"   📅 Выдан: {credit['issued_at'].strftime('%d.%m.%Y')}\n"
-                text += f"   ⏰ Срок: {credit['due_date'].strftime('%d.%m.%Y')}\n"
-                text += f"   {status_icons[credit['status']]} {status_text[credit['status']]}\n\n"
-                
-                # Добавляем кнопку возврата для активных кредитов
-                if credit['status'] == 'active':
-                    keyboard_buttons.append([
-                        InlineKeyboardButton(
-                            text=f"💰 Вернуть ${amount_to_repay:.0f}", 
-                            callback_data=f"credit:repay:{credit['id']}"
-                        )
-                    ])
-        else:
-            text += "📝 У вас нет активных кредитов"
-        
-        # Добавляем кнопку "Назад"
-        keyboard_buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="credits:menu")])
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-        
-        try:
-            await callback.message.edit_text(text, reply_markup=keyboard)
-        except:
-            await callback.message.answer(text, reply_markup=keyboard)
-        
-        await callback.answer()
+    user = await user_cache.get(telegram_id)
+    
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    # Получаем активные кредиты
+    active_credits = await CreditService.get_user_credits(user.id)
+    
+    text = "📋 <b>Мои кредиты</b>\n\n"
+    
+    keyboard_buttons = []
+    
+    if active_credits:
+        for credit in active_credits:
+            amount = credit['amount'] / 100
+            amount_to_repay = credit['amount_to_repay'] / 100
+            status_icons = {
+                'active': '🟢',
+                'overdue': '🔴',
+                'paid': '✅'
+            }
+            status_text = {
+                'active': 'Активный',
+                'overdue': 'Просрочен',
+                'paid': 'Погашен'
+            }
+            
+            text += f"💳 <b>Кредит ${amount:.0f}</b>\n"
+            text += f"   💸 К возврату: ${amount_to_repay:.0f}\n"
+            text += f"   📅 Выдан: {credit['issued_at'].strftime('%d.%m.%Y')}\n"
+            text += f"   ⏰ Срок: {credit['due_date'].strftime('%d.%m.%Y')}\n"
+            text += f"   {status_icons[credit['status']]} {status_text[credit['status']]}\n\n"
+            
+            # Добавляем кнопку возврата для активных кредитов
+            if credit['status'] == 'active':
+                keyboard_buttons.append([
+                    InlineKeyboardButton(
+                        text=f"💰 Вернуть ${amount_to_repay:.0f}", 
+                        callback_data=f"credit:repay:{credit['id']}"
+                    )
+                ])
+    else:
+        text += "📝 У вас нет активных кредитов"
+    
+    # Добавляем кнопку "Назад"
+    keyboard_buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="credits:menu")])
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except:
+        await callback.message.answer(text, reply_markup=keyboard)
+    
+    await callback.answer()
 
 
 @router.callback_query(F.data == "vip:bonuses")
@@ -380,94 +370,82 @@ async def vip_bonuses(callback: CallbackQuery):
     if await check_if_banned(callback):
         return
     
-    from src.database import get_session
-    from src.models import User
     
     telegram_id = callback.from_user.id
     
-    async for session in get_session():
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("❌ Пользователь не найден")
-            return
-        
-        if not user.is_vip:
-            await callback.answer("❌ VIP бонусы доступны только VIP пользователям")
-            return
-        
-        # Статус бонусов
-        cashback_status = "✅ Включен" if user.vip_cashback_enabled else "❌ Выключен"
-        multiplier_status = "✅ Включен" if user.vip_multiplier_enabled else "❌ Выключен"
-        
-        text = "⭐ <b>VIP бонусы</b>\n\n"
-        text += "💰 <b>Возврат средств:</b>\n"
-        text += f"├ Статус: {cashback_status}\n"
-        text += f"├ Процент: {user.vip_cashback_percentage}%\n"
-        text += f"└ Возврат части проигранной суммы\n\n"
-        text += "🎯 <b>Множитель выигрышей:</b>\n"
-        text += f"├ Статус: {multiplier_status}\n"
-        text += f"├ Множитель: {user.vip_multiplier_value/100:.1f}x\n"
-        text += f"└ Увеличение выигрышей на 30%\n\n"
-        text += "💡 <b>Как работает:</b>\n"
-        text += "├ При проигрыше: возврат части суммы\n"
-        text += "└ При выигрыше: увеличение приза"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text=f"💰 Возврат: {'Выключить' if user.vip_cashback_enabled else 'Включить'}", 
-                callback_data=f"vip:toggle:cashback"
-            )],
-            [InlineKeyboardButton(
-                text=f"🎯 Множитель: {'Выключить' if user.vip_multiplier_enabled else 'Включить'}", 
-                callback_data=f"vip:toggle:multiplier"
-            )],
-            [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_profile")]
-        ])
-        
-        try:
-            await callback.message.edit_text(text, reply_markup=keyboard)
-        except:
-            await callback.message.answer(text, reply_markup=keyboard)
-        
-        await callback.answer()
+    user = await user_cache.get(telegram_id)
+    
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    if not user.is_vip:
+        await callback.answer("❌ VIP бонусы доступны только VIP пользователям")
+        return
+    
+    # Статус бонусов
+    cashback_status = "✅ Включен" if user.vip_cashback_enabled else "❌ Выключен"
+    multiplier_status = "✅ Включен" if user.vip_multiplier_enabled else "❌ Выключен"
+    
+    text = "⭐ <b>VIP бонусы</b>\n\n"
+    text += "💰 <b>Возврат средств:</b>\n"
+    text += f"├ Статус: {cashback_status}\n"
+    text += f"├ Процент: {user.vip_cashback_percentage}%\n"
+    text += f"└ Возврат части проигранной суммы\n\n"
+    text += "🎯 <b>Множитель выигрышей:</b>\n"
+    text += f"├ Статус: {multiplier_status}\n"
+    text += f"├ Множитель: {user.vip_multiplier_value/100:.1f}x\n"
+    text += f"└ Увеличение выигрышей на 30%\n\n"
+    text += "💡 <b>Как работает:</b>\n"
+    text += "├ При проигрыше: возврат части суммы\n"
+    text += "└ При выигрыше: увеличение приза"
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"💰 Возврат: {'Выключить' if user.vip_cashback_enabled else 'Включить'}", 
+            callback_data=f"vip:toggle:cashback"
+        )],
+        [InlineKeyboardButton(
+            text=f"🎯 Множитель: {'Выключить' if user.vip_multiplier_enabled else 'Включить'}", 
+            callback_data=f"vip:toggle:multiplier"
+        )],
+        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_profile")]
+    ])
+    
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except:
+        await callback.message.answer(text, reply_markup=keyboard)
+    
+    await callback.answer()
 
 
-@router.callback_query(F.data.startswith("credit:repay:"))
+@router.callback_query(F.data.startswith("credit:repay:"), flags={'wallet_lock': 'reject'})
 async def repay_credit(callback: CallbackQuery):
     """Возврат кредита"""
     if await check_if_banned(callback):
         return
     
-    from src.database import get_session
-    from src.models import User
     from src.services.rating_service import CreditService
     
     telegram_id = callback.from_user.id
     credit_id = int(callback.data.split(":")[2])
     
-    async for session in get_session():
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await callback.answer("❌ Пользователь не найден")
-            return
-        
-        # Возвращаем кредит
-        success, message = await CreditService.repay_credit(user.id, credit_id)
-        
-        if success:
-            await callback.answer(f"✅ {message}")
-            # Возвращаемся к списку кредитов
-            await list_credits(callback)
-        else:
-            await callback.answer(f"❌ {message}")
+    user = await user_cache.get(telegram_id)
+    
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    # Возвращаем кредит
+    success, message = await CreditService.repay_credit(user.id, credit_id)
+    
+    if success:
+        await callback.answer(f"✅ {message}")
+        # Возвращаемся к списку кредитов
+        await list_credits(callback)
+    else:
+        await callback.answer(f"❌ {message}")
 
 
 @router.callback_query(F.data.startswith("vip:toggle:"))
@@ -477,7 +455,6 @@ async def toggle_vip_bonus(callback: CallbackQuery):
         return
     
     from src.database import get_session
-    from src.models import User
     
     telegram_id = callback.from_user.id
     bonus_type = callback.data.split(":")[2]
@@ -507,6 +484,7 @@ async def toggle_vip_bonus(callback: CallbackQuery):
             await callback.answer(f"🎯 Множитель выигрышей {status}")
         
         await session.commit()
+        user_cache.invalidate(telegram_id)
         
         # Возвращаемся в меню VIP бонусов
         await vip_bonuses(callback)
@@ -10,6 +10,7 @@ from src.models import User, Bet, Transaction, UserAchievement, Wallet # Доб
 from src.database import async_session_maker
 from src.services.wallet_service import wallet_service
 from src.services.bet_service import bet_service
+from src.services.user_cache import user_cache
 # Импортируем клавиатуры
 from src.utils.keyboards import get_settings_keyboard, get_main_menu_keyboard
 from src.states import DeletionStates
@@ -29,18 +30,13 @@ async def cmd_settings(message: Message):
     if await check_if_banned(message):
         return
     
-    from src.database import async_session_maker
     telegram_id = message.from_user.id
 
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
+    user = await user_cache.get(telegram_id)
 
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    if not user:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     # Определяем язык пользователя (если в модели есть language_code, иначе по умолчанию 'ru')
     lang = getattr(user, 'language_code', 'ru')
@@ -71,18 +67,13 @@ async def trigger_settings(message: Message):
         return
     
     # Если ЛС - выполняем логику команды settings (без клавиатуры в группе, она и так не отправляется в ЛС)
-    from src.database import async_session_maker
     telegram_id = message.from_user.id
 
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
+    user = await user_cache.get(telegram_id)
 
-        if not user:
-            await message.answer("❌ Сначала запустите бота командой /start")
-            return
+    if not user:
+        await message.answer("❌ Сначала запустите бота командой /start")
+        return
 
     lang = getattr(user, 'language_code', 'ru')
 
@@ -522,6 +513,7 @@ async def confirm_deletion(message: Message, state: FSMContext):
         )
 
         await session.commit() # Коммитим все удаления вместе
+        user_cache.invalidate(telegram_id)
 
     await message.answer(
         "✅ Твой аккаунт успешно удалён.\n\n"
@@ -4,6 +4,7 @@ from aiogram.types import Message
 from sqlalchemy import select
 from src.models import User
 from src.services.wallet_service import wallet_service
+from src.services.user_cache import user_cache
 from src.config import settings
 from src.utils.keyboards import get_main_menu_keyboard, get_games_keyboard
 from src.i18n.translator import translator
@@ -58,6 +59,7 @@ async def cmd_start(message: Message):
             
             user.received_starter_bonus = True
             await session.commit()
+            user_cache.invalidate(telegram_id)
             
             # Приветствие
             text = translator.get(
@@ -0,0 +1,9 @@
+from .user_context import UserContext, UserContextMiddleware, user_context_middleware
+from .user_lock import UserLockMiddleware, user_lock_middleware
+from .rate_limiter import TelegramRateLimiter
+
+__all__ = [
+    'UserContext', 'UserContextMiddleware', 'user_context_middleware',
+    'UserLockMiddleware', 'user_lock_middleware',
+    'TelegramRateLimiter',
+]
@@ -0,0 +1,233 @@
+"""
+Middleware сессии бота: лимиты Telegram на исходящие запросы и склейка правок
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    TelegramMethod,
+)
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Правки, которые можно склеивать: важна только последняя версия сообщения
+COALESCED_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+# Без ожидания лимитов (не расходуют лимит сообщений чата)
+UNLIMITED_METHODS = (AnswerCallbackQuery,)
+
+
+class TokenBucket:
+    """
+    Token bucket без блокировок: reserve() сразу списывает токен
+    (баланс может уйти в минус) и говорит, сколько ждать до отправки.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def estimate(self, now: float) -> float:
+        """Сколько ждать следующего токена (без списания)"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def reserve(self, now: float) -> float:
+        """Списать токен и вернуть задержку до отправки"""
+        wait = self.estimate(now)
+        self.tokens -= 1
+        return wait
+
+    def block(self, seconds: float) -> None:
+        """Telegram попросил подождать (retry_after)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+@dataclass
+class _PendingEdit:
+    """Правка сообщения, ожидающая своей очереди"""
+    method: TelegramMethod
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Исходящие запросы к Bot API с учётом лимитов Telegram.
+
+    - Общий лимит бота (~30 запросов/с) и лимит чата: ~1/с в личке,
+      ~20/мин в группах (token buckets, небольшой burst).
+    - Правки одного сообщения, ожидающие отправки, склеиваются: уходит
+      только последний текст, все вызовы получают её результат.
+    - Если Telegram вернул retry_after, чат (или весь бот) блокируется на это
+      время и запрос повторяется до max_retries раз.
+    - Правка, которой пришлось бы ждать дольше max_edit_wait, отбрасывается
+      с TelegramRetryAfter: промежуточные кадры анимации не нужны.
+    """
+
+    PRIVATE_RATE = 1.0
+    PRIVATE_BURST = 3
+    GROUP_RATE = 20 / 60
+    GROUP_BURST = 3
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        max_retries: int = 3,
+        max_edit_wait: float = 10.0
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.max_retries = max_retries
+        self.max_edit_wait = max_edit_wait
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # (тип правки, chat_id, message_id) -> правка в очереди
+        self._pending_edits: Dict[Tuple[type, Any, Any], _PendingEdit] = {}
+
+        # Счётчики
+        self.sent = 0
+        self.delayed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.retried = 0
+
+    def _chat_bucket(self, chat_id: Any) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательные id - группы и каналы
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.GROUP_RATE, self.GROUP_BURST)
+            else:
+                bucket = TokenBucket(self.PRIVATE_RATE, self.PRIVATE_BURST)
+            self._chat_buckets[chat_id] = bucket
+            if len(self._chat_buckets) > 50000:
+                self._prune_buckets()
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        """Забыть чаты, бакеты которых давно полные"""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if bucket.estimate(now) == 0 and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        chat_id: Any
+    ) -> TelegramType:
+        """Дождаться токенов и отправить; на retry_after - подождать и повторить"""
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            now = time.monotonic()
+            wait = self.global_bucket.reserve(now)
+            if chat_bucket is not None:
+                wait = max(wait, chat_bucket.reserve(now))
+            if wait > 0:
+                self.delayed += 1
+                await asyncio.sleep(wait)
+
+            try:
+                result = await make_request(bot, method)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                (chat_bucket or self.global_bucket).block(e.retry_after)
+                if attempt >= self.max_retries:
+                    self.dropped += 1
+                    raise
+                self.retried += 1
+                logger.warning(f"⚠️ Telegram retry_after={e.retry_after}s for chat {chat_id}, retrying")
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> TelegramType:
+        if isinstance(method, UNLIMITED_METHODS):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, 'chat_id', None)
+        message_id = getattr(method, 'message_id', None)
+        if not isinstance(method, COALESCED_METHODS) or chat_id is None or message_id is None:
+            return await self._send(make_request, bot, method, chat_id)
+
+        # Подменять можно только правку того же типа: правка одной клавиатуры
+        # не должна вытеснить ждущую правку текста
+        key = (type(method), chat_id, message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Уже есть правка в очереди: подменяем её текст и ждём общего результата
+            pending.method = method
+            self.coalesced += 1
+            return await pending.future
+
+        # Промежуточный кадр, которому пришлось бы долго ждать, не отправляем
+        now = time.monotonic()
+        wait = self.global_bucket.estimate(now)
+        chat_bucket = self._chat_bucket(chat_id)
+        if chat_bucket is not None:
+            wait = max(wait, chat_bucket.estimate(now))
+        if wait > self.max_edit_wait:
+            self.dropped += 1
+            raise TelegramRetryAfter(
+                method=method,
+                message="Edit dropped by rate limiter",
+                retry_after=int(wait) + 1
+            )
+
+        pending = _PendingEdit(method=method)
+        self._pending_edits[key] = pending
+        try:
+            if wait > 0:
+                self.delayed += 1
+                await asyncio.sleep(wait)
+            # С этого момента новые правки встают в следующую очередь
+            del self._pending_edits[key]
+            result = await self._send(make_request, bot, pending.method, chat_id)
+        except BaseException as e:
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            if not pending.future.done():
+                pending.future.set_exception(e)
+                # Исключение уже получит этот вызов, остальным - через future
+                pending.future.exception()
+            raise
+        pending.future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики лимитера"""
+        return {
+            'sent': self.sent,
+            'delayed': self.delayed,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'retried': self.retried,
+            'pending_edits': len(self._pending_edits),
+            'chats': len(self._chat_buckets),
+        }
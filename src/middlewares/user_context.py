@@ -0,0 +1,115 @@
+"""
+Middleware, передающий хендлерам пользователя (из user_cache) и баланс по требованию
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+from src.models import User
+from src.services.user_cache import user_cache
+from src.services.wallet_service import wallet_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UserContext:
+    """Данные пользователя для текущего апдейта"""
+    user: User
+    
+    # Баланс запрашивается при первом get_balance() и дальше берётся из контекста
+    balance_cents: Optional[int] = None
+    balance_queries: int = 0
+    # Сколько раз хендлер взял баланс из контекста вместо запроса к БД
+    balance_reads: int = 0
+    
+    @property
+    def is_banned(self) -> bool:
+        return bool(self.user.is_banned)
+    
+    async def get_balance(self) -> int:
+        """Баланс на момент первого обращения в этом апдейте"""
+        if self.balance_cents is None:
+            self.balance_queries += 1
+            self.balance_cents = await wallet_service.get_balance(self.user.id)
+        else:
+            self.balance_reads += 1
+        return self.balance_cents
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """
+    Outer middleware для апдейтов.
+    
+    Берёт пользователя через user_cache (обычный апдейт, в том числе болтовня
+    в группах, запросов к БД не делает) и передаёт хендлерам data['user_context'].
+    Баланс грузится только хендлерами, которым он нужен, - один раз за апдейт.
+    """
+    
+    LOG_EVERY = 1000  # Как часто писать метрики в лог (в апдейтах)
+    
+    def __init__(self):
+        # Метрики
+        self.updates = 0
+        self.queries = 0
+        self.queries_saved = 0
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user: Optional[TelegramUser] = data.get('event_from_user')
+        if from_user is None:
+            return await handler(event, data)
+        
+        try:
+            context, cache_hit = await self._load_context(from_user.id)
+        except Exception as e:
+            # Без контекста хендлеры работают как раньше - со своими запросами
+            logger.error(f"❌ User context load error: {e}")
+            context, cache_hit = None, False
+        data['user_context'] = context
+        
+        try:
+            return await handler(event, data)
+        finally:
+            self.updates += 1
+            # Промах кэша и первые чтения баланса - запросы к БД;
+            # попадание в кэш и повторные чтения баланса - сэкономленные.
+            # Считаем только свой поиск: общие счётчики кэша за время await
+            # набирают и параллельные апдейты
+            if cache_hit:
+                self.queries_saved += 1
+            else:
+                self.queries += 1
+            if context is not None:
+                self.queries += context.balance_queries
+                self.queries_saved += context.balance_reads
+            
+            if self.updates % self.LOG_EVERY == 0:
+                logger.info(f"📊 User context: {self.stats()}")
+    
+    async def _load_context(self, telegram_id: int) -> Tuple[Optional[UserContext], bool]:
+        """Пользователь из кэша (запрос к БД - только при промахе) и было ли попадание"""
+        user, cache_hit = await user_cache.lookup(telegram_id)
+        if user is None:
+            return None, cache_hit
+        return UserContext(user=user), cache_hit
+    
+    def stats(self) -> Dict[str, float]:
+        """Метрики middleware"""
+        return {
+            'updates': self.updates,
+            'queries': self.queries,
+            'queries_saved': self.queries_saved,
+            'saved_per_update': round(self.queries_saved / self.updates, 2) if self.updates else 0.0,
+        }
+
+
+user_context_middleware = UserContextMiddleware()
@@ -0,0 +1,61 @@
+"""
+Middleware, выполняющий операции с кошельком одного пользователя по очереди
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject, User as TelegramUser
+
+from src.services.user_lock import UserLockRegistry, user_lock_registry
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Предыдущая операция ещё выполняется"
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """
+    Inner middleware для message и callback_query.
+
+    Срабатывает только на хендлерах с флагом wallet_lock:
+    - flags={'wallet_lock': 'reject'} - повторный запрос, пока идёт предыдущий, сразу отклоняется
+    - flags={'wallet_lock': 'queue'} - ждёт своей очереди до QUEUE_TIMEOUT секунд
+    Остальные хендлеры и другие пользователи не блокируются.
+    """
+
+    QUEUE_TIMEOUT = 10.0
+
+    def __init__(self, registry: UserLockRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        mode = get_flag(data, 'wallet_lock')
+        from_user: Optional[TelegramUser] = data.get('event_from_user')
+        if not mode or from_user is None:
+            return await handler(event, data)
+
+        timeout = self.QUEUE_TIMEOUT if mode == 'queue' else 0
+        label = getattr(data.get('handler'), 'callback', None)
+        label = getattr(label, '__name__', 'handler')
+
+        async with self.registry.hold(from_user.id, label, timeout) as acquired:
+            if acquired:
+                return await handler(event, data)
+
+        # Дубликат: отвечаем дёшево, без обращения к БД
+        if isinstance(event, CallbackQuery):
+            await event.answer(BUSY_TEXT)
+        elif isinstance(event, Message) and event.chat.type == 'private':
+            await event.answer(BUSY_TEXT)
+        return None
+
+
+user_lock_middleware = UserLockMiddleware(user_lock_registry)
@@ -118,6 +118,7 @@ class Bet:
     nonce: Optional[int] = None
     status: str = 'completed'
     created_at: datetime = None
+    id: Optional[str] = None  # Ключ ставки в Redis
     
     def __post_init__(self):
         if self.created_at is None:
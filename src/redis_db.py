@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from datetime import datetime, timedelta
 import redis.asyncio as redis
 from src.config import settings
@@ -10,12 +10,111 @@ logger = logging.getLogger(__name__)
 # Глобальная переменная для Redis соединения
 redis_client: Optional[redis.Redis] = None
 
+# Множество id всех пользователей (SCARD даёт количество за O(1))
+USERS_SET_KEY = "users"
+
+# Атомарное списание: проверка баланса, списание и запись транзакции за один вызов.
+# KEYS[1] - кошелёк, KEYS[2] - транзакция, KEYS[3] - индекс транзакций пользователя
+# ARGV[1] - сумма в центах, ARGV[2] - данные транзакции (JSON), ARGV[3] - timestamp
+# Возвращает {1, новый_баланс} или {0, текущий_баланс}, если средств недостаточно
+DEBIT_SCRIPT = """
+local balance = tonumber(redis.call('HGET', KEYS[1], 'balance_cents') or '0')
+local amount = tonumber(ARGV[1])
+if balance < amount then
+    return {0, balance}
+end
+local new_balance = redis.call('HINCRBY', KEYS[1], 'balance_cents', -amount)
+redis.call('SET', KEYS[2], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[3], KEYS[2])
+return {1, new_balance}
+"""
+
+# Перевод между кошельками: проверка баланса, списание, зачисление и обе транзакции за один вызов.
+# KEYS[1] - кошелёк отправителя, KEYS[2] - кошелёк получателя,
+# KEYS[3]/KEYS[4] - транзакции списания/зачисления, KEYS[5]/KEYS[6] - их индексы
+# ARGV[1] - сумма в центах, ARGV[2]/ARGV[3] - транзакции (JSON), ARGV[4] - timestamp
+# Возвращает {1, баланс_отправителя, баланс_получателя} или {0, текущий_баланс}
+TRANSFER_SCRIPT = """
+local balance = tonumber(redis.call('HGET', KEYS[1], 'balance_cents') or '0')
+local amount = tonumber(ARGV[1])
+if balance < amount then
+    return {0, balance}
+end
+local sender_balance = redis.call('HINCRBY', KEYS[1], 'balance_cents', -amount)
+local recipient_balance = redis.call('HINCRBY', KEYS[2], 'balance_cents', amount)
+redis.call('SET', KEYS[3], ARGV[2])
+redis.call('ZADD', KEYS[5], ARGV[4], KEYS[3])
+redis.call('SET', KEYS[4], ARGV[3])
+redis.call('ZADD', KEYS[6], ARGV[4], KEYS[4])
+return {1, sender_balance, recipient_balance}
+"""
+
+# Открытие ставки: списание ставки, запись транзакции и самой ставки за один вызов.
+# KEYS[1] - кошелёк, KEYS[2] - транзакция, KEYS[3] - индекс транзакций,
+# KEYS[4] - ставка, KEYS[5] - индекс ставок
+# ARGV[1] - ставка в центах, ARGV[2] - транзакция (JSON), ARGV[3] - timestamp, ARGV[4] - ставка (JSON)
+# Возвращает {1, новый_баланс} или {0, текущий_баланс}, если средств недостаточно
+OPEN_BET_SCRIPT = """
+local balance = tonumber(redis.call('HGET', KEYS[1], 'balance_cents') or '0')
+local amount = tonumber(ARGV[1])
+if balance < amount then
+    return {0, balance}
+end
+local new_balance = redis.call('HINCRBY', KEYS[1], 'balance_cents', -amount)
+redis.call('SET', KEYS[2], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[3], KEYS[2])
+redis.call('SET', KEYS[4], ARGV[4])
+redis.call('ZADD', KEYS[5], ARGV[3], KEYS[4])
+return {1, new_balance}
+"""
+
+# Завершение ставки: запись результата и начисление выигрыша за один вызов.
+# KEYS[1] - ставка, KEYS[2] - кошелёк, KEYS[3] - транзакция, KEYS[4] - индекс транзакций
+# ARGV[1] - результат, ARGV[2] - выплата в центах, ARGV[3] - TTL ставки,
+# ARGV[4] - транзакция (JSON), ARGV[5] - timestamp
+# Возвращает {1, баланс, ставка (JSON)}, {0} если ставка не найдена, {-1} если уже завершена
+SETTLE_BET_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return {0}
+end
+local bet = cjson.decode(raw)
+if bet.status == 'completed' then
+    return {-1}
+end
+local payout = tonumber(ARGV[2])
+bet.result = ARGV[1]
+bet.payout_cents = payout
+bet.status = 'completed'
+if ARGV[6] ~= '' then
+    bet.server_seed = ARGV[6]
+    bet.nonce = tonumber(ARGV[7])
+end
+local encoded = cjson.encode(bet)
+redis.call('SET', KEYS[1], encoded, 'EX', ARGV[3])
+local balance
+if payout > 0 then
+    balance = redis.call('HINCRBY', KEYS[2], 'balance_cents', payout)
+    local transaction = cjson.decode(ARGV[4])
+    transaction.meta = 'win:' .. bet.game_type .. ':' .. KEYS[1]
+    redis.call('SET', KEYS[3], cjson.encode(transaction))
+    redis.call('ZADD', KEYS[4], ARGV[5], KEYS[3])
+else
+    balance = tonumber(redis.call('HGET', KEYS[2], 'balance_cents') or '0')
+end
+return {1, balance, encoded}
+"""
+
 
 class RedisDatabase:
     """Класс для работы с Redis базой данных"""
     
     def __init__(self):
         self.client = None
+        self._debit_script = None
+        self._transfer_script = None
+        self._open_bet_script = None
+        self._settle_bet_script = None
     
     async def connect(self):
         """Подключение к Redis"""
@@ -27,6 +126,11 @@ class RedisDatabase:
                 decode_responses=True
             )
             redis_client = self.client
+            # Lua скрипты вызываются через EVALSHA (redis-py сам загрузит скрипт при NOSCRIPT)
+            self._debit_script = self.client.register_script(DEBIT_SCRIPT)
+            self._transfer_script = self.client.register_script(TRANSFER_SCRIPT)
+            self._open_bet_script = self.client.register_script(OPEN_BET_SCRIPT)
+            self._settle_bet_script = self.client.register_script(SETTLE_BET_SCRIPT)
             # Тестируем подключение
             await self.client.ping()
             logger.info("✅ Redis подключение установлено")
@@ -41,13 +145,21 @@ class RedisDatabase:
             logger.info("✅ Redis соединение закрыто")
     
     async def set_user(self, user_id: int, user_data: Dict[str, Any], ttl: Optional[int] = None):
-        """Сохранить данные пользователя"""
+        """
+        Сохранить данные пользователя.
+        В множество пользователей попадают только записи без ttl: истёкший
+        ключ Redis из множества не уберёт, и оно копило бы мёртвые id.
+        """
         key = f"user:{user_id}"
         data = json.dumps(user_data, default=str)
-        if ttl:
-            await self.client.setex(key, ttl, data)
-        else:
-            await self.client.set(key, data)
+        async with self.client.pipeline(transaction=True) as pipe:
+            if ttl:
+                pipe.setex(key, ttl, data)
+                pipe.srem(USERS_SET_KEY, user_id)
+            else:
+                pipe.set(key, data)
+                pipe.sadd(USERS_SET_KEY, user_id)
+            await pipe.execute()
     
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получить данные пользователя"""
@@ -60,7 +172,10 @@ class RedisDatabase:
     async def delete_user(self, user_id: int):
         """Удалить пользователя"""
         key = f"user:{user_id}"
-        await self.client.delete(key)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.srem(USERS_SET_KEY, user_id)
+            await pipe.execute()
     
     async def set_wallet(self, user_id: int, wallet_data: Dict[str, Any]):
         """Сохранить данные кошелька"""
@@ -76,51 +191,174 @@ class RedisDatabase:
             return json.loads(data)
         return None
     
+    @staticmethod
+    def _user_bets_index(user_id: int) -> str:
+        """Ключ индекса ставок пользователя (sorted set, score = timestamp)"""
+        return f"user_bets:{user_id}"
+    
+    @staticmethod
+    def _user_transactions_index(user_id: int) -> str:
+        """Ключ индекса транзакций пользователя (sorted set, score = timestamp)"""
+        return f"user_transactions:{user_id}"
+    
+    @staticmethod
+    def bet_user_id(bet_id: str) -> int:
+        """Получить user_id из ключа ставки (формат: bet:{timestamp}:{user_id})"""
+        return int(bet_id.rsplit(':', 1)[1])
+    
+    async def _get_indexed_records(self, index_key: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+        """Получить записи по индексу: ZREVRANGE + MGET вместо KEYS + GET на каждый ключ"""
+        keys = await self.client.zrevrange(index_key, offset, offset + limit - 1)
+        if not keys:
+            return []
+        
+        values = await self.client.mget(keys)
+        
+        records = []
+        stale_keys = []
+        for key, data in zip(keys, values):
+            if data is None:
+                # Запись истекла по TTL - чистим индекс
+                stale_keys.append(key)
+                continue
+            record = json.loads(data)
+            record['id'] = key
+            records.append(record)
+        
+        if stale_keys:
+            await self.client.zrem(index_key, *stale_keys)
+        
+        return records
+    
     async def add_bet(self, bet_data: Dict[str, Any]) -> str:
         """Добавить ставку"""
-        bet_id = f"bet:{datetime.utcnow().timestamp()}:{bet_data['user_id']}"
+        timestamp = datetime.utcnow().timestamp()
+        user_id = bet_data['user_id']
+        bet_id = f"bet:{timestamp}:{user_id}"
         data = json.dumps(bet_data, default=str)
-        await self.client.set(bet_id, data)
+        
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(bet_id, data)
+            pipe.zadd(self._user_bets_index(user_id), {bet_id: timestamp})
+            await pipe.execute()
         return bet_id
     
-    async def get_user_bets(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
-        """Получить ставки пользователя"""
-        pattern = f"bet:*:{user_id}"
-        keys = await self.client.keys(pattern)
-        keys.sort(reverse=True)  # Сортируем по убыванию (новые сначала)
-        
-        bets = []
-        for key in keys[:limit]:
-            data = await self.client.get(key)
-            if data:
-                bet = json.loads(data)
-                bet['id'] = key
-                bets.append(bet)
+    async def open_bet(
+        self,
+        bet_data: Dict[str, Any],
+        transaction_data: Dict[str, Any]
+    ) -> Optional[Tuple[str, int]]:
+        """
+        Атомарно списать ставку, записать транзакцию и ставку.
+        Возвращает (id ставки, новый баланс) или None, если средств недостаточно.
+        """
+        timestamp = datetime.utcnow().timestamp()
+        user_id = bet_data['user_id']
+        bet_id = f"bet:{timestamp}:{user_id}"
+        transaction_id = f"transaction:{timestamp}:{user_id}"
+        ok, balance = await self._open_bet_script(
+            keys=[
+                f"wallet:{user_id}",
+                transaction_id,
+                self._user_transactions_index(user_id),
+                bet_id,
+                self._user_bets_index(user_id),
+            ],
+            args=[
+                bet_data['stake_cents'],
+                json.dumps(transaction_data, default=str),
+                timestamp,
+                json.dumps(bet_data, default=str),
+            ]
+        )
+        if not ok:
+            return None
+        return bet_id, int(balance)
+    
+    async def settle_bet(
+        self,
+        bet_id: str,
+        result: str,
+        payout_cents: int,
+        transaction_data: Dict[str, Any],
+        ttl_seconds: int,
+        server_seed: Optional[str] = None,
+        nonce: Optional[int] = None
+    ) -> Tuple[Dict[str, Any], int, Optional[str]]:
+        """
+        Атомарно завершить ставку и начислить выигрыш.
+        Возвращает (данные ставки, новый баланс, id транзакции выигрыша или None).
+        """
+        timestamp = datetime.utcnow().timestamp()
+        user_id = self.bet_user_id(bet_id)
+        transaction_id = f"transaction:{timestamp}:{user_id}"
+        response = await self._settle_bet_script(
+            keys=[bet_id, f"wallet:{user_id}", transaction_id, self._user_transactions_index(user_id)],
+            args=[
+                result, payout_cents, ttl_seconds, json.dumps(transaction_data, default=str), timestamp,
+                server_seed or '', nonce if nonce is not None else 0
+            ]
+        )
+        if response[0] == 0:
+            raise ValueError(f"Bet {bet_id} not found")
+        if response[0] == -1:
+            raise ValueError(f"Bet {bet_id} already completed")
         
-        return bets
+        bet_data = json.loads(response[2])
+        bet_data['id'] = bet_id
+        return bet_data, int(response[1]), transaction_id if payout_cents > 0 else None
+    
+    async def get_user_bets(self, user_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Получить ставки пользователя (новые сначала)"""
+        return await self._get_indexed_records(self._user_bets_index(user_id), limit, offset)
     
     async def add_transaction(self, transaction_data: Dict[str, Any]) -> str:
         """Добавить транзакцию"""
-        transaction_id = f"transaction:{datetime.utcnow().timestamp()}:{transaction_data['user_id']}"
+        timestamp = datetime.utcnow().timestamp()
+        user_id = transaction_data['user_id']
+        transaction_id = f"transaction:{timestamp}:{user_id}"
         data = json.dumps(transaction_data, default=str)
-        await self.client.set(transaction_id, data)
+        
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(transaction_id, data)
+            pipe.zadd(self._user_transactions_index(user_id), {transaction_id: timestamp})
+            await pipe.execute()
         return transaction_id
     
-    async def get_user_transactions(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
-        """Получить транзакции пользователя"""
-        pattern = f"transaction:*:{user_id}"
-        keys = await self.client.keys(pattern)
-        keys.sort(reverse=True)  # Сортируем по убыванию (новые сначала)
-        
-        transactions = []
-        for key in keys[:limit]:
-            data = await self.client.get(key)
-            if data:
-                transaction = json.loads(data)
-                transaction['id'] = key
-                transactions.append(transaction)
+    async def get_user_transactions(self, user_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Получить транзакции пользователя (новые сначала)"""
+        return await self._get_indexed_records(self._user_transactions_index(user_id), limit, offset)
+    
+    async def rebuild_history_indexes(self, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Перестроить индексы ставок и транзакций для ключей, созданных до появления индексов.
+        Использует SCAN, поэтому не блокирует Redis.
+        """
+        counts = {'bets': 0, 'transactions': 0}
+        for prefix, index_func, counter in (
+            ('bet', self._user_bets_index, 'bets'),
+            ('transaction', self._user_transactions_index, 'transactions'),
+        ):
+            async with self.client.pipeline(transaction=False) as pipe:
+                pending = 0
+                async for key in self.client.scan_iter(match=f"{prefix}:*", count=batch_size):
+                    # Формат ключа: {prefix}:{timestamp}:{user_id}
+                    try:
+                        _, timestamp, user_id = key.rsplit(':', 2)
+                        score = float(timestamp)
+                    except ValueError:
+                        continue
+                    pipe.zadd(index_func(int(user_id)), {key: score})
+                    counts[counter] += 1
+                    pending += 1
+                    if pending >= batch_size:
+                        await pipe.execute()
+                        pending = 0
+                if pending:
+                    await pipe.execute()
         
-        return transactions
+        logger.info(f"✅ Индексы истории перестроены: {counts}")
+        return counts
     
     async def increment_balance(self, user_id: int, amount_cents: int) -> int:
         """Увеличить баланс пользователя"""
@@ -134,6 +372,57 @@ class RedisDatabase:
         new_balance = await self.client.hincrby(key, "balance_cents", -amount_cents)
         return new_balance
     
+    async def debit_balance(self, user_id: int, amount_cents: int, transaction_data: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        """
+        Атомарно списать средства и записать транзакцию.
+        Возвращает (новый баланс, id транзакции) или None, если средств недостаточно.
+        """
+        timestamp = datetime.utcnow().timestamp()
+        transaction_id = f"transaction:{timestamp}:{user_id}"
+        ok, balance = await self._debit_script(
+            keys=[f"wallet:{user_id}", transaction_id, self._user_transactions_index(user_id)],
+            args=[amount_cents, json.dumps(transaction_data, default=str), timestamp]
+        )
+        if not ok:
+            return None
+        return int(balance), transaction_id
+    
+    async def transfer_balance(
+        self,
+        from_user_id: int,
+        to_user_id: int,
+        amount_cents: int,
+        debit_data: Dict[str, Any],
+        credit_data: Dict[str, Any]
+    ) -> Optional[Tuple[int, int, str, str]]:
+        """
+        Атомарно перевести средства и записать обе транзакции.
+        Возвращает (баланс отправителя, баланс получателя, id списания, id зачисления)
+        или None, если средств недостаточно.
+        """
+        timestamp = datetime.utcnow().timestamp()
+        debit_id = f"transaction:{timestamp}:{from_user_id}"
+        credit_id = f"transaction:{timestamp}:{to_user_id}"
+        response = await self._transfer_script(
+            keys=[
+                f"wallet:{from_user_id}",
+                f"wallet:{to_user_id}",
+                debit_id,
+                credit_id,
+                self._user_transactions_index(from_user_id),
+                self._user_transactions_index(to_user_id)
+            ],
+            args=[
+                amount_cents,
+                json.dumps(debit_data, default=str),
+                json.dumps(credit_data, default=str),
+                timestamp
+            ]
+        )
+        if not response[0]:
+            return None
+        return int(response[1]), int(response[2]), debit_id, credit_id
+    
     async def get_balance(self, user_id: int) -> int:
         """Получить баланс пользователя"""
         key = f"wallet:{user_id}"
@@ -175,26 +464,71 @@ class RedisDatabase:
         """Удалить ключ"""
         await self.client.delete(key)
     
+    async def iter_users(self, batch_size: int = 500) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Пройти по всем пользователям пачками (SSCAN + MGET).
+        Не загружает всех пользователей в память и не блокирует Redis.
+        """
+        cursor = 0
+        while True:
+            cursor, user_ids = await self.client.sscan(USERS_SET_KEY, cursor, count=batch_size)
+            if user_ids:
+                values = await self.client.mget([f"user:{user_id}" for user_id in user_ids])
+                
+                users = []
+                for user_id, data in zip(user_ids, values):
+                    if data:
+                        user = json.loads(data)
+                        user['id'] = user_id
+                        users.append(user)
+                
+                if users:
+                    yield users
+            
+            if cursor == 0:
+                break
+    
     async def get_all_users(self) -> List[Dict[str, Any]]:
         """Получить всех пользователей"""
-        pattern = "user:*"
-        keys = await self.client.keys(pattern)
-        
         users = []
-        for key in keys:
-            data = await self.client.get(key)
-            if data:
-                user = json.loads(data)
-                user['id'] = key.split(':')[1]
-                users.append(user)
-        
+        async for batch in self.iter_users():
+            users.extend(batch)
         return users
     
     async def get_user_count(self) -> int:
         """Получить количество пользователей"""
-        pattern = "user:*"
-        keys = await self.client.keys(pattern)
-        return len(keys)
+        return await self.client.scard(USERS_SET_KEY)
+    
+    async def rebuild_users_index(self, batch_size: int = 1000) -> int:
+        """
+        Перестроить множество пользователей по ключам user:* (SCAN).
+        Нужно для данных, созданных до появления множества. Записи с ttl
+        пропускаются - как и в set_user.
+        """
+        count = 0
+        keys: List[str] = []
+        
+        async def flush():
+            nonlocal count
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.ttl(key)
+                ttls = await pipe.execute()
+            user_ids = [key.split(':', 1)[1] for key, key_ttl in zip(keys, ttls) if key_ttl == -1]
+            if user_ids:
+                await self.client.sadd(USERS_SET_KEY, *user_ids)
+                count += len(user_ids)
+            keys.clear()
+        
+        async for key in self.client.scan_iter(match="user:*", count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                await flush()
+        if keys:
+            await flush()
+        
+        logger.info(f"✅ Множество пользователей перестроено: {count}")
+        return count
 
 
 # Глобальный экземпляр базы данных
@@ -1,6 +1,8 @@
-from sqlalchemy import select, func
-from src.models import Bet, User
+from sqlalchemy import select, func, update
+from src.models import Bet, Transaction, User, Wallet
+from src.services.results import BetSettlement
 from src.services.wallet_service import wallet_service
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,34 +41,81 @@ class BetService:
             return bet
     
     @staticmethod
-    async def complete_bet(bet_id: int, result: str, payout_cents: int) -> Bet:
-        """Завершить ставку"""
+    async def complete_bet(
+        bet_id: int,
+        result: str,
+        payout_cents: int,
+        server_seed: Optional[str] = None,
+        nonce: Optional[int] = None
+    ) -> BetSettlement:
+        """
+        Завершить ставку (результат содержит ставку и баланс после начисления).
+        server_seed и nonce - данные provably fair игры для последующей проверки.
+        """
         from src.database import async_session_maker
         
         async with async_session_maker() as session:
+            values = {'result': result, 'payout_cents': payout_cents, 'status': 'completed'}
+            if server_seed is not None:
+                values.update(server_seed=server_seed, nonce=nonce)
+            
+            # Условный UPDATE: ставку завершает ровно один вызов (игрок или таймер)
+            claimed = await session.execute(
+                update(Bet)
+                .where(Bet.id == bet_id, Bet.status != 'completed')
+                .values(**values)
+            )
+            if claimed.rowcount == 0:
+                exists = await session.execute(select(Bet.id).where(Bet.id == bet_id))
+                if exists.scalar_one_or_none() is None:
+                    raise ValueError(f"Bet {bet_id} not found")
+                raise ValueError(f"Bet {bet_id} already completed")
+            
             result_obj = await session.execute(
                 select(Bet).where(Bet.id == bet_id)
             )
             bet = result_obj.scalar_one()
             
-            bet.result = result
-            bet.payout_cents = payout_cents
-            bet.status = 'completed'
-            
-            # Начисляем выигрыш
+            # Выигрыш начисляем в той же транзакции, что и завершение ставки:
+            # иначе после падения между двумя коммитами деньги уже начислены,
+            # а ставка осталась pending, и таймер выплатил бы её ещё раз
+            transaction = None
             if payout_cents > 0:
-                await wallet_service.credit(
-                    bet.user_id,
-                    payout_cents,
-                    f'win:{bet.game_type}:{bet_id}'
+                wallet_result = await session.execute(
+                    select(Wallet).where(Wallet.user_id == bet.user_id).with_for_update()
                 )
+                wallet = wallet_result.scalar_one_or_none()
+                if not wallet:
+                    wallet = Wallet(user_id=bet.user_id, balance_cents=0)
+                    session.add(wallet)
+                wallet.balance_cents += payout_cents
+                new_balance = wallet.balance_cents
+                
+                transaction = Transaction(
+                    user_id=bet.user_id,
+                    type='credit',
+                    amount_cents=payout_cents,
+                    status='completed',
+                    meta=f'win:{bet.game_type}:{bet_id}'
+                )
+                session.add(transaction)
+            else:
+                # Без выигрыша баланс читаем в той же сессии
+                balance = await session.execute(
+                    select(Wallet.balance_cents).where(Wallet.user_id == bet.user_id)
+                )
+                new_balance = balance.scalar_one_or_none() or 0
             
             await session.commit()
             await session.refresh(bet)
+            transaction_id = transaction.id if transaction is not None else None
+            
+            if transaction is not None:
+                logger.info(f"💰 Credit: user={bet.user_id}, amount={payout_cents}, reason=win:{bet.game_type}:{bet_id}")
             
             logger.info(f"✅ Bet completed: id={bet_id}, payout={payout_cents}")
             
-            return bet
+            return BetSettlement(bet=bet, new_balance_cents=new_balance, transaction_id=transaction_id)
     
     @staticmethod
     async def get_user_stats(user_id: int) -> dict:
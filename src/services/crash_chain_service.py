@@ -0,0 +1,140 @@
+"""
+Точки краша ракетки из цепочки хэшей (provably fair).
+
+Номер следующего раунда - счётчик в Redis, общий для всех воркеров; звено
+читается из mmap-файла цепочки за O(1). Если файла нет, цепочка
+генерируется в отдельном процессе, а раунды до её готовности используют
+обычный random (без хэша - такие раунды не проверяются).
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Set
+
+from src.config import settings
+from src.games.crash_chain import HashChain, crash_point_from_link, generate_chain
+from src.games.rocket import RocketGame
+from src.redis_db import db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CrashDraw:
+    """Точка краша раунда и её доказательство"""
+    crash_point: float
+    # Номер раунда в цепочке и его хэш (None - цепочка ещё не готова)
+    index: Optional[int] = None
+    link: Optional[str] = None
+
+
+class CrashChainService:
+    """Выдаёт раундам звенья цепочки по порядку"""
+
+    GENERATION_LOCK_KEY = "rocket:chain:generating"
+    GENERATION_LOCK_TTL = 3600
+    WAIT_INTERVAL = 5.0
+
+    def __init__(self, path: str, length: int):
+        self.path = path
+        self.length = length
+        self.chain: Optional[HashChain] = None
+        self._exhausted: Set[bytes] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def cursor_key(self) -> str:
+        # Своя позиция у каждой цепочки: новая цепочка начинается с раунда 0
+        return f"rocket:chain:{self.chain.terminal.hex()[:16]}:cursor"
+
+    async def start(self) -> None:
+        """Открыть цепочку или запустить её генерацию в фоне"""
+        if self._try_open():
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._prepare())
+
+    def _try_open(self) -> bool:
+        """Открыть файл цепочки, если он есть и ещё не израсходован"""
+        if not os.path.exists(self.path):
+            return False
+        chain = HashChain(self.path)
+        if chain.terminal in self._exhausted:
+            chain.close()
+            return False
+        self.chain = chain
+        logger.info(f"✅ Crash chain loaded: {chain.length} links, terminal={chain.terminal.hex()}")
+        return True
+
+    async def _prepare(self) -> None:
+        """Сгенерировать цепочку (один воркер) или дождаться её от другого"""
+        try:
+            acquired = await db.client.set(
+                self.GENERATION_LOCK_KEY, os.getpid(), nx=True, ex=self.GENERATION_LOCK_TTL
+            )
+            if acquired:
+                logger.info(f"⏳ Generating crash chain: {self.length} links -> {self.path}")
+                loop = asyncio.get_running_loop()
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    terminal = await loop.run_in_executor(executor, generate_chain, self.path, self.length)
+                await db.client.delete(self.GENERATION_LOCK_KEY)
+                logger.info(f"✅ Crash chain generated: terminal={terminal}")
+            while not self._try_open():
+                await asyncio.sleep(self.WAIT_INTERVAL)
+        except Exception as e:
+            logger.error(f"❌ Crash chain generation failed: {e}")
+
+    async def next_round(self) -> CrashDraw:
+        """Точка краша следующего раунда"""
+        if self.chain is None:
+            return CrashDraw(crash_point=RocketGame.calculate_crash_point())
+
+        index = await db.client.incr(self.cursor_key) - 1
+        if index >= self.chain.length:
+            # Цепочка израсходована: генерируем новую (файл заменится атомарно)
+            logger.warning("⚠️ Crash chain exhausted, switching to a new one")
+            self._exhausted.add(self.chain.terminal)
+            self.chain.close()
+            self.chain = None
+            await self.start()
+            return CrashDraw(crash_point=RocketGame.calculate_crash_point())
+
+        link = self.chain.link(index)
+        return CrashDraw(crash_point=crash_point_from_link(link), index=index, link=link.hex())
+
+    async def rounds_played(self) -> int:
+        if self.chain is None:
+            return 0
+        value = await db.client.get(self.cursor_key)
+        return min(int(value or 0), self.chain.length)
+
+    async def verify(self, index: int, link_hex: str) -> Optional[float]:
+        """
+        Проверить хэш прошедшего раунда: sha256 от него должен совпасть
+        с хэшем предыдущего раунда (для раунда 0 - с terminal).
+        Возвращает точку краша или None, если хэш не подходит.
+        """
+        if self.chain is None or not 0 <= index < await self.rounds_played():
+            return None
+        try:
+            link = bytes.fromhex(link_hex)
+        except ValueError:
+            return None
+        if hashlib.sha256(link).digest() != self.chain.previous(index):
+            return None
+        return crash_point_from_link(link)
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self.chain is not None:
+            self.chain.close()
+            self.chain = None
+
+
+crash_chain_service = CrashChainService(settings.CRASH_CHAIN_PATH, settings.CRASH_CHAIN_LENGTH)
@@ -0,0 +1,409 @@
+"""
+Общий конвейер игр: разбор команды, проверки, ставка, игра, расчёт и ответ.
+
+Все точки входа (/slots 10, слоты 10, /слоты 10, ввод ставки в FSM, ...)
+сводятся к GamePipeline.run(). Логика конкретной игры живёт в движке
+(GameEngine), всё остальное - пользователь, лимиты, баланс, ставка,
+VIP/кредиты/рейтинги - написано и оптимизируется один раз.
+"""
+
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from aiogram.filters import BaseFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+from src.config import settings
+from src.models import User
+from src.services.bet_service import bet_service
+from src.services.leaderboard import leaderboard_engine
+from src.services.personality_engine import PersonalityEngine
+from src.services.rating_service import VIPService, CreditService, rating_aggregator
+from src.services.timer_wheel import timer_service
+from src.services.user_cache import user_cache
+from src.services.wallet_service import wallet_service
+from src.utils.formatters import format_money
+
+logger = logging.getLogger(__name__)
+
+# "/slots 10", "/slots@bot 10", "слоты 10", "рулетка 20 к"
+COMMAND_RE = re.compile(r'^/?([^\s@/]+)(?:@\w+)?\s+(\S.*)$', re.DOTALL)
+
+
+class GameInputError(Exception):
+    """Ошибка в параметрах игры - текст показывается пользователю"""
+
+
+async def process_game_result(
+    user_id: int,
+    stake_cents: int,
+    win_amount: int,
+    game_type: str,
+    balance_cents: int
+):
+    """
+    Обрабатывает результат игры: обновляет рейтинги и применяет VIP бонусы.
+
+    balance_cents - баланс после complete_bet; возвращается баланс с учётом
+    начислений этой функции, без повторного чтения кошелька.
+    """
+    vip_message = ""
+    credit_message = ""
+
+    if win_amount > 0:
+        # Выигрыш - применяем VIP множитель
+        total_win, vip_message = await VIPService.apply_vip_multiplier(user_id, win_amount)
+
+        # Автоматический возврат кредитов
+        remaining_win, credit_message = await CreditService.auto_repay_from_winnings(user_id, total_win)
+
+        # Начисляем остаток выигрыша
+        if remaining_win > 0:
+            operation = await wallet_service.credit(user_id, remaining_win, f"{game_type}_win")
+            balance_cents = operation.new_balance_cents
+
+        final_win_amount = total_win
+
+        # Обновляем рейтинги (daily/weekly/monthly копятся в памяти и сбрасываются пачкой)
+        await rating_aggregator.record(user_id, stake_cents, final_win_amount)
+        try:
+            await leaderboard_engine.record(user_id, final_win_amount)
+        except Exception as e:
+            logger.error(f"❌ Leaderboard update error: user={user_id}, {e}")
+
+    else:
+        # Проигрыш - применяем VIP возврат (зачисляется на баланс)
+        cashback_amount, vip_message = await VIPService.apply_vip_cashback(user_id, stake_cents)
+        balance_cents += cashback_amount
+        final_win_amount = 0
+
+    return final_win_amount, vip_message, credit_message, balance_cents
+
+
+@dataclass
+class GameContext:
+    """Всё, что нужно движку для одной игры"""
+    message: Message
+    user: User
+    stake_cents: int
+    options: Dict[str, Any]
+    state: Optional[FSMContext] = None
+    bet_id: Optional[int] = None
+
+    @property
+    def is_group(self) -> bool:
+        return self.message.chat.type in ['group', 'supergroup']
+
+    @property
+    def mention(self) -> str:
+        """Префикс '@username, ' для ответов в группах"""
+        if not self.is_group:
+            return ""
+        return f"@{self.message.from_user.username or self.message.from_user.first_name}, "
+
+
+@dataclass
+class GameOutcome:
+    """Результат сыгранной игры (до начисления)"""
+    result: str
+    payout_cents: int
+    details: Dict[str, Any] = field(default_factory=dict)
+    # Через сколько секунд показать результат (конец анимации); ставка
+    # рассчитывается сразу, хендлер не ждёт анимацию. details['animation_msg'] -
+    # сообщение анимации, удаляется при показе результата
+    reveal_after: float = 0.0
+    # Provably fair: сид и nonce игры сохраняются в ставке для проверки
+    server_seed: Optional[str] = None
+    nonce: Optional[int] = None
+
+
+@dataclass
+class Settlement:
+    """Итог расчёта: выплата с учётом VIP, сообщения бонусов и новый баланс"""
+    final_payout: int
+    vip_message: str
+    credit_message: str
+    new_balance: int
+
+    def bonus_lines(self, with_credit: bool = True) -> str:
+        text = ""
+        if self.vip_message:
+            text += f"{self.vip_message}\n"
+        if with_credit and self.credit_message:
+            text += f"{self.credit_message}\n"
+        return text
+
+
+class GameEngine:
+    """
+    Движок игры для конвейера.
+
+    Переопределяются parse_options (параметры после ставки), precheck
+    (проверки до списания ставки), play и render. play() возвращает None,
+    если игра интерактивная и рассчитывается позже (мины, ракетка).
+    """
+
+    game_type: str = ''
+    aliases: Tuple[str, ...] = ()
+    usage: str = ''
+
+    def parse_options(self, args: List[str]) -> Dict[str, Any]:
+        return {}
+
+    async def precheck(self, ctx: GameContext) -> Optional[str]:
+        """Текст отказа до создания ставки или None"""
+        return None
+
+    async def play(self, ctx: GameContext) -> Optional[GameOutcome]:
+        raise NotImplementedError
+
+    async def render(self, ctx: GameContext, outcome: GameOutcome, settlement: Settlement) -> str:
+        raise NotImplementedError
+
+
+@dataclass
+class GameRequest:
+    """Разобранная команда: движок, ставка и остальные параметры"""
+    engine: GameEngine
+    stake_text: str
+    args: List[str]
+
+
+class GamePipeline:
+    """Реестр движков и единый путь выполнения игры"""
+
+    def __init__(self):
+        self.engines: Dict[str, GameEngine] = {}
+        self._aliases: Dict[str, GameEngine] = {}
+
+    def register(self, engine: GameEngine) -> GameEngine:
+        self.engines[engine.game_type] = engine
+        for alias in (engine.game_type, *engine.aliases):
+            self._aliases[alias] = engine
+        return engine
+
+    def parse(self, text: Optional[str]) -> Optional[GameRequest]:
+        """Разобрать '/slots 10', 'слоты 10', 'рулетка 20 к' (None - не игровая команда)"""
+        if not text:
+            return None
+        match = COMMAND_RE.match(text)
+        if not match:
+            return None
+        engine = self._aliases.get(match.group(1).lower())
+        if engine is None:
+            return None
+        stake_text, *args = match.group(2).split()
+        return GameRequest(engine=engine, stake_text=stake_text, args=args)
+
+    @staticmethod
+    def parse_stake(stake: Union[str, int]) -> int:
+        """Ставка в долларах -> центы (ValueError при неверном формате); int - уже центы"""
+        if isinstance(stake, int):
+            return stake
+        return int(float(stake) * 100)
+
+    @staticmethod
+    async def get_user(message: Message, user_context=None) -> Optional[User]:
+        """Пользователь из контекста апдейта (или user_cache, если контекста нет)"""
+        if user_context is not None:
+            return user_context.user
+        return await user_cache.get(message.from_user.id)
+
+    async def load_user(self, message: Message, user_context=None) -> Tuple[Optional[User], Optional[int]]:
+        """Пользователь и баланс: из контекста апдейта, без лишних запросов к БД"""
+        if user_context is not None:
+            return user_context.user, await user_context.get_balance()
+        user = await self.get_user(message)
+        if user is None:
+            return None, None
+        return user, await wallet_service.get_balance(user.id)
+
+    async def validate(
+        self,
+        message: Message,
+        stake: Union[str, int],
+        user_context=None,
+        state: Optional[FSMContext] = None,
+        usage: Optional[str] = None
+    ) -> Optional[Tuple[User, int]]:
+        """
+        Проверки до ставки: формат, лимиты, пользователь, баланс.
+        При отказе отвечает сам и возвращает None.
+
+        Если state передан (ввод ставки в FSM), неверный формат и лимиты
+        оставляют пользователя в состоянии, остальные отказы его сбрасывают.
+        """
+        try:
+            stake_cents = self.parse_stake(stake)
+        except ValueError:
+            if usage:
+                await message.answer(f"❌ Неверный формат! Используйте: {usage}")
+            else:
+                await message.answer("❌ Неверная сумма! Введите число.")
+            return None
+
+        if stake_cents < settings.MIN_BET:
+            await message.answer(f"📉 Минимальная ставка — ${format_money(settings.MIN_BET)}")
+            return None
+
+        if stake_cents > settings.MAX_BET:
+            await message.answer(f"📈 Максимальная ставка — ${format_money(settings.MAX_BET)}")
+            return None
+
+        user, balance = await self.load_user(message, user_context)
+        if user is None:
+            await message.answer("❌ Сначала запустите бота командой /start")
+            if state is not None:
+                await state.clear()
+            return None
+
+        if balance < stake_cents:
+            text = await PersonalityEngine.get_message('low_balance', user)
+            await message.answer(text)
+            if state is not None:
+                await state.clear()
+            return None
+
+        return user, stake_cents
+
+    async def run(
+        self,
+        message: Message,
+        engine: GameEngine,
+        stake: Union[str, int],
+        args: Optional[List[str]] = None,
+        state: Optional[FSMContext] = None,
+        user_context=None,
+        from_prompt: bool = False
+    ) -> None:
+        """
+        Сыграть одну игру.
+
+        from_prompt - ставка введена в FSM-состоянии: оно сбрасывается при
+        старте игры (или при отказе, после которого вводить заново нет смысла).
+        """
+        usage = None if from_prompt else engine.usage
+        try:
+            options = engine.parse_options(args or [])
+        except GameInputError as e:
+            await message.answer(str(e))
+            return
+
+        checked = await self.validate(
+            message,
+            stake,
+            user_context=user_context,
+            state=state if from_prompt else None,
+            usage=usage
+        )
+        if checked is None:
+            return
+        user, stake_cents = checked
+
+        ctx = GameContext(
+            message=message,
+            user=user,
+            stake_cents=stake_cents,
+            options=options,
+            state=state
+        )
+
+        refusal = await engine.precheck(ctx)
+        if refusal:
+            await message.answer(refusal)
+            return
+
+        if from_prompt:
+            await state.clear()
+
+        try:
+            bet = await bet_service.create_bet(
+                user_id=user.id,
+                chat_id=message.chat.id,
+                game_type=engine.game_type,
+                stake_cents=stake_cents
+            )
+        except ValueError as e:
+            await message.answer(f"❌ Ошибка: {e}")
+            return
+        ctx.bet_id = bet.id
+
+        outcome = await engine.play(ctx)
+        if outcome is None:
+            # Интерактивная игра - рассчитается в своих callback'ах
+            return
+
+        bet_settlement = await bet_service.complete_bet(
+            bet.id,
+            outcome.result,
+            outcome.payout_cents,
+            server_seed=outcome.server_seed,
+            nonce=outcome.nonce
+        )
+
+        # Применяем VIP бонусы и обрабатываем результат
+        final_payout, vip_message, credit_message, new_balance = await process_game_result(
+            user.id,
+            stake_cents,
+            outcome.payout_cents,
+            engine.game_type,
+            bet_settlement.new_balance_cents
+        )
+        settlement = Settlement(
+            final_payout=final_payout,
+            vip_message=vip_message,
+            credit_message=credit_message,
+            new_balance=new_balance
+        )
+
+        # Текст готов сразу: показ по таймеру не зависит от этого процесса
+        text = await engine.render(ctx, outcome, settlement)
+        animation_msg = outcome.details.get('animation_msg')
+        payload = {
+            'chat_id': message.chat.id,
+            'thread_id': message.message_thread_id,
+            'text': text,
+            'delete_message_id': animation_msg.message_id if animation_msg is not None else None
+        }
+        if outcome.reveal_after > 0:
+            await timer_service.schedule(f"reveal:{bet.id}", outcome.reveal_after, 'game_reveal', payload)
+        else:
+            await reveal_game_result(message.bot, payload)
+
+
+async def reveal_game_result(bot, payload: Dict[str, Any]) -> None:
+    """Показать результат игры: убрать анимацию и отправить текст"""
+    if payload.get('delete_message_id'):
+        try:
+            await bot.delete_message(payload['chat_id'], payload['delete_message_id'])
+        except Exception as e:
+            logger.warning(f"Failed to delete animation message: {e}")
+    await bot.send_message(
+        payload['chat_id'],
+        payload['text'],
+        message_thread_id=payload.get('thread_id')
+    )
+
+
+@timer_service.handler('game_reveal')
+async def on_reveal_timer(payload: Dict[str, Any]) -> None:
+    await reveal_game_result(timer_service.bot, payload)
+
+
+class GameCommandFilter(BaseFilter):
+    """Фильтр игровых команд со ставкой; передаёт хендлеру game_request"""
+
+    def __init__(self, pipeline: GamePipeline):
+        self.pipeline = pipeline
+
+    async def __call__(self, message: Message) -> Union[bool, Dict[str, Any]]:
+        request = self.pipeline.parse(message.text)
+        if request is None:
+            return False
+        return {'game_request': request}
+
+
+game_pipeline = GamePipeline()
@@ -0,0 +1,225 @@
+"""
+Лидерборды на Redis sorted sets
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, and_
+
+from src.database import get_session
+from src.models import User
+from src.models.rating import UserRating
+from src.redis_db import db
+from src.services.rating_service import RatingService, rating_aggregator
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderboardEngine:
+    """
+    Лидерборд по периодам (daily/weekly/monthly).
+
+    Для каждого периода хранится:
+    - leaderboard:{period}:{YYYYMMDD} - sorted set, member = user_id, score = total_winnings
+    - leaderboard:{period}:{YYYYMMDD}:stats - hash со счётчиками {user_id}:bets/wins/losses
+    Ключи истекают сами после окончания периода.
+    Имена игроков кэшируются в hash leaderboard:names.
+    """
+
+    PERIODS = ('daily', 'weekly', 'monthly')
+    NAMES_KEY = "leaderboard:names"
+    NAMES_TTL_SECONDS = 86400  # Имена перечитываются из БД раз в сутки
+
+    # Сколько хранить ключи периода после его начала
+    PERIOD_TTL = {
+        'daily': timedelta(days=2),
+        'weekly': timedelta(days=14),
+        'monthly': timedelta(days=62),
+    }
+
+    @staticmethod
+    def _key(period: str, period_start: Optional[datetime] = None) -> str:
+        """Ключ sorted set периода"""
+        if period_start is None:
+            period_start = RatingService._get_period_start(period)
+        return f"leaderboard:{period}:{period_start.strftime('%Y%m%d')}"
+
+    @classmethod
+    def _expire_at(cls, period: str, period_start: datetime) -> datetime:
+        """Время истечения ключей периода"""
+        return period_start + cls.PERIOD_TTL[period]
+
+    @classmethod
+    async def record(cls, user_id: int, win_amount: int) -> None:
+        """Учесть результат игры во всех периодах (один pipeline)"""
+        async with db.client.pipeline(transaction=False) as pipe:
+            for period in cls.PERIODS:
+                period_start = RatingService._get_period_start(period)
+                key = cls._key(period, period_start)
+                stats_key = f"{key}:stats"
+                expire_at = cls._expire_at(period, period_start)
+
+                pipe.hincrby(stats_key, f"{user_id}:bets", 1)
+                if win_amount > 0:
+                    pipe.zincrby(key, win_amount, user_id)
+                    pipe.hincrby(stats_key, f"{user_id}:wins", 1)
+                    pipe.expireat(key, expire_at)
+                else:
+                    pipe.hincrby(stats_key, f"{user_id}:losses", 1)
+                pipe.expireat(stats_key, expire_at)
+            await pipe.execute()
+
+    @classmethod
+    async def get_top(cls, period: str = 'daily', limit: int = 10) -> List[Dict]:
+        """Топ-N игроков за период (в формате RatingService.get_leaderboard)"""
+        key = cls._key(period)
+        top = await db.client.zrevrange(key, 0, limit - 1, withscores=True)
+        if not top:
+            return []
+
+        user_ids = [int(member) for member, _ in top]
+        stats_fields = []
+        for user_id in user_ids:
+            stats_fields.extend([f"{user_id}:bets", f"{user_id}:wins", f"{user_id}:losses"])
+
+        async with db.client.pipeline(transaction=False) as pipe:
+            pipe.hmget(f"{key}:stats", stats_fields)
+            pipe.hmget(cls.NAMES_KEY, user_ids)
+            stats_values, names = await pipe.execute()
+
+        names = await cls._fill_missing_names(user_ids, names)
+
+        leaderboard = []
+        for i, (user_id, (_, score)) in enumerate(zip(user_ids, top)):
+            total_bets = int(stats_values[i * 3] or 0)
+            total_wins = int(stats_values[i * 3 + 1] or 0)
+            total_losses = int(stats_values[i * 3 + 2] or 0)
+            name = names.get(user_id) or {}
+            leaderboard.append({
+                'user_id': user_id,
+                'username': name.get('username') or f"User{user_id}",
+                'first_name': name.get('first_name'),
+                'total_winnings': int(score),
+                'total_wins': total_wins,
+                'total_losses': total_losses,
+                'total_bets': total_bets,
+                'win_rate': round((total_wins / total_bets * 100) if total_bets > 0 else 0, 1)
+            })
+
+        return leaderboard
+
+    @classmethod
+    async def get_rank(cls, period: str, user_id: int) -> Optional[Dict]:
+        """Место и выигрыш игрока за период (None, если игрок не в рейтинге)"""
+        key = cls._key(period)
+        async with db.client.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(key, user_id)
+            pipe.zscore(key, user_id)
+            rank, score = await pipe.execute()
+
+        if rank is None:
+            return None
+
+        return {'position': rank + 1, 'total_winnings': int(score or 0)}
+
+    @classmethod
+    async def _fill_missing_names(cls, user_ids: List[int], cached: List[Optional[str]]) -> Dict[int, Dict]:
+        """Имена из кэша Redis, недостающие - одним запросом к БД"""
+        names = {}
+        missing = []
+        for user_id, raw in zip(user_ids, cached):
+            if raw:
+                names[user_id] = json.loads(raw)
+            else:
+                missing.append(user_id)
+
+        if missing:
+            async for session in get_session():
+                result = await session.execute(
+                    select(User.id, User.username, User.first_name).where(User.id.in_(missing))
+                )
+                fetched = {
+                    row.id: {'username': row.username, 'first_name': row.first_name}
+                    for row in result
+                }
+            if fetched:
+                async with db.client.pipeline(transaction=False) as pipe:
+                    pipe.hset(
+                        cls.NAMES_KEY,
+                        mapping={user_id: json.dumps(name) for user_id, name in fetched.items()}
+                    )
+                    pipe.ttl(cls.NAMES_KEY)
+                    _, names_ttl = await pipe.execute()
+                # TTL ставим только новому кэшу, иначе каждое дозаполнение
+                # продлевало бы его и имена не перечитывались бы никогда
+                # (EXPIRE ... NX появился лишь в Redis 7)
+                if names_ttl == -1:
+                    await db.client.expire(cls.NAMES_KEY, cls.NAMES_TTL_SECONDS)
+            names.update(fetched)
+
+        return names
+
+    @classmethod
+    async def rebuild(cls, period: str) -> int:
+        """Перестроить лидерборд текущего периода из таблицы user_ratings"""
+        period_start = RatingService._get_period_start(period)
+        key = cls._key(period, period_start)
+        stats_key = f"{key}:stats"
+
+        async for session in get_session():
+            result = await session.execute(
+                select(UserRating).where(
+                    and_(
+                        UserRating.period == period,
+                        UserRating.period_start == period_start
+                    )
+                )
+            )
+            ratings = result.scalars().all()
+
+        # Собираем во временные ключи и подменяем живые через RENAME:
+        # record() продолжает писать в живые ключи, и читатели не видят
+        # пустой или наполовину заполненный лидерборд
+        tmp_key = f"{key}:rebuild"
+        tmp_stats_key = f"{stats_key}:rebuild"
+        expire_at = cls._expire_at(period, period_start)
+        has_winners = any(rating.total_winnings > 0 for rating in ratings)
+
+        async with db.client.pipeline(transaction=True) as pipe:
+            pipe.delete(tmp_key, tmp_stats_key)
+            for rating in ratings:
+                if rating.total_winnings > 0:
+                    pipe.zadd(tmp_key, {rating.user_id: rating.total_winnings})
+                pipe.hset(tmp_stats_key, mapping={
+                    f"{rating.user_id}:bets": rating.total_bets,
+                    f"{rating.user_id}:wins": rating.total_wins,
+                    f"{rating.user_id}:losses": rating.total_losses,
+                })
+            # RENAME пустого (несуществующего) ключа - ошибка, тогда просто удаляем живой
+            if has_winners:
+                pipe.expireat(tmp_key, expire_at)
+                pipe.rename(tmp_key, key)
+            else:
+                pipe.delete(key)
+            if ratings:
+                pipe.expireat(tmp_stats_key, expire_at)
+                pipe.rename(tmp_stats_key, stats_key)
+            else:
+                pipe.delete(stats_key)
+            await pipe.execute()
+
+        logger.info(f"✅ Leaderboard rebuilt: period={period}, players={len(ratings)}")
+        return len(ratings)
+
+    @classmethod
+    async def rebuild_all(cls) -> Dict[str, int]:
+        """Перестроить лидерборды всех периодов"""
+        # Сначала сбрасываем в БД накопленные, но ещё не записанные рейтинги
+        await rating_aggregator.flush()
+        return {period: await cls.rebuild(period) for period in cls.PERIODS}
+
+
+leaderboard_engine = LeaderboardEngine()
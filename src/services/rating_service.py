@@ -3,17 +3,22 @@
 """
 
 import asyncio
+import logging
+import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
-from sqlalchemy import select, func, desc, and_
+from sqlalchemy import select, func, desc, and_, or_
 from sqlalchemy.orm import selectinload
 
 from src.database import get_session
 from src.models import User, Bet
 from src.models.rating import UserRating, LeaderboardReward, UserCredit, CreditLimit
+from src.services.timer_wheel import timer_service
 from src.services.wallet_service import wallet_service
 from src.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class RatingService:
     """Сервис для работы с рейтингами"""
@@ -204,6 +209,189 @@ class RatingService:
             return now
 
 
+class RatingAggregator:
+    """
+    Очередь событий рейтинга.
+    
+    Вместо трёх UPDATE на каждый выигрыш инкременты копятся в памяти по ключу
+    (user_id, period, period_start) и периодически сбрасываются в БД пачкой:
+    один SELECT существующих строк и один COMMIT на всю пачку.
+    
+    Если сброс не удался, инкременты остаются в памяти, а принудительный
+    сброс из record() откладывается на failure_backoff секунд: пока БД
+    лежит, ответ игроку не должен ждать заведомо неудачный сброс. Сверх
+    max_backlog ключей самые старые инкременты отбрасываются (с записью в лог).
+    """
+    
+    PERIODS = ('daily', 'weekly', 'monthly')
+    
+    def __init__(
+        self,
+        flush_interval: float = 5.0,
+        max_pending: int = 10000,
+        chunk_size: int = 500,
+        failure_backoff: float = 30.0,
+        max_backlog: int = 100000
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending  # Максимум ключей в памяти, дальше - принудительный сброс
+        self.chunk_size = chunk_size
+        self.failure_backoff = failure_backoff
+        self.max_backlog = max_backlog  # Предел ключей, копящихся при недоступной БД
+        
+        # (user_id, period, period_start) -> [bets, wins, losses, winnings]
+        self._pending: Dict[Tuple[int, str, datetime], List[int]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # До этого момента (monotonic) record() не делает принудительный сброс
+        self._retry_at = 0.0
+        self.failed_flushes = 0
+        self.dropped = 0
+    
+    async def record(self, user_id: int, bet_amount: int, win_amount: int) -> None:
+        """Добавить результат игры во все периоды рейтинга"""
+        for period in self.PERIODS:
+            key = (user_id, period, RatingService._get_period_start(period))
+            self._add(key, 1, 1 if win_amount > 0 else 0, 0 if win_amount > 0 else 1, max(win_amount, 0))
+        
+        if len(self._pending) >= self.max_pending:
+            if time.monotonic() >= self._retry_at:
+                await self.flush()
+            else:
+                self._trim()
+    
+    def _add(self, key: Tuple[int, str, datetime], bets: int, wins: int, losses: int, winnings: int) -> None:
+        """Накопить инкременты по ключу"""
+        counters = self._pending.get(key)
+        if counters is None:
+            self._pending[key] = [bets, wins, losses, winnings]
+        else:
+            counters[0] += bets
+            counters[1] += wins
+            counters[2] += losses
+            counters[3] += winnings
+    
+    def _trim(self) -> None:
+        """Отбросить самые старые ключи сверх max_backlog"""
+        excess = len(self._pending) - self.max_backlog
+        if excess <= 0:
+            return
+        dropped_bets = 0
+        for key in list(self._pending)[:excess]:
+            dropped_bets += self._pending.pop(key)[0]
+        self.dropped += excess
+        logger.error(
+            f"❌ Rating backlog over {self.max_backlog} keys: dropped {excess} keys "
+            f"({dropped_bets} bets), {self.dropped} dropped in total"
+        )
+    
+    async def flush(self) -> int:
+        """Сбросить накопленные инкременты в БД. Возвращает количество обновлённых строк"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            
+            batch, self._pending = self._pending, {}
+            keys = list(batch.keys())
+            
+            try:
+                for i in range(0, len(keys), self.chunk_size):
+                    await self._flush_chunk(keys[i:i + self.chunk_size], batch)
+            except Exception as e:
+                # Возвращаем инкременты обратно, чтобы не потерять их
+                # (пачка впереди накопленного за время сброса: она старше)
+                recorded, self._pending = self._pending, batch
+                for key, counters in recorded.items():
+                    self._add(key, *counters)
+                self.failed_flushes += 1
+                self._retry_at = time.monotonic() + self.failure_backoff
+                logger.error(f"❌ Rating flush error: {e}, forced flushes paused for {self.failure_backoff:.0f}s")
+                self._trim()
+                return 0
+            
+            self._retry_at = 0.0
+            return len(keys)
+    
+    async def _flush_chunk(self, keys: List[Tuple[int, str, datetime]], batch: Dict[Tuple[int, str, datetime], List[int]]) -> None:
+        """Записать часть пачки: один SELECT существующих строк, вставка новых, один COMMIT"""
+        async for session in get_session():
+            result = await session.execute(
+                select(UserRating).where(
+                    or_(*[
+                        and_(
+                            UserRating.user_id == user_id,
+                            UserRating.period == period,
+                            UserRating.period_start == period_start
+                        )
+                        for user_id, period, period_start in keys
+                    ])
+                )
+            )
+            existing = {
+                (rating.user_id, rating.period, rating.period_start): rating
+                for rating in result.scalars()
+            }
+            
+            now = datetime.utcnow()
+            for key in keys:
+                bets, wins, losses, winnings = batch[key]
+                rating = existing.get(key)
+                if rating is None:
+                    user_id, period, period_start = key
+                    rating = UserRating(
+                        user_id=user_id,
+                        period=period,
+                        period_start=period_start,
+                        total_wins=0,
+                        total_losses=0,
+                        total_winnings=0,
+                        total_bets=0
+                    )
+                    session.add(rating)
+                
+                rating.total_bets += bets
+                rating.total_wins += wins
+                rating.total_losses += losses
+                rating.total_winnings += winnings
+                rating.last_updated = now
+            
+            await session.commit()
+        
+        # Убираем из пачки только то, что точно записано
+        for key in keys:
+            batch.pop(key)
+    
+    async def _run(self) -> None:
+        """Периодический сброс"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    def start(self) -> None:
+        """Запустить периодический сброс"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Остановить периодический сброс и сбросить остаток (вызывать при завершении)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+    
+    @property
+    def pending_count(self) -> int:
+        """Количество ключей, ожидающих сброса"""
+        return len(self._pending)
+
+
+rating_aggregator = RatingAggregator()
+
+
 class CreditService:
     """Сервис для работы с кредитами"""
     
@@ -317,7 +505,17 @@ class CreditService:
             limit.last_used = datetime.utcnow()
             limit.usage_count += 1
             
+            await session.flush()
+            credit_id = credit.id
             await session.commit()
+            
+            # В срок возврата кредит станет просроченным (таймер переживает рестарт)
+            await timer_service.schedule(
+                f"credit:{credit_id}",
+                (due_date - datetime.utcnow()).total_seconds(),
+                'credit_due',
+                {'credit_id': credit_id}
+            )
             return True
     
     @staticmethod
@@ -344,6 +542,19 @@ class CreditService:
             
             return credits
     
+    @staticmethod
+    async def expire_credit(credit_id: int) -> bool:
+        """Помечает кредит просроченным, если он ещё не погашен"""
+        async for session in get_session():
+            credit = await session.get(UserCredit, credit_id)
+            if credit is None or credit.status != 'active':
+                return False
+            
+            credit.status = 'overdue'
+            credit.last_updated = datetime.utcnow()
+            await session.commit()
+            return True
+    
     @staticmethod
     async def check_overdue_credits() -> None:
         """Проверяет просроченные кредиты"""
@@ -500,6 +711,13 @@ class CreditService:
                 return winnings, "Недостаточно выигрыша для погашения кредитов"
 
 
+@timer_service.handler('credit_due')
+async def on_credit_due(payload: dict) -> None:
+    """Наступил срок возврата кредита"""
+    if await CreditService.expire_credit(payload['credit_id']):
+        logger.info(f"⏰ Credit {payload['credit_id']} is overdue")
+
+
 class VIPService:
     """Сервис для работы с VIP статусом"""
     
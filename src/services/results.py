@@ -0,0 +1,31 @@
+"""
+Результаты операций с кошельком и ставками (общие для SQL и Redis сервисов)
+"""
+
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+
+@dataclass
+class WalletOperation:
+    """Результат начисления/списания: транзакция и баланс сразу после операции"""
+    transaction: Any
+    transaction_id: Optional[Union[int, str]]
+    new_balance_cents: int
+
+
+@dataclass
+class BetSettlement:
+    """Результат завершения ставки: ставка, транзакция выигрыша (если была) и баланс"""
+    bet: Any
+    new_balance_cents: int
+    transaction_id: Optional[Union[int, str]] = None
+
+
+@dataclass
+class TransferResult:
+    """Результат перевода между пользователями: балансы обоих сразу после операции"""
+    sender_balance_cents: int
+    recipient_balance_cents: int
+    debit_transaction_id: Optional[Union[int, str]]
+    credit_transaction_id: Optional[Union[int, str]]
@@ -0,0 +1,473 @@
+"""
+Движок раундов ракетки: коэффициент считается по часам, а не по тикам,
+сообщение редактируется с частотой, которую выдерживает чат.
+
+В чате идёт один общий раунд: ставки принимаются во время отсчёта,
+все игроки смотрят одно сообщение и забирают выигрыш независимо.
+"""
+
+import asyncio
+import itertools
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from src.games.rocket import RocketGame
+from src.services.bet_service import bet_service
+from src.services.crash_chain_service import crash_chain_service
+from src.services.timer_wheel import timer_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RocketPlayer:
+    """Ставка игрока в раунде"""
+    bet_id: int
+    user_id: int
+    telegram_id: int
+    stake_cents: int
+    mention: str = ""
+
+    # Подкрутка: выигрыш забирается автоматически на последнем коэффициенте
+    auto_cashout: bool = False
+    # Открутка: личный потолок, выше которого забрать нельзя
+    max_cashout: Optional[float] = None
+
+    # 'flying' -> 'cashed_out' | 'crashed' | 'refunded'
+    status: str = 'flying'
+    cashout_multiplier: Optional[float] = None
+    payout_cents: int = 0
+    # Баланс после выплаты (приходит из complete_bet)
+    balance_cents: Optional[int] = None
+
+
+@dataclass
+class RocketRound:
+    """Общий раунд ракетки в чате"""
+    round_id: int
+    chat_id: int
+    betting_until: float
+    players: Dict[int, RocketPlayer] = field(default_factory=dict)  # telegram_id -> игрок
+    started_at: Optional[float] = None
+
+    # Точка краша вытягивается из цепочки хэшей при старте полёта
+    crash_point: float = RocketGame.START_MULTIPLIER
+    # Номер раунда в цепочке и его хэш - для проверки игроками
+    chain_index: Optional[int] = None
+    round_hash: Optional[str] = None
+
+    # 'betting' -> 'flying' -> 'finished' (взрыв) | 'cancelled' (сбой, ставки возвращены)
+    status: str = 'betting'
+
+    _settle_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def crash_at(self) -> float:
+        """Момент взрыва (time.monotonic)"""
+        return self.started_at + RocketGame.flight_duration(self.crash_point)
+
+    @property
+    def final_multiplier(self) -> float:
+        """Коэффициент, на котором ракета взрывается"""
+        return min(self.crash_point, RocketGame.MAX_MULTIPLIER)
+
+    def multiplier(self, now: Optional[float] = None) -> float:
+        """Текущий коэффициент"""
+        if self.started_at is None:
+            return RocketGame.START_MULTIPLIER
+        if now is None:
+            now = time.monotonic()
+        return min(RocketGame.multiplier_at(now - self.started_at), self.final_multiplier)
+
+    def is_crashed(self, now: Optional[float] = None) -> bool:
+        """Ракета уже взорвалась по времени"""
+        if self.started_at is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now >= self.crash_at
+
+    def flying_players(self):
+        return [player for player in self.players.values() if player.status == 'flying']
+
+
+class ChatEditBudget:
+    """
+    Бюджет редактирований для одного чата (AIMD).
+
+    Интервал между правками растёт вдвое при TelegramRetryAfter и плавно
+    уменьшается до минимума после успешных правок. Интервал делится между
+    всеми раундами, которые сейчас идут в чате.
+    """
+
+    PRIVATE_MIN_INTERVAL = 1.0   # ~1 правка в секунду в личке
+    GROUP_MIN_INTERVAL = 3.0     # ~20 сообщений в минуту в группе
+    MAX_INTERVAL = 30.0
+    RECOVERY_STEP = 0.1
+
+    def __init__(self, is_group: bool):
+        self.min_interval = self.GROUP_MIN_INTERVAL if is_group else self.PRIVATE_MIN_INTERVAL
+        self.interval = self.min_interval
+        self.blocked_until = 0.0
+        self.active_rounds = 0
+
+    def round_interval(self) -> float:
+        """Интервал правок для одного раунда в этом чате"""
+        return self.interval * max(self.active_rounds, 1)
+
+    def on_success(self) -> None:
+        self.interval = max(self.min_interval, self.interval - self.RECOVERY_STEP)
+
+    def on_retry_after(self, retry_after: float) -> None:
+        self.interval = min(self.MAX_INTERVAL, self.interval * 2)
+        self.blocked_until = time.monotonic() + retry_after
+
+
+# render(round, multiplier) - отрисовка общего сообщения раунда
+RenderFunc = Callable[[RocketRound, float], Awaitable[None]]
+
+
+class RocketEngine:
+    """
+    Раунды ракетки по чатам.
+
+    Коэффициент - функция от времени старта, поэтому кэшаут считается
+    по часам в момент нажатия кнопки, а не по последнему показанному
+    сообщению. Редактирования идут отдельно и реже, с учётом бюджета чата,
+    и их число не зависит от количества игроков в раунде. Ставки закрывает
+    только движок: либо кэшаут, либо взрыв.
+    """
+
+    PRIVATE_BETTING_WINDOW = 3.0
+    GROUP_BETTING_WINDOW = 10.0
+    # Запас после самого долгого полёта: ставку, которую раунд так и не закрыл
+    # (процесс перезапущен), возвращает таймер
+    ABANDON_GRACE = 60.0
+
+    def __init__(self):
+        self._round_ids = itertools.count(1)
+        self._betting: Dict[int, RocketRound] = {}  # chat_id -> раунд, принимающий ставки
+        self._rounds: Dict[int, RocketRound] = {}   # round_id -> активный раунд
+        self._budgets: Dict[int, ChatEditBudget] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Счётчики
+        self.edits_sent = 0
+        self.edits_throttled = 0
+        self.rounds_played = 0
+        self.players_settled = 0
+
+    def get_round(self, round_id: int) -> Optional[RocketRound]:
+        return self._rounds.get(round_id)
+
+    def is_in_betting_round(self, chat_id: int, telegram_id: int) -> bool:
+        """Игрок уже поставил в раунд, который ещё не стартовал"""
+        rnd = self._betting.get(chat_id)
+        return rnd is not None and telegram_id in rnd.players
+
+    def _get_budget(self, chat_id: int, is_group: bool) -> ChatEditBudget:
+        budget = self._budgets.get(chat_id)
+        if budget is None:
+            budget = ChatEditBudget(is_group)
+            self._budgets[chat_id] = budget
+        return budget
+
+    def join(
+        self,
+        chat_id: int,
+        player: RocketPlayer,
+        is_group: bool
+    ) -> Tuple[Optional[RocketRound], bool]:
+        """
+        Добавить ставку в раунд чата, принимающий ставки.
+
+        Returns:
+            (раунд, True) если раунд создан этой ставкой и его нужно запустить через start(),
+            (раунд, False) если ставка добавлена в уже открытый раунд,
+            (None, False) если игрок уже в этом раунде.
+        """
+        rnd = self._betting.get(chat_id)
+        if rnd is not None and time.monotonic() < rnd.betting_until:
+            if player.telegram_id in rnd.players:
+                return None, False
+            rnd.players[player.telegram_id] = player
+            return rnd, False
+
+        window = self.GROUP_BETTING_WINDOW if is_group else self.PRIVATE_BETTING_WINDOW
+        rnd = RocketRound(
+            round_id=next(self._round_ids),
+            chat_id=chat_id,
+            betting_until=time.monotonic() + window,
+        )
+        rnd.players[player.telegram_id] = player
+        self._betting[chat_id] = rnd
+        self._rounds[rnd.round_id] = rnd
+        return rnd, True
+
+    async def watch_bet(self, rnd: RocketRound, player: RocketPlayer) -> None:
+        """Запланировать возврат ставки на случай, если раунд не доживёт до расчёта"""
+        delay = (
+            max(rnd.betting_until - time.monotonic(), 0)
+            + RocketGame.flight_duration(RocketGame.MAX_MULTIPLIER)
+            + self.ABANDON_GRACE
+        )
+        await timer_service.schedule(
+            f"rocket:{player.bet_id}",
+            delay,
+            'rocket_timeout',
+            {'bet_id': player.bet_id, 'stake_cents': player.stake_cents}
+        )
+
+    def start(self, rnd: RocketRound, render: RenderFunc, is_group: bool = False) -> asyncio.Task:
+        """Запустить раунд в фоне (после окна ставок)"""
+        task = asyncio.create_task(self._run(rnd, render, is_group))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, rnd: RocketRound, render: RenderFunc, is_group: bool) -> None:
+        budget = self._get_budget(rnd.chat_id, is_group)
+        budget.active_rounds += 1
+
+        try:
+            # Окно ставок: новых игроков не показываем правками, только в итогах
+            await asyncio.sleep(max(rnd.betting_until - time.monotonic(), 0))
+            if self._betting.get(rnd.chat_id) is rnd:
+                del self._betting[rnd.chat_id]
+
+            # Точку краша берём до полёта: без неё раунд не начинается
+            try:
+                draw = await crash_chain_service.next_round()
+            except Exception as e:
+                logger.error(f"❌ Rocket crash point draw failed: round={rnd.round_id}, {e}")
+                await self._cancel(rnd, render, budget, 'refund:rocket_draw_failed')
+                return
+            rnd.crash_point = draw.crash_point
+            rnd.chain_index = draw.index
+            rnd.round_hash = draw.link
+
+            try:
+                await self._fly(rnd, render, budget)
+            except Exception as e:
+                logger.error(f"❌ Rocket round error: round={rnd.round_id}, {e}")
+                if rnd.is_crashed():
+                    # Ракета по часам уже взорвалась - обычный расчёт
+                    await self._settle_crash(rnd)
+                else:
+                    await self._cancel(rnd, render, budget, 'refund:rocket_round_failed')
+                return
+
+            # Итог раунда уже рассчитан: ошибка показа ставки не трогает
+            try:
+                await self._render(rnd, render, budget, rnd.final_multiplier, final=True)
+            except Exception as e:
+                logger.error(f"❌ Rocket final render error: round={rnd.round_id}, {e}")
+            self.rounds_played += 1
+        finally:
+            budget.active_rounds -= 1
+            if budget.active_rounds <= 0 and budget.interval <= budget.min_interval:
+                self._budgets.pop(rnd.chat_id, None)
+            if self._betting.get(rnd.chat_id) is rnd:
+                del self._betting[rnd.chat_id]
+            self._rounds.pop(rnd.round_id, None)
+
+    async def _fly(self, rnd: RocketRound, render: RenderFunc, budget: ChatEditBudget) -> None:
+        """Полёт до взрыва (или пока все не забрали) и расчёт оставшихся"""
+        rnd.status = 'flying'
+        rnd.started_at = time.monotonic()
+        await self._render(rnd, render, budget, RocketGame.START_MULTIPLIER)
+
+        next_edit_at = time.monotonic() + budget.round_interval()
+        while True:
+            now = time.monotonic()
+            if rnd.is_crashed(now) or not rnd.flying_players():
+                break
+
+            # Спим до ближайшего события: правки, взрыва или кэшаута
+            wake_at = min(next_edit_at, rnd.crash_at)
+            rnd._changed.clear()
+            try:
+                await asyncio.wait_for(rnd._changed.wait(), timeout=max(wake_at - now, 0))
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.monotonic()
+            if rnd.is_crashed(now) or now < next_edit_at:
+                continue
+
+            if now < budget.blocked_until:
+                self.edits_throttled += 1
+                next_edit_at = budget.blocked_until
+                continue
+
+            await self._render(rnd, render, budget, rnd.multiplier(now))
+            next_edit_at = time.monotonic() + budget.round_interval()
+
+        await self._settle_crash(rnd)
+
+    async def _cancel(self, rnd: RocketRound, render: RenderFunc, budget: ChatEditBudget, reason: str) -> None:
+        """
+        Сбой до взрыва: вернуть ставки тем, кто не успел забрать.
+        Таймеры возврата остаются - если возврат здесь не прошёл, его сделает таймер.
+        """
+        async with rnd._settle_lock:
+            if rnd.status in ('finished', 'cancelled'):
+                return
+            rnd.status = 'cancelled'
+
+            players = rnd.flying_players()
+            outcomes = await asyncio.gather(
+                *(bet_service.complete_bet(player.bet_id, reason, player.stake_cents) for player in players),
+                return_exceptions=True
+            )
+            for player, outcome in zip(players, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error(f"❌ Rocket refund error: bet={player.bet_id}, {outcome}")
+                    continue
+                player.status = 'refunded'
+                player.payout_cents = player.stake_cents
+                player.balance_cents = outcome.new_balance_cents
+            self.players_settled += len(players)
+
+        try:
+            await self._render(rnd, render, budget, rnd.multiplier(), final=True)
+        except Exception as e:
+            logger.error(f"❌ Rocket cancel render error: round={rnd.round_id}, {e}")
+
+    async def _render(
+        self,
+        rnd: RocketRound,
+        render: RenderFunc,
+        budget: ChatEditBudget,
+        multiplier: float,
+        final: bool = False
+    ) -> None:
+        """Отредактировать сообщение раунда с учётом лимитов Telegram"""
+        while True:
+            try:
+                await render(rnd, multiplier)
+                self.edits_sent += 1
+                budget.on_success()
+                return
+            except TelegramRetryAfter as e:
+                budget.on_retry_after(e.retry_after)
+                self.edits_throttled += 1
+                if not final:
+                    return
+                # Итог раунда обязательно показываем
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest:
+                # Сообщение не изменилось или удалено
+                return
+
+    async def _settle_crash(self, rnd: RocketRound) -> None:
+        """Закрыть ставки всех, кто не успел забрать"""
+        async with rnd._settle_lock:
+            if rnd.status in ('finished', 'cancelled'):
+                return
+            rnd.status = 'finished'
+
+            players = rnd.flying_players()
+            settlements = []
+            for player in players:
+                if player.auto_cashout:
+                    player.status = 'cashed_out'
+                    player.cashout_multiplier = rnd.final_multiplier
+                    player.payout_cents = RocketGame.calculate_payout(player.stake_cents, rnd.final_multiplier)
+                    result = f"cashed_out_at_{rnd.final_multiplier}"
+                else:
+                    player.status = 'crashed'
+                    result = f"crashed_at_{rnd.final_multiplier}"
+                settlements.append(bet_service.complete_bet(player.bet_id, result, player.payout_cents))
+
+            outcomes = await asyncio.gather(*settlements, return_exceptions=True)
+            unsettled = set()
+            for player, outcome in zip(players, outcomes):
+                if isinstance(outcome, Exception):
+                    # Ставка осталась pending - её вернёт таймер rocket_timeout
+                    unsettled.add(player.bet_id)
+                    logger.error(f"❌ Rocket crash settle error: bet={player.bet_id}, {outcome}")
+            self.players_settled += len(players) - len(unsettled)
+
+            # Закрытым ставкам таймеры возврата не нужны
+            await asyncio.gather(
+                *(
+                    timer_service.cancel(f"rocket:{player.bet_id}")
+                    for player in rnd.players.values()
+                    if player.bet_id not in unsettled
+                ),
+                return_exceptions=True
+            )
+
+    async def cash_out(self, round_id: int, telegram_id: int) -> Tuple[Optional[RocketPlayer], str]:
+        """
+        Забрать выигрыш по текущему коэффициенту раунда.
+
+        Returns:
+            (игрок, 'ok') при успехе, иначе (игрок или None, причина):
+            'not_found', 'not_player', 'not_started', 'finished', 'crashed'
+        """
+        rnd = self._rounds.get(round_id)
+        if rnd is None:
+            return None, 'not_found'
+        player = rnd.players.get(telegram_id)
+        if player is None:
+            return None, 'not_player'
+
+        # Время нажатия фиксируем до ожидания блокировки
+        pressed_at = time.monotonic()
+
+        async with rnd._settle_lock:
+            if rnd.status == 'betting':
+                return player, 'not_started'
+            if rnd.status != 'flying' or player.status != 'flying':
+                return player, 'finished'
+            if rnd.is_crashed(pressed_at):
+                return player, 'crashed'
+
+            multiplier = rnd.multiplier(pressed_at)
+            if player.max_cashout is not None and multiplier >= player.max_cashout:
+                return player, 'crashed'
+
+            payout = RocketGame.calculate_payout(player.stake_cents, multiplier)
+            settlement = await bet_service.complete_bet(player.bet_id, f"cashed_out_at_{multiplier}", payout)
+
+            player.status = 'cashed_out'
+            player.cashout_multiplier = multiplier
+            player.payout_cents = payout
+            player.balance_cents = settlement.new_balance_cents
+            self.players_settled += 1
+
+        # Будим цикл раунда: если забрали все, раунд можно закрывать
+        rnd._changed.set()
+        return player, 'ok'
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика движка"""
+        return {
+            'active_rounds': len(self._rounds),
+            'rounds_played': self.rounds_played,
+            'players_settled': self.players_settled,
+            'edits_sent': self.edits_sent,
+            'edits_throttled': self.edits_throttled,
+        }
+
+
+@timer_service.handler('rocket_timeout')
+async def refund_abandoned_rocket_bet(payload: dict) -> None:
+    """Раунд не закрыл ставку (процесс перезапущен посреди раунда) - возвращаем её"""
+    try:
+        await bet_service.complete_bet(payload['bet_id'], 'refund:rocket_round_lost', payload['stake_cents'])
+    except ValueError:
+        # Ставка уже рассчитана
+        return
+    logger.warning(f"⚠️ Rocket bet refunded by timer: bet={payload['bet_id']}")
+
+
+rocket_engine = RocketEngine()
+
@@ -0,0 +1,254 @@
+"""
+Пары сидов provably fair для слотов, костей и рулетки.
+
+У каждого игрока активная пара: server_seed (игроку виден только его
+sha256), client_seed (игрок может задать свой) и nonce, который растёт
+с каждой игрой. Пара хранится в Redis и общая для всех воркеров: nonce
+выдаётся атомарно скриптом вместе с сидами. При смене пары старый
+server_seed раскрывается - после этого все игры на нём можно проверить.
+
+HMAC-ключ активного сида готовится один раз и кэшируется в процессе:
+на игру остаётся copy() и один update().
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from src.games.provably_fair import fair_message, seed_hash
+from src.redis_db import db
+
+logger = logging.getLogger(__name__)
+
+
+# Выдать пару и nonce (ARGV[3] = 1 - игра, nonce увеличивается; 0 - только посмотреть).
+# Пары ещё нет: ARGV[1] пуст - вернуть nil (вызывающий повторит с новым сидом),
+# иначе создать пару из ARGV[1], ARGV[2].
+DRAW_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[1] == '' then
+        return false
+    end
+    redis.call('HSET', KEYS[1], 'server_seed', ARGV[1], 'client_seed', ARGV[2], 'nonce', 0)
+end
+local nonce = tonumber(redis.call('HGET', KEYS[1], 'nonce'))
+if ARGV[3] == '1' then
+    redis.call('HINCRBY', KEYS[1], 'nonce', 1)
+end
+local pair = redis.call('HMGET', KEYS[1], 'server_seed', 'client_seed')
+return {pair[1], pair[2], nonce}
+"""
+
+# Сменить пару: новый server_seed ARGV[1], client_seed ARGV[2] (пусто - оставить
+# прежний или ARGV[3] для новой пары). Старый сид переходит в раскрытые.
+ROTATE_SCRIPT = """
+local old = redis.call('HMGET', KEYS[1], 'server_seed', 'client_seed', 'nonce')
+local client_seed = ARGV[2]
+if client_seed == '' then
+    client_seed = old[2] or ARGV[3]
+end
+redis.call('HSET', KEYS[1], 'server_seed', ARGV[1], 'client_seed', client_seed, 'nonce', 0)
+if not old[1] then
+    return false
+end
+redis.call('HSET', KEYS[2], old[1], cjson.encode({
+    client_seed = old[2],
+    nonces = tonumber(old[3]),
+    revealed_at = tonumber(ARGV[4])
+}))
+return {old[1], old[2], old[3]}
+"""
+
+
+@dataclass
+class FairDraw:
+    """Данные одной игры: пара сидов, nonce и HMAC раунда"""
+    server_seed: str
+    client_seed: str
+    nonce: int
+    hash_result: str
+
+
+@dataclass
+class SeedPair:
+    """Активная пара, как её видит игрок"""
+    server_hash: str
+    client_seed: str
+    nonce: int
+
+
+@dataclass
+class RevealedSeed:
+    """Раскрытый server_seed и игры, сыгранные на нём (nonce 0..nonces-1)"""
+    user_id: int
+    server_seed: str
+    client_seed: str
+    nonces: int
+
+    @property
+    def server_hash(self) -> str:
+        return seed_hash(self.server_seed)
+
+
+class SeedService:
+    """Активные пары сидов игроков и их раскрытие"""
+
+    # Подготовленных HMAC-ключей в памяти процесса (по активным игрокам)
+    KEY_CACHE_SIZE = 10000
+    CLIENT_SEED_MAX_LENGTH = 64
+
+    def __init__(self):
+        self._keys: "OrderedDict[str, hmac.HMAC]" = OrderedDict()
+        self._draw_script = None
+        self._rotate_script = None
+
+    @staticmethod
+    def _pair_key(user_id: int) -> str:
+        return f"fair:seed:{user_id}"
+
+    @staticmethod
+    def _revealed_key(user_id: int) -> str:
+        return f"fair:revealed:{user_id}"
+
+    @staticmethod
+    def new_server_seed() -> str:
+        return secrets.token_hex(32)
+
+    @staticmethod
+    def new_client_seed() -> str:
+        return secrets.token_hex(8)
+
+    def _scripts(self):
+        if self._draw_script is None:
+            self._draw_script = db.client.register_script(DRAW_SCRIPT)
+            self._rotate_script = db.client.register_script(ROTATE_SCRIPT)
+        return self._draw_script, self._rotate_script
+
+    def _hmac_key(self, server_seed: str) -> "hmac.HMAC":
+        """Подготовленный ключ сида (внутреннее/внешнее состояние HMAC уже посчитано)"""
+        key = self._keys.get(server_seed)
+        if key is None:
+            key = hmac.new(server_seed.encode(), digestmod=hashlib.sha256)
+            self._keys[server_seed] = key
+            if len(self._keys) > self.KEY_CACHE_SIZE:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(server_seed)
+        return key
+
+    def round_hash(self, server_seed: str, client_seed: str, nonce: int) -> str:
+        """То же, что provably_fair.fair_hash, но без пересчёта ключа"""
+        mac = self._hmac_key(server_seed).copy()
+        mac.update(fair_message(server_seed, client_seed, nonce))
+        return mac.hexdigest()
+
+    async def _call_draw(self, user_id: int, advance: bool) -> list:
+        draw_script, _ = self._scripts()
+        keys = [self._pair_key(user_id)]
+        flag = '1' if advance else '0'
+        response = await draw_script(keys=keys, args=['', '', flag])
+        if response is None:
+            # Первая игра: создаём пару (если другой воркер успел раньше - возьмём его)
+            response = await draw_script(
+                keys=keys,
+                args=[self.new_server_seed(), self.new_client_seed(), flag]
+            )
+        return response
+
+    async def draw(self, user_id: int) -> FairDraw:
+        """Пара сидов и nonce для следующей игры (nonce увеличивается)"""
+        server_seed, client_seed, nonce = await self._call_draw(user_id, advance=True)
+        nonce = int(nonce)
+        return FairDraw(
+            server_seed=server_seed,
+            client_seed=client_seed,
+            nonce=nonce,
+            hash_result=self.round_hash(server_seed, client_seed, nonce)
+        )
+
+    async def get_pair(self, user_id: int) -> SeedPair:
+        """Активная пара (создаётся, если её ещё нет - хэш публикуется до первой игры)"""
+        server_seed, client_seed, nonce = await self._call_draw(user_id, advance=False)
+        return SeedPair(server_hash=seed_hash(server_seed), client_seed=client_seed, nonce=int(nonce))
+
+    def validate_client_seed(self, client_seed: str) -> Optional[str]:
+        """Текст ошибки или None"""
+        if not client_seed or len(client_seed) > self.CLIENT_SEED_MAX_LENGTH:
+            return f"Клиентский сид - от 1 до {self.CLIENT_SEED_MAX_LENGTH} символов"
+        if not client_seed.isprintable() or any(ch.isspace() for ch in client_seed):
+            return "Клиентский сид не должен содержать пробелов"
+        return None
+
+    async def rotate(self, user_ids: Iterable[int], client_seed: Optional[str] = None) -> List[RevealedSeed]:
+        """
+        Сменить пары игроков одним запросом к Redis и раскрыть старые сиды.
+        client_seed задаёт новый клиентский сид (иначе остаётся прежний).
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+
+        _, rotate_script = self._scripts()
+        now = time.time()
+        async with db.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                await rotate_script(
+                    keys=[self._pair_key(user_id), self._revealed_key(user_id)],
+                    args=[self.new_server_seed(), client_seed or '', self.new_client_seed(), now],
+                    client=pipe
+                )
+            responses = await pipe.execute()
+
+        revealed = []
+        for user_id, response in zip(user_ids, responses):
+            if response is None:
+                continue
+            server_seed, old_client_seed, nonces = response
+            self._keys.pop(server_seed, None)
+            revealed.append(RevealedSeed(
+                user_id=user_id,
+                server_seed=server_seed,
+                client_seed=old_client_seed,
+                nonces=int(nonces)
+            ))
+
+        logger.info(f"🔐 Seeds rotated: {len(user_ids)} users, {len(revealed)} revealed")
+        return revealed
+
+    async def rotate_all(self, batch_size: int = 500) -> int:
+        """Сменить пары всех игроков (пачками по batch_size); возвращает число раскрытых сидов"""
+        revealed = 0
+        batch: List[int] = []
+        async for key in db.client.scan_iter(match="fair:seed:*", count=batch_size):
+            batch.append(int(key.rsplit(':', 1)[1]))
+            if len(batch) >= batch_size:
+                revealed += len(await self.rotate(batch))
+                batch = []
+        revealed += len(await self.rotate(batch))
+        return revealed
+
+    async def get_revealed(self, user_id: int) -> Dict[str, RevealedSeed]:
+        """Раскрытые сиды игрока: server_seed -> данные"""
+        raw = await db.client.hgetall(self._revealed_key(user_id))
+        revealed = {}
+        for server_seed, data in raw.items():
+            data = json.loads(data)
+            revealed[server_seed] = RevealedSeed(
+                user_id=user_id,
+                server_seed=server_seed,
+                client_seed=data['client_seed'],
+                nonces=int(data['nonces'])
+            )
+        return revealed
+
+    def stats(self) -> dict:
+        return {'cached_keys': len(self._keys)}
+
+
+seed_service = SeedService()
@@ -0,0 +1,429 @@
+"""
+Таймеры: иерархическое колесо в памяти и долговечные таймеры поверх Redis.
+
+TimerWheel - тысячи отложенных задач на одной корутине: schedule/cancel O(1),
+дальние таймеры лежат на грубых уровнях и спускаются на точные по мере
+приближения срока.
+
+TimerService - таймеры, которые переживают рестарт: расписание хранится
+в Redis, колесо лишь будит процесс в нужный момент.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from src.redis_db import db
+from src.utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+TimerCallback = Callable[[], Awaitable[None]]
+TimerHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class Timer:
+    """Отложенная задача на колесе"""
+    timer_id: int
+    deadline: float
+    expires_tick: int
+    callback: TimerCallback
+    name: str = ''
+    cancelled: bool = False
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров (как в ядре Linux).
+
+    Уровень 0 - 256 корзин по tick секунд, уровни 1-3 - по 64 корзины, каждая
+    покрывает целый оборот предыдущего уровня. При tick=0.05 колесо видит
+    на ~38 дней вперёд, более дальние таймеры ждут на последнем уровне.
+    Одна корутина раз в tick проворачивает колесо и запускает сработавшие
+    колбэки отдельными задачами (долгий колбэк не задерживает остальные).
+    Точность срабатывания - tick.
+    """
+
+    LEVEL_BITS = (8, 6, 6, 6)
+
+    def __init__(self, tick: float = 0.05):
+        self.tick = tick
+        self._levels: List[List[List[Timer]]] = self._empty_levels()
+        self._now_tick = 0
+        self._started_at: Optional[float] = None
+        self._ids = itertools.count(1)
+        self._timers: Dict[int, Timer] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        # Метрики
+        self.scheduled = 0
+        self.fired = 0
+        self.failed = 0
+        self.cascaded = 0
+        self.lateness = LatencyHistogram()
+
+    def _empty_levels(self) -> List[List[List[Timer]]]:
+        return [[[] for _ in range(1 << bits)] for bits in self.LEVEL_BITS]
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self.start()
+
+    def schedule(self, delay: float, callback: TimerCallback, name: str = '') -> Timer:
+        """Запустить callback() через delay секунд"""
+        self._ensure_started()
+        now = time.monotonic()
+        # Тики считаются от старта колеса и округляются вверх - не раньше срока
+        expires_tick = int((now + delay - self._started_at) / self.tick + 0.999999)
+        timer = Timer(
+            timer_id=next(self._ids),
+            deadline=now + delay,
+            expires_tick=max(expires_tick, self._now_tick + 1),
+            callback=callback,
+            name=name
+        )
+        self._place(timer)
+        self._timers[timer.timer_id] = timer
+        self.scheduled += 1
+        return timer
+
+    def cancel(self, timer: Timer) -> bool:
+        """Отменить таймер (он будет выброшен из корзины при проходе колеса)"""
+        if timer.cancelled or timer.timer_id not in self._timers:
+            return False
+        timer.cancelled = True
+        del self._timers[timer.timer_id]
+        return True
+
+    def _place(self, timer: Timer) -> None:
+        """Положить таймер на самый точный уровень, покрывающий его срок"""
+        expires = timer.expires_tick
+        diff = expires - self._now_tick
+        shift = 0
+        last = len(self.LEVEL_BITS) - 1
+        for level, bits in enumerate(self.LEVEL_BITS):
+            span = 1 << (shift + bits)
+            if diff < span or level == last:
+                if diff >= span:
+                    # Дальше горизонта колеса - ждём в самой дальней корзине
+                    expires = self._now_tick + span - 1
+                self._levels[level][(expires >> shift) & ((1 << bits) - 1)].append(timer)
+                return
+            shift += bits
+
+    def _cascade(self, level: int, shift: int) -> None:
+        """Спустить таймеры текущей корзины уровня level на более точные уровни"""
+        index = (self._now_tick >> shift) & ((1 << self.LEVEL_BITS[level]) - 1)
+        bucket = self._levels[level][index]
+        self._levels[level][index] = []
+        for timer in bucket:
+            if not timer.cancelled:
+                self._place(timer)
+                self.cascaded += 1
+
+    def _advance(self) -> None:
+        """Провернуть колесо на один тик и запустить сработавшие таймеры"""
+        self._now_tick += 1
+
+        # Полный оборот уровня спускает очередную корзину уровня выше
+        shift = 0
+        for level in range(1, len(self.LEVEL_BITS)):
+            shift += self.LEVEL_BITS[level - 1]
+            if self._now_tick & ((1 << shift) - 1):
+                break
+            self._cascade(level, shift)
+
+        index = self._now_tick & ((1 << self.LEVEL_BITS[0]) - 1)
+        bucket = self._levels[0][index]
+        if not bucket:
+            return
+        self._levels[0][index] = []
+
+        now = time.monotonic()
+        for timer in bucket:
+            if timer.cancelled:
+                continue
+            if timer.expires_tick > self._now_tick:
+                # Таймер был дальше горизонта колеса - ещё один круг
+                self._place(timer)
+                continue
+            del self._timers[timer.timer_id]
+            self.lateness.observe(max(now - timer.deadline, 0.0))
+            self._fire(timer)
+
+    def _fire(self, timer: Timer) -> None:
+        task = asyncio.create_task(self._run_callback(timer))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_callback(self, timer: Timer) -> None:
+        try:
+            await timer.callback()
+            self.fired += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Timer {timer.name or timer.timer_id} failed: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            # Спим до следующего тика по часам, а не по накопленным sleep
+            next_tick = self._started_at + (self._now_tick + 1) * self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._advance()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._started_at = time.monotonic()
+            self._now_tick = 0
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, fire_pending: bool = True) -> None:
+        """
+        Остановить колесо. fire_pending - сразу выполнить ожидающие таймеры
+        (например, показать уже рассчитанные результаты игр).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        pending = list(self._timers.values())
+        self._timers.clear()
+        self._levels = self._empty_levels()
+        if fire_pending:
+            for timer in pending:
+                self._fire(timer)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        """Метрики колеса"""
+        return {
+            'pending': len(self._timers),
+            'running': len(self._running),
+            'scheduled': self.scheduled,
+            'fired': self.fired,
+            'failed': self.failed,
+            'cascaded': self.cascaded,
+            'lateness': self.lateness.snapshot(),
+        }
+
+
+# Взять наступивший таймер в аренду: при нескольких воркерах его выполнит один.
+# Таймер не удаляется, а переносится на конец аренды - если обработчик упадёт
+# (или процесс умрёт), по истечении аренды таймер сработает снова.
+# KEYS[1] - сроки (ZSET), KEYS[2] - данные (HASH), KEYS[3] - попытки (HASH)
+# ARGV[1] - ключ таймера, ARGV[2] - текущее время (unix), ARGV[3] - конец аренды
+# Возвращает {данные, номер попытки} или false (не наступил, перенесён,
+# отменён, уже выполнен или в аренде у другого процесса)
+CLAIM_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then
+    return false
+end
+local raw = redis.call('HGET', KEYS[2], ARGV[1])
+if not raw then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    return false
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+local attempts = redis.call('HINCRBY', KEYS[3], ARGV[1], 1)
+return {raw, attempts}
+"""
+
+# Удалить выполненный таймер, если он всё ещё в нашей аренде
+# (обработчик мог перенести его через schedule - тогда не трогаем).
+# KEYS как у CLAIM_SCRIPT; ARGV[1] - ключ, ARGV[2] - конец аренды
+ACK_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) == tonumber(ARGV[2]) then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class TimerService:
+    """
+    Долговечные таймеры: расписание в Redis, срабатывание через колесо.
+
+    schedule(key, delay, kind, payload) пишет таймер в Redis (ZSET сроков
+    и HASH данных) и ставит его на локальное колесо; повторный schedule с тем
+    же ключом переносит таймер. В срок таймер берётся в аренду Lua-скриптом
+    (ровно одним процессом) и передаётся обработчику своего вида (kind);
+    из Redis он удаляется только после успешного обработчика. Если обработчик
+    упал или процесс умер, таймер сработает снова после аренды (LEASE
+    секунд), но не больше MAX_ATTEMPTS раз - обработчики должны быть
+    идемпотентными.
+
+    Каждый процесс держит на колесе таймеры ближайшего часа (start()
+    и периодическая синхронизация), поэтому таймеры упавшего воркера
+    выполнит другой.
+    """
+
+    DUE_KEY = "timers:due"
+    DATA_KEY = "timers:data"
+    ATTEMPTS_KEY = "timers:attempts"
+    SYNC_INTERVAL = 30.0
+    RESTORE_HORIZON = 3600.0
+    LEASE = 60.0
+    MAX_ATTEMPTS = 10
+
+    def __init__(self, wheel: TimerWheel):
+        self.wheel = wheel
+        self.bot = None
+        self._handlers: Dict[str, TimerHandler] = {}
+        self._local: Dict[str, Timer] = {}
+        self._claim_script = None
+        self._ack_script = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.restored = 0
+        self.claimed = 0
+        self.lost_claims = 0
+        self.failed = 0
+
+    def handler(self, kind: str) -> Callable[[TimerHandler], TimerHandler]:
+        """Декоратор: обработчик таймеров вида kind"""
+        def decorator(func: TimerHandler) -> TimerHandler:
+            self._handlers[kind] = func
+            return func
+        return decorator
+
+    async def schedule(self, key: str, delay: float, kind: str, payload: Dict[str, Any]) -> None:
+        """Запланировать (или перенести) таймер key через delay секунд"""
+        deadline = time.time() + delay
+        data = json.dumps({'kind': kind, 'payload': payload})
+        async with db.client.pipeline(transaction=True) as pipe:
+            pipe.hset(self.DATA_KEY, key, data)
+            pipe.zadd(self.DUE_KEY, {key: deadline})
+            pipe.hdel(self.ATTEMPTS_KEY, key)
+            await pipe.execute()
+        self._schedule_local(key, deadline)
+
+    async def cancel(self, key: str) -> None:
+        """Отменить таймер key"""
+        timer = self._local.pop(key, None)
+        if timer is not None:
+            self.wheel.cancel(timer)
+        async with db.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.DUE_KEY, key)
+            pipe.hdel(self.DATA_KEY, key)
+            pipe.hdel(self.ATTEMPTS_KEY, key)
+            await pipe.execute()
+
+    def _schedule_local(self, key: str, deadline: float) -> None:
+        old = self._local.get(key)
+        if old is not None:
+            self.wheel.cancel(old)
+        self._local[key] = self.wheel.schedule(
+            max(deadline - time.time(), 0.0),
+            lambda: self._fire(key),
+            name=key
+        )
+
+    async def _fire(self, key: str) -> None:
+        self._local.pop(key, None)
+        if self._claim_script is None:
+            self._claim_script = db.client.register_script(CLAIM_SCRIPT)
+            self._ack_script = db.client.register_script(ACK_SCRIPT)
+        keys = [self.DUE_KEY, self.DATA_KEY, self.ATTEMPTS_KEY]
+        now = time.time()
+        lease_until = repr(now + self.LEASE)
+        claimed = await self._claim_script(keys=keys, args=[key, now, lease_until])
+        if not claimed:
+            # Перенесён, отменён, уже выполнен или выполняется другим воркером
+            self.lost_claims += 1
+            return
+        self.claimed += 1
+
+        raw, attempts = claimed
+        entry = json.loads(raw)
+        # Не дошли до ack - после аренды таймер повторит этот процесс (упал процесс - другой, через sync)
+        self._schedule_local(key, float(lease_until))
+        lease_timer = self._local[key]
+        try:
+            handler = self._handlers.get(entry['kind'])
+            if handler is None:
+                raise LookupError(f"no handler for kind {entry['kind']}")
+            await handler(entry['payload'])
+        except Exception as e:
+            self.failed += 1
+            if attempts < self.MAX_ATTEMPTS:
+                logger.error(f"❌ Timer {key} failed (attempt {attempts}), retry in {self.LEASE:.0f}s: {e}")
+                return
+            logger.error(f"❌ Timer {key} failed {attempts} times, dropping: {e}")
+
+        # Обработчик мог перенести таймер - тогда локальный таймер уже не наш
+        if self._local.get(key) is lease_timer:
+            del self._local[key]
+            self.wheel.cancel(lease_timer)
+        await self._ack_script(keys=keys, args=[key, lease_until])
+
+    async def _load(self, max_deadline: float) -> int:
+        """Поставить на колесо таймеры из Redis со сроком до max_deadline"""
+        entries = await db.client.zrangebyscore(self.DUE_KEY, '-inf', max_deadline, withscores=True)
+        loaded = 0
+        for key, deadline in entries:
+            if key not in self._local:
+                self._schedule_local(key, deadline)
+                loaded += 1
+        return loaded
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.SYNC_INTERVAL)
+            try:
+                # Дальние таймеры, а также брошенные упавшими воркерами
+                loaded = await self._load(time.time() + self.RESTORE_HORIZON)
+                if loaded:
+                    self.restored += loaded
+                    logger.info(f"⏰ Loaded {loaded} timers from Redis")
+            except Exception as e:
+                logger.error(f"❌ Timer sync error: {e}")
+
+    async def start(self, bot=None) -> None:
+        """Запустить колесо и поднять таймеры из Redis"""
+        self.bot = bot
+        self.wheel.start()
+        restored = await self._load(time.time() + self.RESTORE_HORIZON)
+        self.restored += restored
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_loop())
+        logger.info(f"✅ Timer service started, restored {restored} timers")
+
+    async def stop(self) -> None:
+        """Остановить; несработавшие таймеры остаются в Redis до следующего старта"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        self._local.clear()
+        await self.wheel.stop(fire_pending=False)
+
+    def stats(self) -> Dict:
+        """Метрики таймеров"""
+        return {
+            **self.wheel.stats(),
+            'durable_local': len(self._local),
+            'restored': self.restored,
+            'claimed': self.claimed,
+            'lost_claims': self.lost_claims,
+            'failed': self.failed,
+        }
+
+
+timer_wheel = TimerWheel()
+timer_service = TimerService(timer_wheel)
@@ -0,0 +1,161 @@
+"""
+In-process кэш пользователей по telegram_id (read-through, TTL + LRU)
+"""
+
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from src.models import User
+from src.redis_db import db
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Кэш пользователей для хендлеров.
+
+    Хранит отсоединённые от сессии объекты User (expire_on_commit=False),
+    поэтому их можно только читать. Любое изменение пользователя делается
+    в своей сессии, после чего вызывается invalidate().
+
+    У каждого процесса свой кэш. В многопроцессном режиме (start()) сброс
+    рассылается остальным процессам через Redis pub/sub - иначе бан, подкрутка
+    или VIP, выставленные в одном воркере, до истечения TTL не видны в других.
+    """
+
+    INVALIDATE_CHANNEL = "user_cache:invalidate"
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+        # Свои сообщения из канала пропускаем
+        self._origin = f"{os.getpid()}-{id(self)}"
+        self._listener: Optional[asyncio.Task] = None
+        self._publishing: Set[asyncio.Task] = set()
+
+        # Счётчики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    async def get(self, telegram_id: int) -> Optional[User]:
+        """Получить пользователя из кэша или из БД"""
+        user, _ = await self.lookup(telegram_id)
+        return user
+
+    async def lookup(self, telegram_id: int) -> Tuple[Optional[User], bool]:
+        """То же, что get(), плюс было ли это попадание в кэш (без запроса к БД)"""
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            expires_at, user = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(telegram_id)
+                self.hits += 1
+                return user, True
+            del self._entries[telegram_id]
+
+        self.misses += 1
+
+        from src.database import async_session_maker
+
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(User).where(User.telegram_id == telegram_id)
+            )
+            user = result.scalar_one_or_none()
+
+        # Отсутствующих пользователей не кэшируем: после /start они должны появиться сразу
+        if user is not None:
+            self.put(user)
+
+        return user, False
+
+    def put(self, user: User) -> None:
+        """Положить пользователя в кэш"""
+        self._entries[user.telegram_id] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(user.telegram_id)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, telegram_id: int) -> None:
+        """Сбросить пользователя из кэша (вызывать после любого изменения)"""
+        if self._entries.pop(telegram_id, None) is not None:
+            self.invalidations += 1
+        if self._listener is not None:
+            task = asyncio.create_task(self._publish(telegram_id))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+    async def _publish(self, telegram_id: int) -> None:
+        try:
+            await db.client.publish(self.INVALIDATE_CHANNEL, f"{self._origin}:{telegram_id}")
+        except Exception as e:
+            logger.error(f"❌ User cache invalidation publish failed: user={telegram_id}, {e}")
+
+    async def _listen(self) -> None:
+        """Сбрасывать пользователей, изменённых в других процессах"""
+        while True:
+            pubsub = db.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.INVALIDATE_CHANNEL)
+                # Пока не были подписаны, сбросы могли пройти мимо
+                self.clear()
+                async for message in pubsub.listen():
+                    origin, _, telegram_id = message['data'].rpartition(':')
+                    if origin == self._origin:
+                        continue
+                    if self._entries.pop(int(telegram_id), None) is not None:
+                        self.remote_invalidations += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ User cache invalidation listener error: {e}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                await pubsub.close()
+
+    def start(self) -> None:
+        """Получать сбросы от других процессов (нужно, если процессов несколько)"""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'remote_invalidations': self.remote_invalidations,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+        }
+
+
+user_cache = UserCache()
@@ -0,0 +1,194 @@
+"""
+Блокировки на пользователя: операции с кошельком одного игрока выполняются по очереди
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from src.config import settings
+from src.redis_db import db
+from src.utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Снять блокировку, только если она всё ещё наша
+# KEYS[1] - ключ блокировки, ARGV[1] - токен владельца
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LocalLockBackend:
+    """Блокировки в памяти процесса (asyncio.Lock на пользователя)"""
+
+    def __init__(self):
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+
+    async def acquire(self, user_id: int, label: str, timeout: float) -> Optional[str]:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+
+        if lock.locked() and timeout <= 0:
+            return None
+
+        self._waiters[user_id] = self._waiters.get(user_id, 0) + 1
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout=timeout if timeout > 0 else None)
+            return label
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters[user_id] -= 1
+
+    async def release(self, user_id: int, token: str) -> None:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            return
+        lock.release()
+        # Не держим блокировки неактивных пользователей
+        if not self._waiters.get(user_id):
+            self._locks.pop(user_id, None)
+            self._waiters.pop(user_id, None)
+
+
+class RedisLockBackend:
+    """
+    Блокировки в Redis (SET NX PX) - общие для всех процессов.
+
+    TTL страхует от зависшей блокировки, если процесс упал, не сняв её.
+    """
+
+    KEY_PREFIX = "user_lock"
+    POLL_INTERVAL_MIN = 0.01
+    POLL_INTERVAL_MAX = 0.2
+
+    def __init__(self, lock_ttl_ms: int = 60000):
+        self.lock_ttl_ms = lock_ttl_ms
+        self._release_script = None
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    async def acquire(self, user_id: int, label: str, timeout: float) -> Optional[str]:
+        token = f"{label}:{secrets.token_hex(8)}"
+        key = self._key(user_id)
+        deadline = time.monotonic() + timeout
+        delay = self.POLL_INTERVAL_MIN
+
+        while True:
+            if await db.client.set(key, token, nx=True, px=self.lock_ttl_ms):
+                return token
+            if time.monotonic() + delay > deadline:
+                return None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.POLL_INTERVAL_MAX)
+
+    async def release(self, user_id: int, token: str) -> None:
+        if self._release_script is None:
+            self._release_script = db.client.register_script(RELEASE_SCRIPT)
+        try:
+            await self._release_script(keys=[self._key(user_id)], args=[token])
+        except Exception as e:
+            # Блокировка истечёт сама по TTL
+            logger.warning(f"⚠️ User lock release failed: user={user_id}, {e}")
+
+
+class UserLockRegistry:
+    """
+    Блокировки и реестр операций в процессе по пользователю.
+
+    in_flight показывает, какая операция сейчас выполняется у пользователя
+    в этом процессе. Метрики: сколько раз пришлось ждать, сколько запросов
+    отклонено, гистограммы ожидания и удержания блокировки.
+    """
+
+    def __init__(self, backend: str = 'local', lock_ttl_ms: int = 60000):
+        self.lock_ttl_ms = lock_ttl_ms
+        self.set_backend(backend)
+
+        self.in_flight: Dict[int, Tuple[str, float]] = {}
+
+        # Метрики
+        self.acquired = 0
+        self.contended = 0
+        self.rejected = 0
+        self.wait_time = LatencyHistogram()
+        self.hold_time = LatencyHistogram()
+
+    def set_backend(self, backend: str) -> None:
+        """Выбрать бэкенд (при старте, до первых блокировок)"""
+        self.backend_name = backend
+        if backend == 'redis':
+            self._backend = RedisLockBackend(self.lock_ttl_ms)
+        else:
+            self._backend = LocalLockBackend()
+
+    def is_busy(self, user_id: int) -> bool:
+        """Есть ли у пользователя незавершённая операция в этом процессе"""
+        return user_id in self.in_flight
+
+    @asynccontextmanager
+    async def hold(self, user_id: int, label: str = 'op', timeout: float = 0) -> AsyncIterator[bool]:
+        """
+        Выполнить блок под блокировкой пользователя.
+
+        timeout=0 - отклонить сразу, если блокировка занята (дубликаты),
+        timeout>0 - ждать в очереди не дольше timeout секунд.
+        Отдаёт True, если блокировка получена.
+        """
+        started = time.monotonic()
+        contended = self.is_busy(user_id)
+        if contended:
+            self.contended += 1
+
+        token = await self._backend.acquire(user_id, label, timeout)
+        waited = time.monotonic() - started
+        if token is None:
+            self.rejected += 1
+            if not contended:
+                # Блокировку держит другой процесс
+                self.contended += 1
+            yield False
+            return
+
+        self.acquired += 1
+        self.wait_time.observe(waited)
+        acquired_at = time.monotonic()
+        self.in_flight[user_id] = (label, acquired_at)
+        try:
+            yield True
+        finally:
+            self.in_flight.pop(user_id, None)
+            self.hold_time.observe(time.monotonic() - acquired_at)
+            await self._backend.release(user_id, token)
+
+    def stats(self) -> Dict:
+        """Метрики блокировок"""
+        return {
+            'backend': self.backend_name,
+            'in_flight': len(self.in_flight),
+            'acquired': self.acquired,
+            'contended': self.contended,
+            'rejected': self.rejected,
+            'wait_time': self.wait_time.snapshot(),
+            'hold_time': self.hold_time.snapshot(),
+        }
+
+
+def default_lock_backend() -> str:
+    if settings.USER_LOCK_BACKEND:
+        return settings.USER_LOCK_BACKEND
+    # Несколько процессов - блокировки должны быть общими
+    return 'redis' if settings.WEBHOOK_WORKERS > 1 else 'local'
+
+
+user_lock_registry = UserLockRegistry(backend=default_lock_backend())
@@ -0,0 +1,155 @@
+"""
+Массовая проверка provably fair ставок.
+
+Ставки читаются из БД потоком (по VERIFY_CHUNK_SIZE строк), к каждой
+подставляется клиентский сид из раскрытых пар, а пересчёт HMAC и
+результатов идёт пачками в ProcessPoolExecutor - event loop бота только
+читает БД и собирает расхождения. Ставки на ещё не раскрытом сиде
+(активная пара) пропускаются.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import select
+
+from src.config import settings
+from src.games.fair_verify import VERIFIABLE_GAMES, BetRow, Mismatch, verify_rows
+from src.models import Bet
+from src.services.seed_service import RevealedSeed, seed_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VerificationReport:
+    """Итог проверки"""
+    checked: int = 0
+    # Ставки на нераскрытом (активном) или неизвестном сиде
+    unrevealed: int = 0
+    mismatch_count: int = 0
+    # Первые MAX_REPORTED расхождений
+    mismatches: List[Mismatch] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+class VerificationService:
+    """Пересчёт истории ставок в пуле процессов"""
+
+    MAX_REPORTED = 100
+
+    def __init__(self, workers: int, chunk_size: int):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Пользователи, чья проверка уже идёт (одна на пользователя)
+        self._running: Set[int] = set()
+
+    def is_running(self, user_id: int) -> bool:
+        return user_id in self._running
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def verify(
+        self,
+        user_id: Optional[int] = None,
+        progress: Optional[Callable[[VerificationReport], None]] = None
+    ) -> VerificationReport:
+        """
+        Проверить ставки пользователя (user_id=None - всех пользователей).
+        progress вызывается после каждой проверенной пачки.
+        """
+        if user_id is not None:
+            self._running.add(user_id)
+        try:
+            return await self._verify(user_id, progress)
+        finally:
+            self._running.discard(user_id)
+
+    async def _verify(
+        self,
+        user_id: Optional[int],
+        progress: Optional[Callable[[VerificationReport], None]]
+    ) -> VerificationReport:
+        from src.database import async_session_maker
+
+        report = VerificationReport()
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        # Пачек в работе не больше, чем нужно, чтобы занять все процессы
+        max_in_flight = self.workers * 2
+        pending: Set[asyncio.Future] = set()
+
+        def collect(done) -> None:
+            for future in done:
+                checked, mismatches = future.result()
+                report.checked += checked
+                report.mismatch_count += len(mismatches)
+                room = self.MAX_REPORTED - len(report.mismatches)
+                report.mismatches.extend(mismatches[:max(room, 0)])
+            if progress is not None:
+                progress(report)
+
+        query = (
+            select(Bet.id, Bet.user_id, Bet.game_type, Bet.server_seed, Bet.nonce, Bet.result)
+            .where(
+                Bet.server_seed.isnot(None),
+                Bet.status == 'completed',
+                Bet.game_type.in_(VERIFIABLE_GAMES)
+            )
+            .order_by(Bet.user_id, Bet.id)
+            .execution_options(yield_per=self.chunk_size)
+        )
+        if user_id is not None:
+            query = query.where(Bet.user_id == user_id)
+
+        # Ставки идут по пользователям - раскрытые сиды грузим один раз на пользователя
+        revealed_user: Optional[int] = None
+        revealed: Dict[str, RevealedSeed] = {}
+
+        async with async_session_maker() as session:
+            stream = await session.stream(query)
+            async for partition in stream.partitions(self.chunk_size):
+                rows: List[BetRow] = []
+                for bet_id, bet_user_id, game_type, server_seed, nonce, result in partition:
+                    if bet_user_id != revealed_user:
+                        revealed_user = bet_user_id
+                        revealed = await seed_service.get_revealed(bet_user_id)
+                    seed = revealed.get(server_seed)
+                    if seed is None:
+                        report.unrevealed += 1
+                        continue
+                    rows.append((bet_id, game_type, server_seed, seed.client_seed, nonce, result or ''))
+
+                if rows:
+                    pending.add(loop.run_in_executor(pool, verify_rows, rows))
+                if len(pending) >= max_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            collect(done)
+
+        report.seconds = time.perf_counter() - started
+        logger.info(
+            f"🔍 Verification: user={user_id}, checked={report.checked}, "
+            f"mismatches={report.mismatch_count}, unrevealed={report.unrevealed}, {report.seconds:.1f}s"
+        )
+        return report
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+verification_service = VerificationService(settings.VERIFY_WORKERS, settings.VERIFY_CHUNK_SIZE)
@@ -1,6 +1,8 @@
+from typing import Optional
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.models import User, Wallet, Transaction
+from src.services.results import TransferResult, WalletOperation
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,8 +37,8 @@ class WalletService:
         return wallet.balance_cents
     
     @staticmethod
-    async def credit(user_id: int, amount_cents: int, reason: str):
-        """Начислить средства"""
+    async def credit(user_id: int, amount_cents: int, reason: str) -> WalletOperation:
+        """Начислить средства (результат содержит новый баланс)"""
         from src.database import async_session_maker
         
         async with async_session_maker() as session:
@@ -68,11 +70,15 @@ class WalletService:
             
             logger.info(f"💰 Credit: user={user_id}, amount={amount_cents}, reason={reason}")
             
-            return transaction
+            return WalletOperation(
+                transaction=transaction,
+                transaction_id=transaction.id,
+                new_balance_cents=wallet.balance_cents
+            )
     
     @staticmethod
-    async def debit(user_id: int, amount_cents: int, reason: str):
-        """Списать средства"""
+    async def debit(user_id: int, amount_cents: int, reason: str) -> WalletOperation:
+        """Списать средства (результат содержит новый баланс)"""
         from src.database import async_session_maker
         
         async with async_session_maker() as session:
@@ -103,13 +109,84 @@ class WalletService:
             
             logger.info(f"💸 Debit: user={user_id}, amount={amount_cents}, reason={reason}")
             
-            return transaction
+            return WalletOperation(
+                transaction=transaction,
+                transaction_id=transaction.id,
+                new_balance_cents=wallet.balance_cents
+            )
     
     @staticmethod
-    async def add_funds(user_id: int, amount_cents: int, reason: str):
+    async def add_funds(user_id: int, amount_cents: int, reason: str) -> WalletOperation:
         """Добавить средства (алиас для credit)"""
         return await WalletService.credit(user_id, amount_cents, reason)
     
+    @staticmethod
+    async def transfer(
+        from_user_id: int,
+        to_user_id: int,
+        amount_cents: int,
+        reason: str,
+        credit_reason: Optional[str] = None
+    ) -> TransferResult:
+        """
+        Перевести средства между пользователями одной транзакцией.
+
+        Кошельки блокируются (SELECT ... FOR UPDATE) в порядке user_id, поэтому
+        встречные переводы не взаимоблокируются. reason - meta списания,
+        credit_reason - meta зачисления (по умолчанию тот же).
+        """
+        from src.database import async_session_maker
+        
+        if from_user_id == to_user_id:
+            raise ValueError("Cannot transfer to the same wallet")
+        
+        async with async_session_maker() as session:
+            wallets = {}
+            for user_id in sorted((from_user_id, to_user_id)):
+                result = await session.execute(
+                    select(Wallet).where(Wallet.user_id == user_id).with_for_update()
+                )
+                wallets[user_id] = result.scalar_one_or_none()
+            
+            sender = wallets[from_user_id]
+            if not sender or sender.balance_cents < amount_cents:
+                raise ValueError("Insufficient funds")
+            
+            recipient = wallets[to_user_id]
+            if not recipient:
+                recipient = Wallet(user_id=to_user_id, balance_cents=0)
+                session.add(recipient)
+            
+            sender.balance_cents -= amount_cents
+            recipient.balance_cents += amount_cents
+            
+            debit = Transaction(
+                user_id=from_user_id,
+                type='debit',
+                amount_cents=amount_cents,
+                status='completed',
+                meta=reason
+            )
+            credit = Transaction(
+                user_id=to_user_id,
+                type='credit',
+                amount_cents=amount_cents,
+                status='completed',
+                meta=credit_reason or reason
+            )
+            session.add_all([debit, credit])
+            
+            await session.commit()
+            
+            logger.info(f"🔁 Transfer: {from_user_id} -> {to_user_id}, amount={amount_cents}, reason={reason}")
+            
+            return TransferResult(
+                sender_balance_cents=sender.balance_cents,
+                recipient_balance_cents=recipient.balance_cents,
+                debit_transaction_id=debit.id,
+                credit_transaction_id=credit.id
+            )
+    
     @staticmethod
     async def set_balance(user_id: int, new_balance_cents: int):
         """Установить новый баланс пользователя (для админа)"""
@@ -1,11 +1,14 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 from src.redis_db import db
-from src.models_redis import Bet
-from src.services_redis.wallet_service import wallet_service
+from src.models_redis import Bet, Transaction
+from src.services.results import BetSettlement
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Время хранения завершённой ставки
+BET_TTL_SECONDS = 86400  # 24 часа
+
 
 class BetService:
     """Сервис для работы со ставками в Redis"""
@@ -17,10 +20,7 @@ class BetService:
         game_type: str,
         stake_cents: int
     ) -> Bet:
-        """Создать ставку"""
-        # Списываем средства
-        await wallet_service.debit(user_id, stake_cents, f'bet:{game_type}')
-        
+        """Создать ставку (списание и запись ставки - один запрос к Redis)"""
         bet = Bet(
             user_id=user_id,
             chat_id=chat_id,
@@ -28,42 +28,62 @@ class BetService:
             stake_cents=stake_cents,
             status='pending'
         )
+        transaction = Transaction(
+            user_id=user_id,
+            type='debit',
+            amount_cents=stake_cents,
+            status='completed',
+            meta=f'bet:{game_type}'
+        )
+        
+        opened = await db.open_bet(bet.to_dict(), transaction.to_dict())
+        if opened is None:
+            raise ValueError("Insufficient funds")
         
-        bet_id = await db.add_bet(bet.to_dict())
-        bet_dict = bet.to_dict()
-        bet_dict['id'] = bet_id
+        bet.id, new_balance = opened
         
-        logger.info(f"🎰 Bet created: user={user_id}, game={game_type}, stake={stake_cents}")
+        logger.info(f"🎰 Bet created: user={user_id}, game={game_type}, stake={stake_cents}, new_balance={new_balance}")
         
-        return Bet.from_dict(bet_dict)
+        return bet
     
     @staticmethod
-    async def complete_bet(bet_id: str, result: str, payout_cents: int) -> Bet:
-        """Завершить ставку"""
-        # Получаем ставку по ID
-        bet_data = await db.get_expiring_key(bet_id)
-        if not bet_data:
-            raise ValueError(f"Bet {bet_id} not found")
-        
-        bet = Bet.from_dict(bet_data)
-        bet.result = result
-        bet.payout_cents = payout_cents
-        bet.status = 'completed'
-        
-        # Обновляем ставку
-        await db.set_expiring_key(bet_id, bet.to_dict(), 86400)  # TTL 24 часа
+    async def complete_bet(
+        bet_id: str,
+        result: str,
+        payout_cents: int,
+        server_seed: Optional[str] = None,
+        nonce: Optional[int] = None
+    ) -> BetSettlement:
+        """
+        Завершить ставку (результат и начисление выигрыша - один запрос к Redis).
+        Баланс после начисления возвращается скриптом - перечитывать его не нужно.
+        server_seed и nonce - данные provably fair игры для последующей проверки.
+        """
+        # meta транзакции заполняется в скрипте: win:{game_type}:{bet_id}
+        transaction = Transaction(
+            user_id=db.bet_user_id(bet_id),
+            type='credit',
+            amount_cents=payout_cents,
+            status='completed'
+        )
         
-        # Начисляем выигрыш
-        if payout_cents > 0:
-            await wallet_service.credit(
-                bet.user_id,
-                payout_cents,
-                f'win:{bet.game_type}:{bet_id}'
-            )
+        bet_data, new_balance, transaction_id = await db.settle_bet(
+            bet_id,
+            result,
+            payout_cents,
+            transaction.to_dict(),
+            BET_TTL_SECONDS,
+            server_seed=server_seed,
+            nonce=nonce
+        )
         
-        logger.info(f"✅ Bet completed: id={bet_id}, payout={payout_cents}")
+        logger.info(f"✅ Bet completed: id={bet_id}, payout={payout_cents}, new_balance={new_balance}")
         
-        return bet
+        return BetSettlement(
+            bet=Bet.from_dict(bet_data),
+            new_balance_cents=new_balance,
+            transaction_id=transaction_id
+        )
     
     @staticmethod
     async def get_user_stats(user_id: int) -> Dict:
@@ -1,6 +1,7 @@
 from typing import Optional
 from src.redis_db import db
 from src.models_redis import Wallet, Transaction
+from src.services.results import TransferResult, WalletOperation
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,8 +28,8 @@ class WalletService:
         return await db.get_balance(user_id)
     
     @staticmethod
-    async def credit(user_id: int, amount_cents: int, reason: str) -> Transaction:
-        """Начислить средства"""
+    async def credit(user_id: int, amount_cents: int, reason: str) -> WalletOperation:
+        """Начислить средства (результат содержит новый баланс из HINCRBY)"""
         # Увеличиваем баланс
         new_balance = await db.increment_balance(user_id, amount_cents)
         
@@ -41,24 +42,19 @@ class WalletService:
             meta=reason
         )
         
-        await db.add_transaction(transaction.to_dict())
+        transaction_id = await db.add_transaction(transaction.to_dict())
         
         logger.info(f"💰 Credit: user={user_id}, amount={amount_cents}, reason={reason}, new_balance={new_balance}")
         
-        return transaction
+        return WalletOperation(
+            transaction=transaction,
+            transaction_id=transaction_id,
+            new_balance_cents=new_balance
+        )
     
     @staticmethod
-    async def debit(user_id: int, amount_cents: int, reason: str) -> Transaction:
-        """Списать средства"""
-        current_balance = await db.get_balance(user_id)
-        
-        if current_balance < amount_cents:
-            raise ValueError("Insufficient funds")
-        
-        # Уменьшаем баланс
-        new_balance = await db.decrement_balance(user_id, amount_cents)
-        
-        # Создаём транзакцию
+    async def debit(user_id: int, amount_cents: int, reason: str) -> WalletOperation:
+        """Списать средства (результат содержит новый баланс)"""
         transaction = Transaction(
             user_id=user_id,
             type='debit',
@@ -67,17 +63,71 @@ class WalletService:
             meta=reason
         )
         
-        await db.add_transaction(transaction.to_dict())
+        # Проверка баланса, списание и запись транзакции - одним Lua скриптом
+        result = await db.debit_balance(user_id, amount_cents, transaction.to_dict())
+        if result is None:
+            raise ValueError("Insufficient funds")
+        
+        new_balance, transaction_id = result
         
         logger.info(f"💸 Debit: user={user_id}, amount={amount_cents}, reason={reason}, new_balance={new_balance}")
         
-        return transaction
+        return WalletOperation(
+            transaction=transaction,
+            transaction_id=transaction_id,
+            new_balance_cents=new_balance
+        )
     
     @staticmethod
-    async def add_funds(user_id: int, amount_cents: int, reason: str) -> Transaction:
+    async def add_funds(user_id: int, amount_cents: int, reason: str) -> WalletOperation:
         """Добавить средства (алиас для credit)"""
         return await WalletService.credit(user_id, amount_cents, reason)
     
+    @staticmethod
+    async def transfer(
+        from_user_id: int,
+        to_user_id: int,
+        amount_cents: int,
+        reason: str,
+        credit_reason: Optional[str] = None
+    ) -> TransferResult:
+        """
+        Перевести средства между пользователями (один Lua скрипт: списание,
+        зачисление и обе транзакции). credit_reason - meta зачисления.
+        """
+        if from_user_id == to_user_id:
+            raise ValueError("Cannot transfer to the same wallet")
+        
+        debit = Transaction(
+            user_id=from_user_id,
+            type='debit',
+            amount_cents=amount_cents,
+            status='completed',
+            meta=reason
+        )
+        credit = Transaction(
+            user_id=to_user_id,
+            type='credit',
+            amount_cents=amount_cents,
+            status='completed',
+            meta=credit_reason or reason
+        )
+        
+        result = await db.transfer_balance(from_user_id, to_user_id, amount_cents, debit.to_dict(), credit.to_dict())
+        if result is None:
+            raise ValueError("Insufficient funds")
+        
+        sender_balance, recipient_balance, debit_id, credit_id = result
+        
+        logger.info(f"🔁 Transfer: {from_user_id} -> {to_user_id}, amount={amount_cents}, reason={reason}")
+        
+        return TransferResult(
+            sender_balance_cents=sender_balance,
+            recipient_balance_cents=recipient_balance,
+            debit_transaction_id=debit_id,
+            credit_transaction_id=credit_id
+        )
+    
     @staticmethod
     async def set_balance(user_id: int, new_balance_cents: int):
         """Установить новый баланс пользователя (для админа)"""
@@ -1,6 +1,5 @@
 from aiogram.types import Message
-from sqlalchemy import select
-from src.models import User
+from src.services.user_cache import user_cache
 
 
 async def check_if_banned(message: Message) -> bool:
@@ -8,26 +7,18 @@ async def check_if_banned(message: Message) -> bool:
     Проверяет, заблокирован ли пользователь.
     Возвращает True, если пользователь заблокирован, иначе False.
     """
-    from src.database import async_session_maker
+    user = await user_cache.get(message.from_user.id)
     
-    telegram_id = message.from_user.id
+    if not user:
+        return False
     
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+    if user.is_banned:
+        await message.answer(
+            "🚫 <b>Вы заблокированы в нашей системе</b>\n\n"
+            "Доступ к боту ограничен.\n"
+            "Обратитесь к администратору для получения дополнительной информации."
         )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            return False
-        
-        if user.is_banned:
-            await message.answer(
-                "🚫 <b>Вы заблокированы в нашей системе</b>\n\n"
-                "Доступ к боту ограничен.\n"
-                "Обратитесь к администратору для получения дополнительной информации."
-            )
-            return True
+        return True
     
     return False
 
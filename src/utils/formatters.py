@@ -1,3 +1,8 @@
+def format_money(cents: int) -> str:
+    """Форматирует сумму в центах в строку вида '1,234.56' (в долларах)"""
+    return f"{cents / 100:,.2f}"
+
+
 def format_currency(amount_cents: int) -> str:
     """Форматирование валюты"""
     return f"${amount_cents / 100:.2f}"
@@ -0,0 +1,170 @@
+"""
+Неблокирующий приём webhook: ответ Telegram сразу, обработка из ограниченной очереди
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from src.utils.metrics import LatencyHistogram
+from src.webhook_workers import shard_key
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Бот сейчас перегружен, повторите через несколько секунд"
+
+
+class QueuedUpdateHandler:
+    """
+    Webhook-обработчик с очередью.
+
+    Апдейт кладётся в asyncio.Queue ограниченного размера, и Telegram сразу
+    получает 200: долгие игры (кости, ракетка) больше не держат HTTP-запрос.
+    Очередь разбирает пул из workers задач. Апдейты с одним ключом
+    шардирования (shard_key: пользователь, в группах - чат) выполняются
+    строго по очереди: пока один worker занят ключом, следующие апдейты
+    этого ключа он же и дообрабатывает, иначе шаги FSM (ставка, клики
+    в минах, кэшаут ракетки) гонялись бы друг с другом. Если очередь
+    полна, апдейт отбрасывается, а пользователю (не чаще раза в busy_cooldown секунд
+    на чат) отвечаем, что бот занят.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        max_queue_size: int = 1000,
+        workers: int = 50,
+        busy_cooldown: float = 10.0
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = workers
+        self.busy_cooldown = busy_cooldown
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._busy_replied: Dict[int, float] = {}
+        self._background: Set[asyncio.Task] = set()
+        # Ключи, которые сейчас обрабатываются, и апдейты, ждущие за ними
+        self._active: Dict[int, Deque[Tuple[float, Update]]] = {}
+
+        # Метрики
+        self.queue_wait = LatencyHistogram()
+        self.handle_time = LatencyHistogram()
+        self.accepted = 0
+        self.shed = 0
+        self.failed = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        update = Update.model_validate(data, context={'bot': self.bot})
+        try:
+            self._queue.put_nowait((time.monotonic(), shard_key(data), update))
+            self.accepted += 1
+        except asyncio.QueueFull:
+            self.shed += 1
+            task = asyncio.create_task(self._reply_busy(update))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        # Всегда 200: иначе Telegram повторит апдейт и нагрузка только вырастет
+        return web.Response()
+
+    async def _reply_busy(self, update: Update) -> None:
+        """Сообщить пользователю, что апдейт не обработан"""
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(BUSY_TEXT, show_alert=False)
+                return
+
+            if not update.message:
+                return
+            chat_id = update.message.chat.id
+            now = time.monotonic()
+            if now - self._busy_replied.get(chat_id, 0.0) < self.busy_cooldown:
+                return
+            self._busy_replied[chat_id] = now
+            if len(self._busy_replied) > 10000:
+                self._busy_replied.clear()
+            await self.bot.send_message(chat_id, BUSY_TEXT)
+        except Exception as e:
+            logger.warning(f"⚠️ Busy reply failed: {e}")
+
+    async def _process(self, enqueued_at: float, update: Update) -> None:
+        started_at = time.monotonic()
+        self.queue_wait.observe(started_at - enqueued_at)
+        try:
+            await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"❌ Update {update.update_id} failed: {e}")
+        finally:
+            self.handle_time.observe(time.monotonic() - started_at)
+            self._queue.task_done()
+
+    async def _worker(self) -> None:
+        while True:
+            enqueued_at, key, update = await self._queue.get()
+            backlog = self._active.get(key)
+            if backlog is not None:
+                # Ключ уже занят другим worker'ом - он обработает апдейт следом
+                backlog.append((enqueued_at, update))
+                continue
+
+            backlog = self._active[key] = deque()
+            try:
+                await self._process(enqueued_at, update)
+                while backlog:
+                    await self._process(*backlog.popleft())
+            finally:
+                del self._active[key]
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            logger.info(f"✅ Update queue started: workers={self.workers}, size={self._queue.maxsize}")
+
+    async def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """Дообработать очередь и остановить пул"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Update queue stopped with {self._queue.qsize()} pending updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_size': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'workers': self.workers,
+            'active_keys': len(self._active),
+            'accepted': self.accepted,
+            'shed': self.shed,
+            'failed': self.failed,
+            'queue_wait': self.queue_wait.snapshot(),
+            'handle_time': self.handle_time.snapshot(),
+        }
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def register(self, app: web.Application, path: str) -> None:
+        app.router.add_post(path, self.handle)
+        app.router.add_get(f"{path}/metrics", self.handle_metrics)
+
+        async def on_startup(_app: web.Application):
+            self.start()
+
+        async def on_shutdown(_app: web.Application):
+            await self.stop()
+
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
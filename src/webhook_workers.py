@@ -0,0 +1,226 @@
+"""
+Многопроцессный режим webhook: приём апдейтов и обработка в воркерах через Redis streams
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from src.redis_db import db
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = "webhook:updates"
+CONSUMER_GROUP = "workers"
+STREAM_MAXLEN = 100000
+
+
+def stream_key(worker_index: int) -> str:
+    """Stream апдейтов одного воркера"""
+    return f"{STREAM_PREFIX}:{worker_index}"
+
+
+def shard_key(update: Dict[str, Any]) -> int:
+    """
+    Ключ шардирования апдейта.
+
+    Обычно это from_user.id, так что апдейты одного пользователя
+    обрабатываются строго по порядку. Апдейты из групп шардируются по чату:
+    общий раунд ракетки живёт в памяти одного воркера, и ставки и кэшауты
+    всех игроков чата должны попадать в него. В личке chat.id == user.id.
+    """
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat') or {}
+        if chat.get('type') in ('group', 'supergroup'):
+            return chat['id']
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender['id']
+        if chat:
+            return chat['id']
+    return update.get('update_id', 0)
+
+
+class UpdateRouter:
+    """Приём апдейтов в процессе ingress: ответ Telegram сразу, обработка в воркерах"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.enqueued = [0] * workers
+
+    def worker_for(self, update: Dict[str, Any]) -> int:
+        return shard_key(update) % self.workers
+
+    async def handle(self, request: web.Request) -> web.Response:
+        update = await request.json()
+        index = self.worker_for(update)
+        await db.client.xadd(
+            stream_key(index),
+            {'update': json.dumps(update, separators=(',', ':'))},
+            maxlen=STREAM_MAXLEN,
+            approximate=True
+        )
+        self.enqueued[index] += 1
+        return web.Response()
+
+    async def metrics(self) -> List[Dict[str, Any]]:
+        """Глубина очереди каждого воркера"""
+        async with db.client.pipeline(transaction=False) as pipe:
+            for index in range(self.workers):
+                pipe.xlen(stream_key(index))
+                pipe.xpending(stream_key(index), CONSUMER_GROUP)
+            results = await pipe.execute(raise_on_error=False)
+
+        metrics = []
+        for index in range(self.workers):
+            length, pending = results[index * 2], results[index * 2 + 1]
+            metrics.append({
+                'worker': index,
+                'enqueued': self.enqueued[index],
+                'queued': length if isinstance(length, int) else None,
+                'in_progress': pending.get('pending') if isinstance(pending, dict) else None,
+            })
+        return metrics
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.json_response({'workers': await self.metrics()})
+
+    def register(self, app: web.Application, path: str) -> None:
+        app.router.add_post(path, self.handle)
+        app.router.add_get(f"{path}/metrics", self.handle_metrics)
+
+
+class StreamWorker:
+    """
+    Воркер: читает свой stream и скармливает апдейты диспетчеру.
+
+    Апдейты с одним ключом шардирования выполняются по очереди,
+    с разными - параллельно (до max_concurrency одновременно).
+    Запись удаляется из stream только после обработки, поэтому после
+    падения воркер заново получает необработанные апдейты.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        index: int,
+        batch_size: int = 100,
+        max_concurrency: int = 100
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.index = index
+        self.stream = stream_key(index)
+        self.consumer = f"worker-{index}"
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tails: Dict[int, asyncio.Task] = {}
+        self._running = False
+
+        # Счётчики
+        self.processed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    async def _ensure_group(self) -> None:
+        try:
+            await db.client.xgroup_create(self.stream, CONSUMER_GROUP, id='0', mkstream=True)
+        except Exception as e:
+            # BUSYGROUP: группа уже создана
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _process(self, entry_id: str, raw: str, previous: Optional[asyncio.Task]) -> None:
+        # Порядок апдейтов одного ключа: ждём предыдущий
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+
+        async with self._semaphore:
+            try:
+                update = Update.model_validate(json.loads(raw), context={'bot': self.bot})
+                await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Worker {self.index}: update {entry_id} failed: {e}")
+
+        async with db.client.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, CONSUMER_GROUP, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    def _dispatch(self, entry_id: str, fields: Dict[str, str]) -> None:
+        raw = fields['update']
+        key = shard_key(json.loads(raw))
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._process(entry_id, raw, previous))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._release(key, done))
+
+    def _release(self, key: int, task: asyncio.Task) -> None:
+        # Ключ забываем, только если за это время не пришёл следующий апдейт
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def run(self) -> None:
+        await self._ensure_group()
+        self._running = True
+        logger.info(f"✅ Worker {self.index} consuming {self.stream}")
+
+        # Сначала апдейты, взятые до рестарта, но не обработанные
+        last_id = '0'
+        while self._running:
+            # Не берём новые апдейты, пока воркер перегружен: пусть копятся в stream
+            if len(self._tails) >= self.batch_size * 10:
+                await asyncio.sleep(0.05)
+                continue
+
+            try:
+                response = await db.client.xreadgroup(
+                    CONSUMER_GROUP,
+                    self.consumer,
+                    {self.stream: last_id},
+                    count=self.batch_size,
+                    block=5000
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Worker {self.index}: read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            entries = response[0][1] if response else []
+            if last_id == '0' and not entries:
+                # Хвост после рестарта разобран, дальше только новые
+                last_id = '>'
+                continue
+
+            for entry_id, fields in entries:
+                self._dispatch(entry_id, fields)
+
+            if last_id == '0' and entries:
+                # Ждём разбора хвоста, чтобы не получить его повторно
+                await asyncio.gather(*list(self._tails.values()), return_exceptions=True)
+
+    async def stop(self) -> None:
+        self._running = False
+        if self._tails:
+            await asyncio.gather(*list(self._tails.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'worker': self.index,
+            'processed': self.processed,
+            'failed': self.failed,
+            'in_flight': len(self._tails),
+        }